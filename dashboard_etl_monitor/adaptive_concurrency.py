@@ -0,0 +1,165 @@
+"""
+Limitador de concurrencia adaptativo (AIMD) para las queries a BigQuery.
+
+- Aumento aditivo: cada respuesta cuya latencia no supera LATENCY_TOLERANCE
+  veces la latencia base suma 1/ventana (≈ +1 por ventana completada).
+- Disminución multiplicativa: un error de cuota (429 / 403 rateLimitExceeded
+  / quotaExceeded) reduce la ventana a la mitad y la tarea se reintenta con
+  backoff exponencial con jitter completo.
+- Límite por proyecto: nunca más de `per_project_limit` tareas simultáneas
+  contra el mismo proyecto, sin importar el tamaño de la ventana.
+
+El ThreadPoolExecutor se dimensiona al techo (`max_window`) y cada tarea
+pasa por run(), que bloquea hasta que la ventana y el proyecto tengan cupo.
+"""
+
+import random
+import threading
+import time
+
+from google.api_core.exceptions import Forbidden, TooManyRequests
+
+DEFAULT_INITIAL_WINDOW = 4
+DEFAULT_MIN_WINDOW = 1
+DEFAULT_MAX_WINDOW = 32
+DEFAULT_PER_PROJECT_LIMIT = 2
+
+# Reintentos ante errores de cuota y backoff (segundos) con jitter completo
+DEFAULT_MAX_RETRIES = 4
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_CAP_SECONDS = 8.0
+
+# La ventana solo crece si la latencia se mantiene por debajo de este múltiplo de la base
+LATENCY_TOLERANCE = 1.5
+
+# Peso de cada muestra en la latencia base (media móvil exponencial)
+BASELINE_ALPHA = 0.1
+
+QUOTA_ERROR_REASONS = ("ratelimitexceeded", "quotaexceeded", "quota exceeded", "rate limit")
+
+
+def is_quota_error(error):
+    """
+    Indica si una excepción de BigQuery es un límite de tasa/cuota (reintentable).
+    Un 403 por permisos NO es de cuota.
+    """
+    if isinstance(error, TooManyRequests):
+        return True
+    if isinstance(error, Forbidden):
+        message = str(error).lower()
+        return any(reason in message for reason in QUOTA_ERROR_REASONS)
+    return False
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Ventana de concurrencia AIMD compartida por todas las tareas, con límite por proyecto.
+    """
+
+    def __init__(self, initial_window=DEFAULT_INITIAL_WINDOW, min_window=DEFAULT_MIN_WINDOW,
+                 max_window=DEFAULT_MAX_WINDOW, per_project_limit=DEFAULT_PER_PROJECT_LIMIT,
+                 max_retries=DEFAULT_MAX_RETRIES):
+        """
+        Args:
+            initial_window: Tareas simultáneas al inicio
+            min_window: Piso de la ventana
+            max_window: Techo de la ventana (dimensionar el executor a este valor)
+            per_project_limit: Máximo de tareas simultáneas por proyecto
+            max_retries: Reintentos por tarea ante errores de cuota
+        """
+        self.min_window = min_window
+        self.max_window = max_window
+        self.per_project_limit = per_project_limit
+        self.max_retries = max_retries
+        self._window = float(max(min_window, min(initial_window, max_window)))
+        self._baseline = None
+        self._in_flight = 0
+        self._in_flight_by_project = {}
+        self._condition = threading.Condition()
+        self._stats = {
+            'completed': 0,
+            'throttled': 0,
+            'retries': 0,
+            'exhausted': 0,
+            'peak_window': int(self._window),
+        }
+
+    @property
+    def window(self):
+        """Tamaño actual de la ventana (entero)."""
+        with self._condition:
+            return int(self._window)
+
+    def _acquire(self, project_id):
+        with self._condition:
+            while (self._in_flight >= int(self._window)
+                   or self._in_flight_by_project.get(project_id, 0) >= self.per_project_limit):
+                self._condition.wait()
+            self._in_flight += 1
+            self._in_flight_by_project[project_id] = self._in_flight_by_project.get(project_id, 0) + 1
+
+    def _release(self, project_id, latency=None, throttled=False):
+        with self._condition:
+            self._in_flight -= 1
+            self._in_flight_by_project[project_id] -= 1
+            if throttled:
+                self._window = max(self.min_window, self._window / 2)
+                self._stats['throttled'] += 1
+            elif latency is not None:
+                self._stats['completed'] += 1
+                if self._baseline is None:
+                    self._baseline = latency
+                if latency <= self._baseline * LATENCY_TOLERANCE:
+                    self._window = min(self.max_window, self._window + 1 / self._window)
+                self._baseline += BASELINE_ALPHA * (latency - self._baseline)
+                self._stats['peak_window'] = max(self._stats['peak_window'], int(self._window))
+            self._condition.notify_all()
+
+    def run(self, project_id, fn):
+        """
+        Ejecuta fn() respetando la ventana y el límite del proyecto.
+
+        Los errores de cuota se reintentan (máximo max_retries) con backoff
+        exponencial con jitter; cualquier otro error se propaga sin reintento.
+
+        Args:
+            project_id: Proyecto contra el que consulta la tarea
+            fn: Función sin argumentos
+
+        Retorna:
+            El resultado de fn()
+        """
+        attempt = 0
+        while True:
+            self._acquire(project_id)
+            started = time.perf_counter()
+            try:
+                result = fn()
+            except Exception as e:
+                if not is_quota_error(e):
+                    self._release(project_id)
+                    raise
+                self._release(project_id, throttled=True)
+                if attempt >= self.max_retries:
+                    with self._condition:
+                        self._stats['exhausted'] += 1
+                    raise
+                with self._condition:
+                    self._stats['retries'] += 1
+                time.sleep(random.uniform(0, min(BACKOFF_CAP_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)))
+                attempt += 1
+                continue
+            self._release(project_id, latency=time.perf_counter() - started)
+            return result
+
+    def stats(self):
+        """
+        Retorna:
+            dict con window, peak_window, baseline_latency, completed, throttled, retries, exhausted
+        """
+        with self._condition:
+            return dict(
+                self._stats,
+                window=int(self._window),
+                baseline_latency=self._baseline,
+            )
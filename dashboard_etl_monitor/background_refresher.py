@@ -0,0 +1,178 @@
+"""
+Refresco en segundo plano (stale-while-revalidate) de los datasets del dashboard.
+
+Cada dataset se registra con una clave, un loader y su TTL. La primera
+lectura carga de forma síncrona (normalmente desde el caché persistente);
+a partir de ahí get() siempre devuelve el último valor bueno al instante y
+un hilo daemon lo vuelve a cargar antes de que venza (al `refresh_ahead`
+del TTL). Si un refresco falla se conserva el valor anterior y se registra
+el error. Los datasets que nadie lee durante IDLE_TTLS_BEFORE_DROP TTLs
+(ej. un snapshot de un conjunto de compañías que ya no existe) se descartan.
+
+El loader recibe `refresh` (bool): True indica que debe ignorar el caché
+persistente e ir a BigQuery.
+"""
+
+import logging
+import threading
+import time
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Cada cuántos segundos revisa el hilo si hay datasets por refrescar
+DEFAULT_CHECK_INTERVAL_SECONDS = 15
+
+# Fracción del TTL a partir de la cual se refresca un dataset
+DEFAULT_REFRESH_AHEAD = 0.8
+
+# Un dataset que nadie lee durante este número de TTLs deja de refrescarse
+IDLE_TTLS_BEFORE_DROP = 3
+
+
+def value_timestamp(value):
+    """
+    Momento en que se obtuvo un valor: df.attrs['cached_at'] si viene del caché
+    persistente, si no ahora.
+    """
+    attrs = getattr(value, 'attrs', None) or {}
+    cached_at = attrs.get('cached_at')
+    return cached_at if cached_at is not None else pd.Timestamp.now(tz='UTC')
+
+
+class BackgroundRefresher:
+    """
+    Registro de datasets con refresco anticipado en un hilo daemon (uno por proceso).
+    """
+
+    def __init__(self, check_interval_seconds=DEFAULT_CHECK_INTERVAL_SECONDS, refresh_ahead=DEFAULT_REFRESH_AHEAD):
+        """
+        Args:
+            check_interval_seconds: Intervalo de revisión del hilo
+            refresh_ahead: Fracción del TTL a partir de la cual se refresca (0-1)
+        """
+        self.check_interval_seconds = check_interval_seconds
+        self.refresh_ahead = refresh_ahead
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def get(self, key, loader, ttl, label=None):
+        """
+        Obtiene el último valor bueno de un dataset (carga síncrona solo la primera vez).
+
+        Args:
+            key: Clave única del dataset (incluye sus parámetros)
+            loader: Función loader(refresh) que retorna el valor; debe lanzar excepción si falla
+            ttl: Vigencia en segundos
+            label: Nombre legible para el indicador de antigüedad
+
+        Retorna:
+            tuple (valor, fetched_at)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                # El loader más reciente captura los parámetros actuales
+                entry['loader'] = loader
+                entry['ttl'] = ttl
+                entry['last_access'] = time.monotonic()
+                return entry['value'], entry['fetched_at']
+
+        value = loader(False)
+        fetched_at = value_timestamp(value)
+        with self._lock:
+            self._entries[key] = {
+                'label': label or key,
+                'loader': loader,
+                'ttl': ttl,
+                'value': value,
+                'fetched_at': fetched_at,
+                'error': None,
+                'refreshing': False,
+                'last_access': time.monotonic(),
+            }
+        self._ensure_thread()
+        return value, fetched_at
+
+    def status(self):
+        """
+        Retorna:
+            Lista de dicts {label, fetched_at, age_seconds, ttl, error} por dataset
+        """
+        now = pd.Timestamp.now(tz='UTC')
+        with self._lock:
+            return [
+                {
+                    'label': entry['label'],
+                    'fetched_at': entry['fetched_at'],
+                    'age_seconds': (now - entry['fetched_at']).total_seconds(),
+                    'ttl': entry['ttl'],
+                    'error': entry['error'],
+                }
+                for entry in self._entries.values()
+            ]
+
+    def stop(self):
+        """Detiene el hilo de refresco."""
+        self._stop.set()
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="data-refresher", daemon=True)
+                self._thread.start()
+
+    def _due_keys(self):
+        """Claves cuya antigüedad ya superó refresh_ahead × TTL (marcándolas como en refresco)."""
+        now = pd.Timestamp.now(tz='UTC')
+        idle_now = time.monotonic()
+        due = []
+        with self._lock:
+            for key in [key for key, entry in self._entries.items()
+                        if idle_now - entry['last_access'] > entry['ttl'] * IDLE_TTLS_BEFORE_DROP]:
+                del self._entries[key]
+            for key, entry in self._entries.items():
+                age = (now - entry['fetched_at']).total_seconds()
+                if not entry['refreshing'] and age >= entry['ttl'] * self.refresh_ahead:
+                    entry['refreshing'] = True
+                    due.append(key)
+        return due
+
+    def _refresh(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            loader = entry['loader']
+        started = time.perf_counter()
+        try:
+            value = loader(True)
+        except Exception as e:
+            logger.warning(f"⚠️ Refresco de {entry['label']} falló, se conserva el valor anterior: {type(e).__name__} - {str(e)}")
+            with self._lock:
+                entry['error'] = f"{type(e).__name__} - {str(e)}"
+                entry['refreshing'] = False
+            return
+        with self._lock:
+            entry['value'] = value
+            entry['fetched_at'] = value_timestamp(value)
+            entry['error'] = None
+            entry['refreshing'] = False
+        logger.info(f"🔄 {entry['label']} refrescado en {time.perf_counter() - started:.1f}s")
+
+    def _run(self):
+        while not self._stop.wait(self.check_interval_seconds):
+            for key in self._due_keys():
+                self._refresh(key)
+
+
+def format_age(seconds):
+    """Antigüedad legible: '45 s', '12 min', '3.5 h'."""
+    if seconds < 60:
+        return f"{int(seconds)} s"
+    if seconds < 3600:
+        return f"{int(seconds // 60)} min"
+    return f"{seconds / 3600:.1f} h"
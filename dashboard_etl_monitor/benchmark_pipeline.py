@@ -0,0 +1,312 @@
+"""
+Benchmark del pipeline de datos del dashboard a escala de flota.
+
+Genera snapshots sintéticos (N compañías × M endpoints, con la forma del
+resultado de BigQuery) y mide por separado cada etapa del camino de render de
+get_snapshot_matrix, con el mismo código que usa el dashboard:
+
+1. download:    Arrow → DataFrame compacto (bq_fetch.arrow_to_dataframe + SNAPSHOT_DTYPES)
+2. cache_write: escritura en el caché persistente (result_cache.ParquetCacheBackend)
+3. cache_read:  lectura del caché persistente (camino normal de get_snapshot_matrix)
+4. pivot:       matrix_pipeline.pivot_snapshot
+5. format:      matrix_pipeline.format_matrix
+6. stats:       matrix_pipeline.matrix_stats
+
+Cada tamaño se ejecuta `--repeats` veces (tiempos min/mediana/media) y una vez
+más con tracemalloc para el pico de memoria por etapa (asignaciones de Python,
+NumPy y pandas; los buffers de Arrow se reportan aparte). Los resultados se
+escriben en JSON; con `--baseline` se comparan contra una corrida anterior y se
+reportan las etapas más lentas que la tolerancia.
+
+Uso:
+    python benchmark_pipeline.py                                  # 50, 500 y 5000 compañías × 40 endpoints
+    python benchmark_pipeline.py --sizes 50,500 --repeats 5 --output bench.json
+    python benchmark_pipeline.py --baseline bench_main.json --fail-on-regression
+"""
+
+import argparse
+import json
+import logging
+import platform
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from bq_fetch import arrow_to_dataframe
+from matrix_pipeline import format_matrix, matrix_stats, pivot_snapshot, SNAPSHOT_DTYPES
+from result_cache import ParquetCacheBackend
+
+DEFAULT_SIZES = [50, 500, 5000]
+DEFAULT_ENDPOINTS = 40
+DEFAULT_REPEATS = 3
+DEFAULT_OUTPUT = "benchmark_results.json"
+
+# Una etapa es regresión si su mediana supera la del baseline en más de este factor
+DEFAULT_TOLERANCE = 0.20
+
+STAGES = ["download", "cache_write", "cache_read", "pivot", "format", "stats"]
+
+# Fracción de celdas sin sincronizar (max_sync nulo) y sin corrida anterior (last_* nulos)
+MISSING_SYNC_RATE = 0.03
+MISSING_LAST_RATE = 0.10
+
+STATUSES = ["SUCCESS", "FAILED", "PARTIAL", None]
+STATUS_WEIGHTS = [0.85, 0.05, 0.05, 0.05]
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# ========== DATOS SINTÉTICOS ==========
+
+def build_synthetic_inputs(num_companies, num_endpoints=DEFAULT_ENDPOINTS, seed=0, now=None):
+    """
+    Genera las entradas del pipeline para una flota sintética.
+
+    Args:
+        num_companies: Número de compañías
+        num_endpoints: Endpoints por compañía
+        seed: Semilla
+        now: Momento de referencia (default: ahora)
+
+    Retorna:
+        tuple (snapshot_arrow, companies_df, tables_list):
+            - snapshot_arrow: pyarrow.Table con la forma del resultado del snapshot en BigQuery
+            - companies_df: DataFrame con company_id y company_name
+            - tables_list: Endpoints de metadata
+    """
+    rng = np.random.default_rng(seed)
+    now = pd.Timestamp(now) if now is not None else pd.Timestamp.now(tz='UTC')
+    now = now.tz_localize('UTC') if now.tzinfo is None else now.tz_convert('UTC')
+    company_ids = np.arange(1000, 1000 + num_companies)
+    tables_list = [f"endpoint_{index:02d}" for index in range(num_endpoints)]
+    cells = num_companies * num_endpoints
+
+    ages_minutes = rng.integers(5, 72 * 60, cells)
+    max_sync = (now.tz_localize(None) - pd.to_timedelta(ages_minutes, unit='m')).to_numpy().astype('datetime64[us]')
+    missing_sync = rng.random(cells) < MISSING_SYNC_RATE
+    missing_last = rng.random(cells) < MISSING_LAST_RATE
+
+    snapshot_arrow = pa.table({
+        'company_id': pa.array(np.repeat(company_ids, num_endpoints).astype(str)),
+        'endpoint_name': pa.array(np.tile(tables_list, num_companies)),
+        'max_sync': pa.array(max_sync, type=pa.timestamp('us', tz='UTC'), mask=missing_sync),
+        'actual_rows': pa.array(rng.integers(0, 50_000, cells), mask=missing_sync),
+        'actual_duration': pa.array(rng.uniform(1, 600, cells).round(1), mask=missing_sync),
+        'actual_status': pa.array(np.array(STATUSES, dtype=object)[rng.choice(len(STATUSES), cells, p=STATUS_WEIGHTS)]),
+        'last_rows': pa.array(rng.integers(0, 50_000, cells), mask=missing_last),
+        'last_duration': pa.array(rng.uniform(1, 600, cells).round(1), mask=missing_last),
+    })
+    companies_df = pd.DataFrame({
+        'company_id': company_ids,
+        'company_name': [f"Company {company_id}" for company_id in company_ids],
+    })
+    return snapshot_arrow, companies_df, tables_list
+
+
+# ========== EJECUCIÓN ==========
+
+def run_pipeline(snapshot_arrow, companies_df, tables_list, cache, now, on_stage):
+    """
+    Ejecuta las etapas en orden; on_stage(nombre, función) ejecuta y mide cada una.
+
+    Retorna:
+        dict de estadísticas de la matriz (salida de la última etapa)
+    """
+    key = f"benchmark:{len(companies_df)}x{len(tables_list)}"
+    snapshot_df = on_stage("download", lambda: arrow_to_dataframe(snapshot_arrow, **SNAPSHOT_DTYPES))
+    on_stage("cache_write", lambda: cache.set(key, snapshot_df, 900))
+    cached_df = on_stage("cache_read", lambda: cache.get(key, 900))
+    matrix = on_stage("pivot", lambda: pivot_snapshot(cached_df, companies_df, tables_list))
+    on_stage("format", lambda: format_matrix(matrix, now=now))
+    return on_stage("stats", lambda: matrix_stats(matrix, total_cells=len(tables_list) * len(companies_df), now=now))
+
+
+def benchmark_size(num_companies, num_endpoints=DEFAULT_ENDPOINTS, repeats=DEFAULT_REPEATS, seed=0):
+    """
+    Mide cada etapa para un tamaño de flota.
+
+    Retorna:
+        dict: {
+            'companies', 'endpoints', 'cells', 'snapshot_arrow_bytes',
+            'stages': {etapa: {'seconds_min', 'seconds_median', 'seconds_mean',
+                               'peak_python_bytes', 'arrow_bytes_delta'}},
+            'total_seconds_median': float,
+            'matrix_stats': dict
+        }
+    """
+    now = pd.Timestamp.now(tz='UTC')
+    snapshot_arrow, companies_df, tables_list = build_synthetic_inputs(num_companies, num_endpoints, seed, now)
+    timings = {stage: [] for stage in STAGES}
+    memory = {}
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = ParquetCacheBackend(cache_dir=cache_dir, max_bytes=1024 ** 4)
+
+        def _timed(stage, fn):
+            started = time.perf_counter()
+            result = fn()
+            timings[stage].append(time.perf_counter() - started)
+            return result
+
+        for _ in range(repeats):
+            stats = run_pipeline(snapshot_arrow, companies_df, tables_list, cache, now, _timed)
+
+        def _traced(stage, fn):
+            arrow_before = pa.total_allocated_bytes()
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+            result = fn()
+            _, peak = tracemalloc.get_traced_memory()
+            memory[stage] = {
+                'peak_python_bytes': max(peak - baseline, 0),
+                'arrow_bytes_delta': pa.total_allocated_bytes() - arrow_before,
+            }
+            return result
+
+        # Pasada aparte con tracemalloc: su overhead no contamina los tiempos
+        tracemalloc.start()
+        try:
+            run_pipeline(snapshot_arrow, companies_df, tables_list, cache, now, _traced)
+        finally:
+            tracemalloc.stop()
+
+    stages = {
+        stage: {
+            'seconds_min': min(timings[stage]),
+            'seconds_median': statistics.median(timings[stage]),
+            'seconds_mean': statistics.fmean(timings[stage]),
+            **memory[stage],
+        }
+        for stage in STAGES
+    }
+    return {
+        'companies': num_companies,
+        'endpoints': num_endpoints,
+        'cells': num_companies * num_endpoints,
+        'snapshot_arrow_bytes': snapshot_arrow.nbytes,
+        'stages': stages,
+        'total_seconds_median': sum(stage['seconds_median'] for stage in stages.values()),
+        'matrix_stats': {key: value for key, value in stats.items() if key != 'staleness'},
+    }
+
+
+def compare_to_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compara medianas por tamaño y etapa contra un resultado anterior.
+
+    Retorna:
+        Lista de dicts {'companies', 'stage', 'baseline_seconds', 'seconds', 'ratio'} de las regresiones
+    """
+    previous = {(run['companies'], run['endpoints']): run for run in baseline.get('runs', [])}
+    regressions = []
+    for run in results['runs']:
+        before = previous.get((run['companies'], run['endpoints']))
+        if before is None:
+            continue
+        for stage, measured in run['stages'].items():
+            baseline_seconds = before['stages'].get(stage, {}).get('seconds_median')
+            if not baseline_seconds:
+                continue
+            ratio = measured['seconds_median'] / baseline_seconds
+            if ratio > 1 + tolerance:
+                regressions.append({
+                    'companies': run['companies'],
+                    'stage': stage,
+                    'baseline_seconds': baseline_seconds,
+                    'seconds': measured['seconds_median'],
+                    'ratio': ratio,
+                })
+    return regressions
+
+
+def log_run(run):
+    """Resumen legible de un tamaño en el log."""
+    logger.info(f"📊 {run['companies']} compañías × {run['endpoints']} endpoints ({run['cells']:,} celdas)")
+    for stage, measured in run['stages'].items():
+        logger.info(
+            f"   {stage:<12} mediana={measured['seconds_median'] * 1000:9.1f} ms  "
+            f"min={measured['seconds_min'] * 1000:9.1f} ms  "
+            f"pico={measured['peak_python_bytes'] / 1024 ** 2:8.1f} MiB"
+        )
+    logger.info(f"   {'total':<12} mediana={run['total_seconds_median'] * 1000:9.1f} ms")
+
+
+# ========== CLI ==========
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline de datos del dashboard")
+    parser.add_argument(
+        "--sizes",
+        default=",".join(map(str, DEFAULT_SIZES)),
+        help="Números de compañías separados por coma (default: 50,500,5000)"
+    )
+    parser.add_argument("--endpoints", type=int, default=DEFAULT_ENDPOINTS, help="Endpoints por compañía (default: 40)")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS, help="Repeticiones por tamaño (default: 3)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="JSON de resultados (default: benchmark_results.json)")
+    parser.add_argument("--baseline", help="JSON de una corrida anterior para detectar regresiones")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="Aumento relativo de la mediana tolerado frente al baseline (default: 0.20)"
+    )
+    parser.add_argument(
+        "--fail-on-regression",
+        action="store_true",
+        help="Terminar con código 1 si alguna etapa supera la tolerancia"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+
+    results = {
+        'generated_at': pd.Timestamp.now(tz='UTC').isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'pyarrow': pa.__version__,
+        },
+        'repeats': args.repeats,
+        'stages': STAGES,
+        'runs': [],
+    }
+    for size in sizes:
+        run = benchmark_size(size, args.endpoints, args.repeats, args.seed)
+        log_run(run)
+        results['runs'].append(run)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(results, json.load(f), args.tolerance)
+        results['baseline'] = {'path': args.baseline, 'tolerance': args.tolerance, 'regressions': regressions}
+        for regression in regressions:
+            logger.warning(
+                f"⚠️ Regresión en {regression['stage']} ({regression['companies']} compañías): "
+                f"{regression['baseline_seconds'] * 1000:.1f} ms → {regression['seconds'] * 1000:.1f} ms "
+                f"(×{regression['ratio']:.2f})"
+            )
+        if not regressions:
+            logger.info(f"✅ Sin regresiones frente a {args.baseline} (tolerancia {args.tolerance:.0%})")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    logger.info(f"💾 Resultados en {args.output}")
+
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
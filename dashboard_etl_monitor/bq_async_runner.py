@@ -0,0 +1,221 @@
+"""
+Ejecutor asyncio de jobs de BigQuery para fan-outs de muchas queries pequeñas.
+
+En lugar de un hilo bloqueado en query_job.result() por cada query en vuelo:
+1. submit: la creación del job (jobs.insert) se hace en un pool pequeño de
+   hilos de E/S y la corrutina queda esperando un Future, sin hilo propio.
+2. polling por lotes: un solo bucle revisa todos los jobs pendientes con una
+   llamada jobs.list(state_filter="done") por proyecto y tick, acotada a la
+   ventana de creación de los jobs aún pendientes y cortada en cuanto aparecen
+   todos (si falta el permiso bigquery.jobs.list, recurre a job.reload() por job).
+3. fetch: el resultado se descarga solo cuando el job ya terminó.
+
+Un job que no termina antes de `job_timeout_seconds` falla con TimeoutError
+(el polling deja de esperarlo); si el bucle de polling se cae, todos los jobs
+pendientes fallan con ese error en lugar de quedar esperando para siempre.
+
+Así cientos de queries pueden estar en vuelo desde un proceso con pocos hilos.
+
+Uso (dentro de una corrutina):
+    runner = AsyncQueryRunner(pool.get_client)
+    df = await runner.query(project_id, sql)
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Jobs en vuelo simultáneos (total y por proyecto)
+DEFAULT_MAX_IN_FLIGHT = 200
+DEFAULT_PER_PROJECT_LIMIT = 50
+
+# Intervalo entre rondas de polling
+DEFAULT_POLL_INTERVAL_SECONDS = 0.5
+
+# Hilos para las llamadas HTTP cortas (insert, list, descarga de resultados)
+DEFAULT_IO_WORKERS = 8
+
+# Tiempo máximo que se espera a que termine un job desde su envío
+DEFAULT_JOB_TIMEOUT_SECONDS = float(os.environ.get("BQ_ASYNC_JOB_TIMEOUT_SECONDS", "600"))
+
+# Margen al filtrar jobs.list por fecha de creación (desfase de reloj)
+_CREATION_TIME_MARGIN_MS = 60_000
+
+
+class AsyncQueryRunner:
+    """
+    Ejecuta queries como jobs asíncronos con polling por lotes por proyecto.
+    Crear y usar dentro de un mismo event loop.
+    """
+
+    def __init__(self, get_client, max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+                 per_project_limit=DEFAULT_PER_PROJECT_LIMIT,
+                 poll_interval_seconds=DEFAULT_POLL_INTERVAL_SECONDS, io_workers=DEFAULT_IO_WORKERS,
+                 job_timeout_seconds=DEFAULT_JOB_TIMEOUT_SECONDS):
+        """
+        Args:
+            get_client: Función get_client(project_id) -> bigquery.Client (ej. BigQueryClientPool.get_client)
+            max_in_flight: Máximo de jobs en vuelo en total
+            per_project_limit: Máximo de jobs en vuelo por proyecto
+            poll_interval_seconds: Pausa entre rondas de polling
+            io_workers: Hilos para las llamadas HTTP
+            job_timeout_seconds: Espera máxima por job; al vencer, query() lanza TimeoutError
+        """
+        self._get_client = get_client
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._per_project_limit = per_project_limit
+        self._project_semaphores = {}
+        self._poll_interval_seconds = poll_interval_seconds
+        self._job_timeout_ms = int(job_timeout_seconds * 1000)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=io_workers)
+        # {project_id: {job_id: (job, future, submitted_ms)}}
+        self._pending = {}
+        self._list_unavailable = set()
+        self._poller = None
+        self.stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'poll_rounds': 0, 'poll_calls': 0}
+
+    async def _io(self, fn, *args, **kwargs):
+        """Ejecuta una llamada bloqueante corta en el pool de E/S."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    async def query(self, project_id, query, job_config=None, limit_key=None):
+        """
+        Envía una query, espera (sin bloquear hilos) a que termine y retorna su resultado.
+
+        Args:
+            project_id: Proyecto donde se crea el job
+            query: SQL
+            job_config: QueryJobConfig opcional
+            limit_key: Clave del límite por proyecto (default: project_id); útil cuando
+                todos los jobs se facturan en un proyecto pero leen de proyectos distintos
+
+        Retorna:
+            DataFrame con el resultado (los errores del job se lanzan como en job.result();
+            TimeoutError si no terminó en job_timeout_seconds)
+        """
+        project_semaphore = self._project_semaphores.setdefault(
+            limit_key or project_id, asyncio.Semaphore(self._per_project_limit)
+        )
+        async with self._semaphore, project_semaphore:
+            client = self._get_client(project_id)
+            job = await self._io(client.query, query, job_config=job_config)
+            self.stats['submitted'] += 1
+
+            done = asyncio.get_running_loop().create_future()
+            self._pending.setdefault(project_id, {})[job.job_id] = (job, done, int(time.time() * 1000))
+            self._ensure_poller()
+
+            try:
+                await done
+                df = await self._io(job.to_dataframe, create_bqstorage_client=False)
+            except Exception:
+                self.stats['failed'] += 1
+                raise
+            self.stats['completed'] += 1
+            return df
+
+    def _ensure_poller(self):
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.get_running_loop().create_task(self._poll_loop())
+
+    def _done_job_ids(self, project_id, jobs):
+        """
+        IDs de los jobs terminados de un proyecto: una llamada jobs.list por proyecto,
+        o job.reload() por job si no se pueden listar jobs.
+
+        La ventana de jobs.list va del job pendiente más antiguo al más reciente,
+        así que avanza a medida que terminan los jobs, y el recorrido de páginas
+        se corta en cuanto se vieron todos los IDs pendientes.
+        """
+        if project_id not in self._list_unavailable:
+            submitted = [submitted_ms for _, _, submitted_ms in jobs.values()]
+            pending_ids = set(jobs)
+            done_ids = set()
+            try:
+                client = self._get_client(project_id)
+                listed = client.list_jobs(
+                    project=project_id,
+                    state_filter="done",
+                    min_creation_time=_from_epoch_ms(min(submitted) - _CREATION_TIME_MARGIN_MS),
+                    max_creation_time=_from_epoch_ms(max(submitted) + _CREATION_TIME_MARGIN_MS),
+                )
+                for job in listed:
+                    if job.job_id in pending_ids:
+                        done_ids.add(job.job_id)
+                        if len(done_ids) == len(pending_ids):
+                            break
+                return done_ids
+            except Exception as e:
+                logger.debug(f"jobs.list no disponible en {project_id}, se usa job.reload(): {type(e).__name__} - {str(e)}")
+                self._list_unavailable.add(project_id)
+        return {job_id for job_id, (job, _, _) in jobs.items() if job.done()}
+
+    async def _poll_loop(self):
+        try:
+            while any(self._pending.values()):
+                await asyncio.sleep(self._poll_interval_seconds)
+                await self._poll_once()
+                self._expire_overdue()
+        except Exception as e:
+            logger.warning(f"⚠️ Polling de jobs interrumpido: {type(e).__name__} - {str(e)}")
+            self._fail_pending(lambda job_id: e)
+
+    async def _poll_once(self):
+        """Una ronda de polling: resuelve los futures de los jobs que ya terminaron."""
+        projects = [(project_id, dict(jobs)) for project_id, jobs in self._pending.items() if jobs]
+        self.stats['poll_rounds'] += 1
+        self.stats['poll_calls'] += len(projects)
+        done_by_project = await asyncio.gather(
+            *(self._io(self._done_job_ids, project_id, jobs) for project_id, jobs in projects),
+            return_exceptions=True
+        )
+        for (project_id, _), done_ids in zip(projects, done_by_project):
+            if isinstance(done_ids, Exception):
+                # Se reintenta en la siguiente ronda (hasta el timeout del job)
+                logger.debug(f"Polling de {project_id} falló: {type(done_ids).__name__} - {str(done_ids)}")
+                continue
+            for job_id in done_ids:
+                _, done, _ = self._pending[project_id].pop(job_id)
+                if not done.done():
+                    done.set_result(None)
+
+    def _expire_overdue(self):
+        """Falla con TimeoutError los jobs pendientes enviados hace más de job_timeout_seconds."""
+        deadline_ms = int(time.time() * 1000) - self._job_timeout_ms
+        self._fail_pending(
+            lambda job_id: TimeoutError(f"El job {job_id} no terminó en {self._job_timeout_ms / 1000:g}s"),
+            only=lambda submitted_ms: submitted_ms < deadline_ms
+        )
+
+    def _fail_pending(self, make_error, only=None):
+        """
+        Saca de pendientes y falla los futures de los jobs (todos, o los que cumplen `only`).
+
+        Args:
+            make_error: Función make_error(job_id) -> excepción para el future
+            only: Filtro opcional only(submitted_ms) -> bool
+        """
+        for project_id, jobs in self._pending.items():
+            for job_id, (_, done, submitted_ms) in list(jobs.items()):
+                if only is not None and not only(submitted_ms):
+                    continue
+                del jobs[job_id]
+                if not done.done():
+                    done.set_exception(make_error(job_id))
+
+    def close(self):
+        """Libera el pool de E/S."""
+        self._executor.shutdown(wait=False)
+
+
+def _from_epoch_ms(epoch_ms):
+    """datetime UTC desde milisegundos epoch."""
+    return datetime.fromtimestamp(epoch_ms / 1000, tz=timezone.utc)
+
@@ -0,0 +1,150 @@
+"""
+Pool compartido de clientes BigQuery por proyecto.
+
+Un solo juego de credenciales (google.auth.default) y una sola sesión HTTP
+con pool de conexiones dimensionado al número de workers, reutilizados por
+todos los clientes. Cada proyecto obtiene su cliente una sola vez.
+
+Uso:
+- Dashboards Streamlit: registrar BigQueryClientPool con @st.cache_resource
+- Scripts batch: get_client(project_id) usa un singleton del módulo
+
+Si google-cloud-bigquery-storage está instalado, el pool también comparte un
+cliente de la Storage Read API (ver bq_fetch.fetch_dataframe).
+
+Con BQ_BACKEND=fake el pool entrega FakeBigQueryClient (fake_bigquery.py,
+SQLite en memoria sembrado desde BQ_FAKE_FIXTURE) sin credenciales ni red.
+"""
+
+import os
+import threading
+
+import google.auth
+from google.auth.transport.requests import AuthorizedSession
+from google.cloud import bigquery
+from requests.adapters import HTTPAdapter
+
+try:
+    from google.cloud import bigquery_storage
+except ImportError:  # Storage Read API opcional: sin ella se descarga por REST
+    bigquery_storage = None
+
+# Tamaño del pool de conexiones HTTP (debe ser >= hilos que consultan en paralelo)
+DEFAULT_POOL_SIZE = int(os.environ.get("BQ_HTTP_POOL_SIZE", "32"))
+
+# "bigquery" (default) o "fake" (pruebas y benchmarks offline, ver fake_bigquery.py)
+BQ_BACKEND = os.environ.get("BQ_BACKEND", "bigquery")
+
+BIGQUERY_SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
+
+
+class BigQueryClientPool:
+    """
+    Clientes BigQuery cacheados por project_id, con credenciales y sesión HTTP compartidas.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, credentials=None, fake_backend=None):
+        """
+        Args:
+            pool_size: Conexiones HTTP máximas por host (dimensionar al número de workers)
+            credentials: Credenciales explícitas (por defecto google.auth.default())
+            fake_backend: FakeBigQueryBackend a usar en lugar de BigQuery
+                          (por defecto uno desde el entorno si BQ_BACKEND=fake)
+        """
+        if fake_backend is None and BQ_BACKEND == "fake":
+            from fake_bigquery import create_backend_from_env
+            fake_backend = create_backend_from_env()
+        self.pool_size = pool_size
+        self._fake_backend = fake_backend
+        self._credentials = credentials
+        self._default_project = None
+        self._session = None
+        self._clients = {}
+        self._bqstorage_client = None
+        self._lock = threading.Lock()
+
+    def _ensure_session(self):
+        """Crea credenciales y sesión HTTP una sola vez (llamar con el lock tomado)."""
+        if self._session is not None:
+            return
+        if self._credentials is None:
+            self._credentials, self._default_project = google.auth.default(scopes=BIGQUERY_SCOPES)
+        session = AuthorizedSession(self._credentials)
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        session.mount("https://", adapter)
+        self._session = session
+
+    def get_client(self, project_id=None):
+        """
+        Obtiene (o crea) el cliente BigQuery de un proyecto.
+
+        Args:
+            project_id: ID del proyecto de BigQuery (None = proyecto por defecto de las credenciales)
+
+        Retorna:
+            Cliente BigQuery compartido
+        """
+        with self._lock:
+            if self._fake_backend is not None:
+                client = self._clients.get(project_id)
+                if client is None:
+                    client = self._clients[project_id] = self._fake_backend.client(project_id)
+                return client
+            self._ensure_session()
+            project_id = project_id or self._default_project
+            client = self._clients.get(project_id)
+            if client is None:
+                client = bigquery.Client(
+                    project=project_id,
+                    credentials=self._credentials,
+                    _http=self._session
+                )
+                self._clients[project_id] = client
+            return client
+
+    def get_bqstorage_client(self):
+        """
+        Obtiene (o crea) el cliente de la BigQuery Storage Read API compartido.
+
+        Retorna:
+            BigQueryReadClient, o None si google-cloud-bigquery-storage no está instalado
+            o si el backend es fake
+        """
+        if bigquery_storage is None or self._fake_backend is not None:
+            return None
+        with self._lock:
+            self._ensure_session()
+            if self._bqstorage_client is None:
+                self._bqstorage_client = bigquery_storage.BigQueryReadClient(credentials=self._credentials)
+            return self._bqstorage_client
+
+    def close(self):
+        """Cierra la sesión HTTP compartida y descarta los clientes."""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+            self._clients = {}
+            self._bqstorage_client = None
+
+
+# ========== SINGLETON PARA SCRIPTS BATCH ==========
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_client_pool(pool_size=None):
+    """
+    Pool compartido del proceso (singleton). `pool_size` solo aplica en la primera llamada.
+    """
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = BigQueryClientPool(pool_size=pool_size or DEFAULT_POOL_SIZE)
+        return _default_pool
+
+
+def get_client(project_id=None):
+    """Atajo: cliente BigQuery del pool compartido del proceso."""
+    return get_client_pool().get_client(project_id)
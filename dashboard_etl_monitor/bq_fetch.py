@@ -0,0 +1,142 @@
+"""
+Capa compartida de descarga de resultados de BigQuery.
+
+Todas las queries que terminan en DataFrame pasan por fetch_dataframe():
+- Resultados grandes (>= STORAGE_API_MIN_ROWS filas) se descargan con la
+  BigQuery Storage Read API en formato Arrow (streams en paralelo).
+- Resultados pequeños usan la API REST (ya vienen en la primera página y
+  abrir una sesión de lectura costaría más que descargarlos).
+- El DataFrame se compacta: columnas categóricas y enteros int32 cuando el
+  rango lo permite.
+- Cada llamada registra filas, bytes y tiempo en FetchStats por etiqueta.
+"""
+
+import os
+import threading
+import time
+
+import pandas as pd
+import pyarrow as pa
+
+# A partir de este número de filas se usa la Storage Read API (si está disponible)
+STORAGE_API_MIN_ROWS = int(os.environ.get("BQ_STORAGE_API_MIN_ROWS", "10000"))
+
+INT32_MIN = -2 ** 31
+INT32_MAX = 2 ** 31 - 1
+
+# Mismos dtypes nullable que RowIterator.to_dataframe() (INTEGER → Int64, BOOL → boolean)
+_ARROW_TYPES = {
+    pa.int64(): pd.Int64Dtype(),
+    pa.bool_(): pd.BooleanDtype(),
+}
+
+
+class FetchStats:
+    """
+    Acumulado por etiqueta de las descargas realizadas (thread-safe).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_label = {}
+
+    def record(self, label, rows, nbytes, seconds, path):
+        """Registra una descarga."""
+        with self._lock:
+            entry = self._by_label.setdefault(label, {
+                'calls': 0, 'rows': 0, 'bytes': 0, 'seconds': 0.0, 'last_path': None,
+            })
+            entry['calls'] += 1
+            entry['rows'] += rows
+            entry['bytes'] += nbytes
+            entry['seconds'] += seconds
+            entry['last_path'] = path
+
+    def summary(self):
+        """
+        Retorna:
+            DataFrame con una fila por etiqueta (calls, rows, bytes, seconds, last_path)
+        """
+        with self._lock:
+            rows = [dict(label=label, **entry) for label, entry in self._by_label.items()]
+        return pd.DataFrame(rows, columns=['label', 'calls', 'rows', 'bytes', 'seconds', 'last_path'])
+
+    def reset(self):
+        """Descarta lo acumulado."""
+        with self._lock:
+            self._by_label = {}
+
+
+_fetch_stats = FetchStats()
+
+
+def get_fetch_stats():
+    """Estadísticas de descarga del proceso (singleton)."""
+    return _fetch_stats
+
+
+def compact_dtypes(df, categories=(), int32_columns=()):
+    """
+    Reduce la memoria del DataFrame in-place.
+
+    Args:
+        df: DataFrame a compactar
+        categories: Columnas a convertir a 'category' (pocas cadenas distintas repetidas)
+        int32_columns: Columnas enteras a bajar a int32/Int32 si todos los valores caben
+
+    Retorna:
+        El mismo DataFrame
+    """
+    for column in categories:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    for column in int32_columns:
+        if column not in df.columns or not pd.api.types.is_integer_dtype(df[column]):
+            continue
+        values = df[column]
+        if values.empty or (values.min() >= INT32_MIN and values.max() <= INT32_MAX):
+            nullable = isinstance(values.dtype, pd.api.extensions.ExtensionDtype)
+            df[column] = values.astype('Int32' if nullable else 'int32')
+    return df
+
+
+def arrow_to_dataframe(arrow_table, categories=(), int32_columns=()):
+    """
+    Convierte el resultado Arrow de una query a DataFrame compacto (dtypes nullable + compact_dtypes).
+    """
+    return compact_dtypes(arrow_table.to_pandas(types_mapper=_ARROW_TYPES.get), categories, int32_columns)
+
+
+def fetch_dataframe(client, query, job_config=None, label="query", categories=(), int32_columns=(),
+                    bqstorage_client=None, storage_min_rows=STORAGE_API_MIN_ROWS):
+    """
+    Ejecuta una query y descarga el resultado como DataFrame compacto.
+
+    Args:
+        client: Cliente BigQuery
+        query: SQL a ejecutar
+        job_config: QueryJobConfig opcional (parámetros, etc.)
+        label: Etiqueta para FetchStats (ej: "get_companies")
+        categories: Columnas a convertir a 'category'
+        int32_columns: Columnas enteras a bajar a int32 si caben
+        bqstorage_client: Cliente de la Storage Read API compartido (ver
+            BigQueryClientPool.get_bqstorage_client); None = crear uno si hace falta
+        storage_min_rows: Umbral de filas para usar la Storage Read API
+
+    Retorna:
+        DataFrame
+    """
+    started = time.perf_counter()
+    rows = client.query(query, job_config=job_config).result()
+
+    total_rows = rows.total_rows or 0
+    if total_rows >= storage_min_rows:
+        path = "storage"
+        arrow_table = rows.to_arrow(bqstorage_client=bqstorage_client, create_bqstorage_client=bqstorage_client is None)
+    else:
+        path = "rest"
+        arrow_table = rows.to_arrow(create_bqstorage_client=False)
+
+    df = arrow_to_dataframe(arrow_table, categories, int32_columns)
+    _fetch_stats.record(label, len(df), arrow_table.nbytes, time.perf_counter() - started, path)
+    return df
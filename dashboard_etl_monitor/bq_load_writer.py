@@ -0,0 +1,146 @@
+"""
+Escritura de registros en BigQuery con load jobs por lotes (sin streaming inserts).
+
+A diferencia de insert_rows_json, un load job no consume cuota de streaming,
+no deja filas en el streaming buffer (que bloquea el DML sobre la tabla) y no
+tiene el límite de tamaño por request. Los registros se serializan a JSON por
+líneas (date/datetime → ISO 8601, columnas JSON tal cual) y se cargan en
+lotes de `chunk_rows` filas.
+
+Exactamente una vez: cada lote usa un job_id determinista
+(`{job_id_prefix}_{n}`). Si el job ya existe (reintento o re-ejecución con el
+mismo prefijo) BigQuery responde 409 y se espera ese job en lugar de volver a
+cargar; si ese job había fallado se prueba con `{job_id}_r1`, `_r2`, ...
+(un load job fallido no escribe nada).
+
+Uso:
+    load_records(client, "pph-central.management.iam_access_snapshot", records,
+                 SCHEMA_SNAPSHOT, job_id_prefix="iam_snapshot_dev_20260101T000000000000")
+"""
+
+import json
+import logging
+import os
+import re
+from datetime import date, datetime
+from typing import Dict, List
+
+import pandas as pd
+from google.api_core.exceptions import Conflict
+from google.cloud import bigquery
+
+from bq_retry import call_with_retry, DEFAULT_MAX_RETRIES
+
+# Filas por load job (un snapshot de decenas de miles de grants cabe en uno)
+DEFAULT_LOAD_CHUNK_ROWS = int(os.environ.get("BQ_LOAD_CHUNK_ROWS", "100000"))
+# Intentos de carga por lote con un job_id nuevo cuando el job anterior falló
+DEFAULT_LOAD_MAX_ATTEMPTS = int(os.environ.get("BQ_LOAD_MAX_ATTEMPTS", "3"))
+
+logger = logging.getLogger(__name__)
+
+
+def serialize_value(value):
+    """Valor de un registro → valor serializable a JSON para el load job."""
+    if isinstance(value, pd.Timestamp):
+        return None if pd.isna(value) else value.isoformat()
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def serialize_record(record: Dict, schema: List[bigquery.SchemaField]) -> Dict:
+    """
+    Serializa un registro para NEWLINE_DELIMITED_JSON.
+
+    Las columnas JSON se envían como texto JSON (dict/list se codifican) y las
+    que no están en el esquema se descartan.
+    """
+    row = {}
+    for field in schema:
+        value = serialize_value(record.get(field.name))
+        if field.field_type == "JSON" and value is not None and not isinstance(value, str):
+            value = json.dumps(value, default=serialize_value)
+        row[field.name] = value
+    return row
+
+
+def job_id_safe(text: str) -> str:
+    """Reemplaza los caracteres no permitidos en un job_id (letras, números, '_' y '-')."""
+    return re.sub(r"[^A-Za-z0-9_-]", "_", text)
+
+
+def _load_chunk(
+    client: bigquery.Client,
+    table_ref: str,
+    rows: List[Dict],
+    job_config: bigquery.LoadJobConfig,
+    job_id: str,
+    max_attempts: int,
+    max_retries: int
+) -> str:
+    """Carga un lote exactamente una vez. Retorna el job_id que lo escribió."""
+    last_error = None
+    for attempt in range(max_attempts):
+        attempt_id = job_id if attempt == 0 else f"{job_id}_r{attempt}"
+        try:
+            job = call_with_retry(
+                lambda: client.load_table_from_json(rows, table_ref, job_id=attempt_id, job_config=job_config),
+                max_retries
+            )
+        except Conflict:
+            # El job ya existe: un intento anterior (o una corrida previa) lo envió
+            job = client.get_job(attempt_id)
+            logger.info(f"♻️ Job {attempt_id} ya existía, se reutiliza su resultado")
+        try:
+            call_with_retry(job.result, max_retries)
+            return attempt_id
+        except Exception as e:
+            if job.error_result is None:
+                raise
+            last_error = e
+            logger.warning(f"⚠️ Load job {attempt_id} falló ({str(e)}), reintentando con un job nuevo")
+    raise last_error
+
+
+def load_records(
+    client: bigquery.Client,
+    table_ref: str,
+    records: List[Dict],
+    schema: List[bigquery.SchemaField],
+    job_id_prefix: str,
+    chunk_rows: int = DEFAULT_LOAD_CHUNK_ROWS,
+    max_attempts: int = DEFAULT_LOAD_MAX_ATTEMPTS,
+    max_retries: int = DEFAULT_MAX_RETRIES
+) -> int:
+    """
+    Agrega registros a una tabla con load jobs (WRITE_APPEND) en lotes.
+
+    Args:
+        client: Cliente de BigQuery
+        table_ref: Tabla destino "project.dataset.table"
+        records: Registros (dicts; pueden traer date/datetime)
+        schema: Esquema de la tabla destino
+        job_id_prefix: Prefijo determinista de los job_id (mismo prefijo = mismos lotes)
+        chunk_rows: Filas por load job
+        max_attempts: Job IDs a probar por lote si los anteriores fallaron
+        max_retries: Reintentos ante errores transitorios de la API
+
+    Retorna:
+        int: Filas escritas (o ya escritas por un job previo con el mismo ID)
+    """
+    if not records:
+        return 0
+
+    job_config = bigquery.LoadJobConfig(
+        schema=schema,
+        source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+        write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+    )
+    rows = [serialize_record(record, schema) for record in records]
+    prefix = job_id_safe(job_id_prefix)
+
+    chunks = [rows[start:start + chunk_rows] for start in range(0, len(rows), chunk_rows)]
+    for index, chunk in enumerate(chunks):
+        job_id = _load_chunk(client, table_ref, chunk, job_config, f"{prefix}_{index:04d}", max_attempts, max_retries)
+        logger.info(f"📦 Lote {index + 1}/{len(chunks)}: {len(chunk)} filas en {table_ref} (job {job_id})")
+    return len(rows)
@@ -0,0 +1,66 @@
+"""
+Reintentos ante errores transitorios de las APIs de Google Cloud.
+
+Compartido por el crawler de IAM (iam_crawler.py) y la escritura con load
+jobs (bq_load_writer.py): se reintentan la cuota/429, los 5xx, los timeouts y
+los errores de conexión con backoff exponencial con jitter completo; los
+errores de permisos, NotFound o Conflict se propagan sin reintentar.
+"""
+
+import os
+import random
+import time
+
+from google.api_core.exceptions import (
+    BadGateway,
+    DeadlineExceeded,
+    GatewayTimeout,
+    InternalServerError,
+    ServiceUnavailable,
+)
+import requests
+
+from adaptive_concurrency import is_quota_error, BACKOFF_BASE_SECONDS, BACKOFF_CAP_SECONDS
+
+# Reintentos por llamada ante errores transitorios
+DEFAULT_MAX_RETRIES = int(os.environ.get("BQ_MAX_RETRIES", "4"))
+
+TRANSIENT_ERRORS = (
+    InternalServerError,
+    BadGateway,
+    ServiceUnavailable,
+    GatewayTimeout,
+    DeadlineExceeded,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+)
+
+
+def is_transient_error(error):
+    """Indica si un error de la API merece reintento (cuota, 5xx, timeout o conexión)."""
+    return is_quota_error(error) or isinstance(error, TRANSIENT_ERRORS)
+
+
+def call_with_retry(fn, max_retries=DEFAULT_MAX_RETRIES, on_retry=None):
+    """
+    Ejecuta fn() reintentando los errores transitorios con backoff exponencial con jitter completo.
+
+    Args:
+        fn: Función sin argumentos
+        max_retries: Reintentos máximos (luego se propaga el último error)
+        on_retry: Callback opcional on_retry(error, attempt)
+
+    Retorna:
+        El resultado de fn()
+    """
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            if not is_transient_error(e) or attempt >= max_retries:
+                raise
+            if on_retry is not None:
+                on_retry(e, attempt)
+            time.sleep(random.uniform(0, min(BACKOFF_CAP_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)))
+            attempt += 1
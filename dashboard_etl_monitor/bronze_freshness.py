@@ -0,0 +1,298 @@
+"""
+Motor de frescura de tablas Bronze (MAX(_etl_synced)) por lotes.
+
+En lugar de ejecutar un job de BigQuery por cada combinación compañía × tabla,
+agrupa las celdas por proyecto y genera un UNION ALL por cada bloque de tablas.
+Cada fila del resultado se vuelve a repartir a su celda, conservando el error
+individual de cada tabla para el modo debug.
+
+Modos de frescura:
+- "metadata": una sola query a `{project}.bronze.__TABLES__` por proyecto
+  (last_modified_time y row_count, sin escanear datos). Solo las celdas
+  sospechosas se verifican después con el escaneo preciso.
+- "scan": MAX(_etl_synced) escaneando cada tabla (UNION ALL por bloques).
+
+Los escaneos aceptan `maximum_bytes_billed`: un bloque que lo excede falla
+sin costo (BadRequest) y se divide como un error de compilación, hasta dejar
+con error solo las tablas que por sí solas superan el tope (ver cost_planner).
+"""
+
+from datetime import timedelta
+
+from google.cloud import bigquery
+from google.api_core.exceptions import BadRequest
+import pandas as pd
+
+from adaptive_concurrency import is_quota_error
+
+# Máximo de tablas por query generada (limita el tamaño del SQL y el impacto de un error)
+MAX_TABLES_PER_QUERY = 50
+
+BRONZE_DATASET = "bronze"
+
+FRESHNESS_MODES = ["metadata", "scan"]
+DEFAULT_FRESHNESS_MODE = "metadata"
+
+# Una tabla cuya última modificación supera este umbral se verifica con el escaneo preciso
+DEFAULT_SUSPICIOUS_AFTER_HOURS = 24
+
+
+# ========== GENERACIÓN DE QUERIES ==========
+
+def build_table_ref(project_id, table_name):
+    """Referencia completa de una tabla Bronze: project.bronze.table"""
+    return f"{project_id}.{BRONZE_DATASET}.{table_name}"
+
+
+def build_max_sync_union_query(project_id, table_names):
+    """
+    Genera un UNION ALL con MAX(_etl_synced) para varias tablas de un mismo proyecto.
+
+    Args:
+        project_id: ID del proyecto de BigQuery
+        table_names: Lista de tablas del dataset 'bronze'
+
+    Retorna:
+        str: Query con columnas table_name, max_sync (una fila por tabla)
+    """
+    selects = [
+        f"SELECT '{table_name}' AS table_name, MAX(_etl_synced) AS max_sync "
+        f"FROM `{build_table_ref(project_id, table_name)}` WHERE _etl_synced IS NOT NULL"
+        for table_name in table_names
+    ]
+    return "\nUNION ALL\n".join(selects)
+
+
+def chunk_tables(table_names, chunk_size=MAX_TABLES_PER_QUERY):
+    """Divide la lista de tablas en bloques de tamaño máximo chunk_size."""
+    return [table_names[i:i + chunk_size] for i in range(0, len(table_names), chunk_size)]
+
+
+# ========== EJECUCIÓN POR PROYECTO ==========
+
+def list_existing_bronze_tables(client, project_id):
+    """
+    Lista las tablas existentes del dataset bronze de un proyecto (una sola query).
+
+    Retorna:
+        set con los nombres de tabla existentes
+    """
+    query = f"""
+        SELECT table_name
+        FROM `{project_id}.{BRONZE_DATASET}.INFORMATION_SCHEMA.TABLES`
+    """
+    df = client.query(query).to_dataframe()
+    return set(df['table_name'].tolist())
+
+
+def _run_union_chunk(client, project_id, table_names, results, sql_log, maximum_bytes_billed=None):
+    """
+    Ejecuta un bloque UNION ALL y reparte el resultado en `results`.
+
+    Si la query falla por un error de compilación (BadRequest, ej. una tabla sin
+    columna _etl_synced), el bloque se divide en dos y se reintenta cada mitad,
+    hasta aislar la(s) tabla(s) culpable(s); igual si el bloque supera
+    maximum_bytes_billed. Los errores de cuota se propagan
+    (el llamador decide si reintentar); cualquier otro error se atribuye a
+    todas las tablas del bloque.
+    """
+    query = build_max_sync_union_query(project_id, table_names)
+    sql_log.append(query)
+
+    try:
+        job_config = bigquery.QueryJobConfig()
+        job_config.use_legacy_sql = False
+        if maximum_bytes_billed:
+            # Asignar None guardaría el texto "None" en la configuración del job
+            job_config.maximum_bytes_billed = maximum_bytes_billed
+        df = client.query(query, job_config=job_config).result().to_dataframe()
+    except BadRequest as e:
+        if len(table_names) > 1:
+            middle = len(table_names) // 2
+            _run_union_chunk(client, project_id, table_names[:middle], results, sql_log, maximum_bytes_billed)
+            _run_union_chunk(client, project_id, table_names[middle:], results, sql_log, maximum_bytes_billed)
+        else:
+            table_ref = build_table_ref(project_id, table_names[0])
+            results[table_names[0]] = (None, f"Error en {table_ref}: {type(e).__name__} - {str(e)}")
+        return
+    except Exception as e:
+        if is_quota_error(e):
+            raise
+        for table_name in table_names:
+            table_ref = build_table_ref(project_id, table_name)
+            results[table_name] = (None, f"Error en {table_ref}: {type(e).__name__} - {str(e)}")
+        return
+
+    returned = dict(zip(df['table_name'], df['max_sync']))
+    for table_name in table_names:
+        max_sync_value = returned.get(table_name)
+        if max_sync_value is None or pd.isna(max_sync_value):
+            table_ref = build_table_ref(project_id, table_name)
+            results[table_name] = (None, f"Query ejecutada pero max_sync es NULL: {table_ref}")
+        else:
+            results[table_name] = (pd.to_datetime(max_sync_value), None)
+
+
+def fetch_project_max_sync(client, project_id, table_names, chunk_size=MAX_TABLES_PER_QUERY,
+                           maximum_bytes_billed=None, existing_tables=None):
+    """
+    Obtiene MAX(_etl_synced) de varias tablas Bronze de un proyecto con pocas queries.
+
+    1. Una query a INFORMATION_SCHEMA.TABLES para saber qué tablas existen
+       (se omite si se pasa `existing_tables`, ej. las tablas de __TABLES__
+       que ya leyó cost_planner)
+    2. Un UNION ALL por cada bloque de `chunk_size` tablas existentes
+
+    Args:
+        client: Cliente BigQuery
+        project_id: ID del proyecto de la compañía
+        table_names: Lista de tablas del dataset 'bronze'
+        chunk_size: Máximo de tablas por query
+        maximum_bytes_billed: Tope de bytes facturados por query (None = sin tope)
+        existing_tables: Tablas existentes en bronze ya conocidas (None = consultarlas)
+
+    Retorna:
+        tuple (results, sql_log):
+            - results: {table_name: (max_sync o None, error_info o None)}
+            - sql_log: lista de queries ejecutadas
+    """
+    results = {}
+    sql_log = []
+
+    if not project_id or not table_names:
+        for table_name in table_names:
+            results[table_name] = (None, f"Parámetros inválidos: project_id={project_id}, table_name={table_name}")
+        return results, sql_log
+
+    try:
+        existing = existing_tables if existing_tables is not None else list_existing_bronze_tables(client, project_id)
+    except Exception as e:
+        if is_quota_error(e):
+            raise
+        # Dataset inexistente o sin permisos: el error aplica a todas las celdas del proyecto
+        for table_name in table_names:
+            results[table_name] = (None, f"Error en {project_id}.{BRONZE_DATASET}: {type(e).__name__} - {str(e)}")
+        return results, sql_log
+
+    to_query = []
+    for table_name in table_names:
+        if table_name in existing:
+            to_query.append(table_name)
+        else:
+            results[table_name] = (None, f"Tabla no encontrada: {build_table_ref(project_id, table_name)}")
+
+    for chunk in chunk_tables(to_query, chunk_size):
+        _run_union_chunk(client, project_id, chunk, results, sql_log, maximum_bytes_billed)
+
+    return results, sql_log
+
+
+# ========== MODO METADATA ==========
+
+def build_bronze_metadata_query(project_id):
+    """
+    Query de metadata (sin escaneo de datos) para todas las tablas del dataset bronze.
+    """
+    return f"""
+        SELECT
+            table_id AS table_name,
+            TIMESTAMP_MILLIS(last_modified_time) AS last_modified_time,
+            row_count
+        FROM `{project_id}.{BRONZE_DATASET}.__TABLES__`
+        WHERE type = 1
+    """
+
+
+def fetch_project_metadata(client, project_id):
+    """
+    Obtiene last_modified_time y row_count de todas las tablas Bronze de un proyecto.
+
+    Retorna:
+        dict: {table_name: {'last_modified_time': Timestamp (UTC), 'row_count': int}}
+    """
+    df = client.query(build_bronze_metadata_query(project_id)).to_dataframe()
+    metadata = {}
+    for table_name, last_modified, row_count in zip(df['table_name'], df['last_modified_time'], df['row_count']):
+        metadata[table_name] = {
+            'last_modified_time': pd.to_datetime(last_modified, utc=True),
+            'row_count': int(row_count) if not pd.isna(row_count) else 0,
+        }
+    return metadata
+
+
+def is_suspicious(table_metadata, now=None, suspicious_after_hours=DEFAULT_SUSPICIOUS_AFTER_HOURS):
+    """
+    Indica si una celda debe verificarse con el escaneo preciso.
+
+    Sospechosa = tabla vacía, sin fecha de modificación o modificada hace más
+    de `suspicious_after_hours` horas.
+    """
+    if now is None:
+        now = pd.Timestamp.now(tz='UTC')
+    last_modified = table_metadata.get('last_modified_time')
+    if last_modified is None or pd.isna(last_modified):
+        return True
+    if table_metadata.get('row_count', 0) <= 0:
+        return True
+    return now - last_modified > timedelta(hours=suspicious_after_hours)
+
+
+def fetch_project_freshness(client, project_id, table_names, mode=DEFAULT_FRESHNESS_MODE,
+                            suspicious_after_hours=DEFAULT_SUSPICIOUS_AFTER_HOURS,
+                            chunk_size=MAX_TABLES_PER_QUERY, maximum_bytes_billed=None,
+                            verify_suspicious=True, metadata=None):
+    """
+    Obtiene la frescura de varias tablas Bronze de un proyecto según el modo.
+
+    - mode="scan": igual que fetch_project_max_sync
+    - mode="metadata": una query a __TABLES__; las tablas sospechosas se
+      verifican con MAX(_etl_synced) (UNION ALL por bloques), salvo con
+      verify_suspicious=False (sin escaneos: todas usan last_modified_time).
+
+    Si se pasa `metadata` (resultado de fetch_project_metadata, ej. el que ya
+    leyó cost_planner) no se vuelve a consultar __TABLES__ en modo metadata, y
+    en modo scan sus tablas reemplazan la consulta a INFORMATION_SCHEMA.TABLES
+
+    Retorna:
+        tuple (results, sql_log):
+            - results: {table_name: (timestamp o None, error_info o None)}
+            - sql_log: lista de queries ejecutadas
+    """
+    if mode == "scan":
+        return fetch_project_max_sync(client, project_id, table_names, chunk_size=chunk_size,
+                                      maximum_bytes_billed=maximum_bytes_billed,
+                                      existing_tables=set(metadata) if metadata is not None else None)
+
+    results = {}
+    sql_log = []
+
+    if not project_id or not table_names:
+        return fetch_project_max_sync(client, project_id, table_names, chunk_size=chunk_size,
+                                      maximum_bytes_billed=maximum_bytes_billed)
+
+    if metadata is None:
+        sql_log.append(build_bronze_metadata_query(project_id))
+        try:
+            metadata = fetch_project_metadata(client, project_id)
+        except Exception as e:
+            if is_quota_error(e):
+                raise
+            for table_name in table_names:
+                results[table_name] = (None, f"Error en {project_id}.{BRONZE_DATASET}: {type(e).__name__} - {str(e)}")
+            return results, sql_log
+
+    now = pd.Timestamp.now(tz='UTC')
+    to_scan = []
+    for table_name in table_names:
+        table_metadata = metadata.get(table_name)
+        if table_metadata is None:
+            results[table_name] = (None, f"Tabla no encontrada: {build_table_ref(project_id, table_name)}")
+        elif verify_suspicious and is_suspicious(table_metadata, now, suspicious_after_hours):
+            to_scan.append(table_name)
+        else:
+            results[table_name] = (table_metadata['last_modified_time'], None)
+
+    for chunk in chunk_tables(to_scan, chunk_size):
+        _run_union_chunk(client, project_id, chunk, results, sql_log, maximum_bytes_billed)
+
+    return results, sql_log
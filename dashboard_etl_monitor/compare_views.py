@@ -21,6 +21,9 @@ from collections import OrderedDict
 import pandas as pd
 from typing import Dict, List, Tuple, Optional
 
+from bq_client_pool import get_client
+from bq_fetch import fetch_dataframe
+
 
 def parse_view_reference(view_ref: str) -> Tuple[str, str, str]:
     """
@@ -94,7 +97,7 @@ def get_view_row_count(client: bigquery.Client, project_id: str, dataset_id: str
     
     try:
         query = f"SELECT COUNT(*) as row_count FROM `{view_ref}`"
-        result = client.query(query).to_dataframe()
+        result = fetch_dataframe(client, query, label="get_view_row_count")
         return int(result.iloc[0]['row_count'])
     except Exception as e:
         raise Exception(f"Error obteniendo cantidad de registros de {view_ref}: {str(e)}")
@@ -316,7 +319,7 @@ Ejemplos:
         else:
             # Intentar detectar desde el cliente BigQuery
             try:
-                client_temp = bigquery.Client()
+                client_temp = get_client()
                 project_id = client_temp.project
                 if not project_id:
                     raise ValueError("No se pudo determinar el project_id. Especifíquelo con --project-id")
@@ -335,7 +338,7 @@ Ejemplos:
         print("\n⏳ Obteniendo información de las vistas...\n")
         
         # Crear cliente BigQuery
-        client = bigquery.Client(project=project_id)
+        client = get_client(project_id)
         
         # Obtener esquemas
         print("📋 Obteniendo esquemas...")
@@ -0,0 +1,275 @@
+"""
+Planificador de costo de la carga LIVE (bytes escaneados en Bronze).
+
+Antes de ejecutar, estima cuántos bytes facturaría cada proyecto con el modo
+de frescura elegido y aplica dos presupuestos:
+- por job: `maximum_bytes_billed` de cada query de escaneo (BigQuery rechaza
+  sin costo la query que lo superaría);
+- por refresco: si la estimación total lo excede, se degrada el modo
+  scan → metadata → metadata sin verificación (solo last_modified_time, 0 escaneos).
+
+Métodos de estimación:
+- "metadata" (default): una query a __TABLES__ por proyecto; bytes de un
+  escaneo ≈ row_count × 8 (la query solo lee la columna TIMESTAMP _etl_synced).
+  El resultado se reutiliza en la ejecución (ver fetch_options).
+- "dry_run": además, un dry run por bloque UNION ALL (bytes exactos, sin costo,
+  una llamada extra por bloque). Si el dry run de un bloque falla al compilar
+  (BadRequest, ej. una tabla sin _etl_synced), ese bloque usa la estimación
+  por metadata.
+
+La estimación de slots es orientativa (bytes / ESTIMATED_BYTES_PER_SLOT_SECOND).
+"""
+
+import concurrent.futures
+import os
+
+from google.cloud import bigquery
+from google.api_core.exceptions import BadRequest
+import pandas as pd
+
+from adaptive_concurrency import is_quota_error
+from bronze_freshness import (
+    build_max_sync_union_query,
+    chunk_tables,
+    fetch_project_metadata,
+    is_suspicious,
+    MAX_TABLES_PER_QUERY,
+)
+
+GIB = 1024 ** 3
+MIB = 1024 ** 2
+
+# Presupuestos (bytes facturados); 0 = sin tope
+LIVE_MAX_BYTES_PER_JOB = int(os.environ.get("LIVE_MAX_BYTES_PER_JOB", str(10 * GIB)))
+LIVE_MAX_BYTES_PER_REFRESH = int(os.environ.get("LIVE_MAX_BYTES_PER_REFRESH", str(100 * GIB)))
+
+ESTIMATE_METHODS = ["metadata", "dry_run"]
+DEFAULT_ESTIMATE_METHOD = os.environ.get("LIVE_COST_ESTIMATE_METHOD", "metadata")
+
+# Modos efectivos en orden de degradación
+EFFECTIVE_MODES = ["scan", "metadata", "metadata_only"]
+
+# BigQuery factura como mínimo 10 MB por tabla referenciada (on-demand)
+MIN_BYTES_BILLED_PER_TABLE = 10 * MIB
+
+# Bytes por fila de MAX(_etl_synced): solo se lee la columna TIMESTAMP
+TIMESTAMP_BYTES = 8
+
+# Throughput aproximado por slot para la estimación de slot-segundos
+ESTIMATED_BYTES_PER_SLOT_SECOND = int(os.environ.get("ESTIMATED_BYTES_PER_SLOT_SECOND", str(256 * MIB)))
+
+
+def estimate_scan_bytes(row_count):
+    """Bytes facturados estimados de MAX(_etl_synced) sobre una tabla."""
+    return max(int(row_count) * TIMESTAMP_BYTES, MIN_BYTES_BILLED_PER_TABLE)
+
+
+def dry_run_bytes(client, query):
+    """Bytes que procesaría una query (dry run: sin costo ni ejecución)."""
+    job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+    return int(client.query(query, job_config=job_config).total_bytes_processed or 0)
+
+
+def format_bytes(num_bytes):
+    """Tamaño legible: '850 MB', '12.3 GB', '1.2 TB'."""
+    if num_bytes < GIB:
+        return f"{num_bytes / MIB:.0f} MB"
+    if num_bytes < 1024 * GIB:
+        return f"{num_bytes / GIB:.1f} GB"
+    return f"{num_bytes / (1024 * GIB):.1f} TB"
+
+
+def _dry_run_chunk_bytes(client, project_id, chunk, table_bytes):
+    """
+    Bytes de un bloque por dry run; si no compila (BadRequest) usa la estimación
+    por metadata del bloque (la ejecución aislará la tabla culpable).
+    """
+    try:
+        return max(dry_run_bytes(client, build_max_sync_union_query(project_id, chunk)),
+                   MIN_BYTES_BILLED_PER_TABLE * len(chunk))
+    except BadRequest:
+        return sum(table_bytes[table_name] for table_name in chunk)
+
+
+def _chunk_bytes(client, project_id, table_names, table_bytes, method, chunk_size):
+    """Bytes por bloque UNION ALL (lista), por metadata o dry run."""
+    chunks = chunk_tables(table_names, chunk_size)
+    if method == "dry_run":
+        return [_dry_run_chunk_bytes(client, project_id, chunk, table_bytes) for chunk in chunks]
+    return [sum(table_bytes[table_name] for table_name in chunk) for chunk in chunks]
+
+
+def estimate_project_cost(client, project_id, table_names, method=DEFAULT_ESTIMATE_METHOD,
+                          chunk_size=MAX_TABLES_PER_QUERY, now=None):
+    """
+    Estima los bytes de refrescar las tablas de un proyecto en cada modo efectivo.
+
+    Args:
+        client: Cliente BigQuery
+        project_id: ID del proyecto de la compañía
+        table_names: Tablas del dataset 'bronze' a consultar
+        method: "metadata" o "dry_run"
+        chunk_size: Máximo de tablas por query (igual que la ejecución)
+        now: Momento de referencia para las celdas sospechosas
+
+    Retorna:
+        dict: {
+            'project_id': str,
+            'bytes': {modo: bytes totales},
+            'max_job_bytes': {modo: bytes del bloque más grande},
+            'metadata': resultado de fetch_project_metadata (None si no se leyó),
+            'error': str o None
+        }
+    """
+    estimate = {
+        'project_id': project_id,
+        'bytes': dict.fromkeys(EFFECTIVE_MODES, 0),
+        'max_job_bytes': dict.fromkeys(EFFECTIVE_MODES, 0),
+        'metadata': None,
+        'error': None,
+    }
+    if not project_id or not table_names:
+        return estimate
+
+    try:
+        metadata = fetch_project_metadata(client, project_id)
+        existing = [table_name for table_name in table_names if table_name in metadata]
+        table_bytes = {table_name: estimate_scan_bytes(metadata[table_name]['row_count']) for table_name in existing}
+        suspicious = [table_name for table_name in existing if is_suspicious(metadata[table_name], now)]
+
+        # La query a __TABLES__ se factura como una tabla mínima
+        metadata_bytes = MIN_BYTES_BILLED_PER_TABLE
+        scan_chunks = _chunk_bytes(client, project_id, existing, table_bytes, method, chunk_size)
+        suspicious_chunks = _chunk_bytes(client, project_id, suspicious, table_bytes, method, chunk_size)
+    except Exception as e:
+        if is_quota_error(e):
+            raise
+        estimate['error'] = f"{type(e).__name__} - {str(e)}"
+        return estimate
+
+    estimate['metadata'] = metadata
+    estimate['bytes'] = {
+        'scan': metadata_bytes + sum(scan_chunks),
+        'metadata': metadata_bytes + sum(suspicious_chunks),
+        'metadata_only': metadata_bytes,
+    }
+    estimate['max_job_bytes'] = {
+        'scan': max(scan_chunks, default=0),
+        'metadata': max(suspicious_chunks, default=0),
+        'metadata_only': metadata_bytes,
+    }
+    return estimate
+
+
+class RefreshPlan:
+    """
+    Resultado de plan_refresh: estimación por proyecto y modo efectivo elegido.
+    """
+
+    def __init__(self, requested_mode, estimates, max_bytes_per_job, max_bytes_per_refresh, method):
+        self.requested_mode = requested_mode
+        self.estimates = estimates
+        self.max_bytes_per_job = max_bytes_per_job
+        self.max_bytes_per_refresh = max_bytes_per_refresh
+        self.method = method
+        self.effective_mode = self._choose_mode()
+        self._metadata = {estimate['project_id']: estimate['metadata'] for estimate in estimates
+                          if estimate.get('metadata') is not None}
+
+    def total_bytes(self, mode=None):
+        """Bytes estimados del refresco completo en `mode` (default: modo efectivo)."""
+        mode = mode or self.effective_mode
+        return sum(estimate['bytes'][mode] for estimate in self.estimates)
+
+    def slot_seconds(self, mode=None):
+        """Slot-segundos aproximados del refresco en `mode`."""
+        return self.total_bytes(mode) / ESTIMATED_BYTES_PER_SLOT_SECOND
+
+    def over_job_budget(self, mode=None):
+        """
+        Proyectos con algún bloque sobre el tope por job: el bloque se divide y las
+        tablas que por sí solas lo superan quedan con error.
+        """
+        mode = mode or self.effective_mode
+        if not self.max_bytes_per_job:
+            return []
+        return [estimate['project_id'] for estimate in self.estimates
+                if estimate['max_job_bytes'][mode] > self.max_bytes_per_job]
+
+    @property
+    def errors(self):
+        """{project_id: error} de los proyectos que no se pudieron estimar."""
+        return {estimate['project_id']: estimate['error'] for estimate in self.estimates if estimate['error']}
+
+    @property
+    def degraded(self):
+        """True si el presupuesto obligó a un modo más barato que el solicitado."""
+        return self.effective_mode != self.requested_mode
+
+    def _choose_mode(self):
+        """Primer modo (desde el solicitado) cuya estimación cabe en el presupuesto por refresco."""
+        start = EFFECTIVE_MODES.index(self.requested_mode)
+        for mode in EFFECTIVE_MODES[start:]:
+            if not self.max_bytes_per_refresh or self.total_bytes(mode) <= self.max_bytes_per_refresh:
+                return mode
+        return EFFECTIVE_MODES[-1]
+
+    def fetch_options(self, project_id=None):
+        """
+        Argumentos de bronze_freshness.fetch_project_freshness para el modo efectivo.
+
+        Con project_id se incluye el __TABLES__ ya leído al estimar ese proyecto,
+        para no repetir la query (modo metadata) ni listar las tablas de bronze
+        otra vez (modo scan).
+        """
+        options = {
+            'mode': "scan" if self.effective_mode == "scan" else "metadata",
+            'verify_suspicious': self.effective_mode != "metadata_only",
+            'maximum_bytes_billed': self.max_bytes_per_job or None,
+        }
+        if project_id is not None:
+            options['metadata'] = self._metadata.get(project_id)
+        return options
+
+
+def plan_refresh(get_client, project_tables, requested_mode, method=DEFAULT_ESTIMATE_METHOD,
+                 max_bytes_per_job=LIVE_MAX_BYTES_PER_JOB, max_bytes_per_refresh=LIVE_MAX_BYTES_PER_REFRESH,
+                 max_workers=8, run=None):
+    """
+    Estima el costo de un refresco LIVE y elige el modo efectivo según el presupuesto.
+
+    Args:
+        get_client: Función get_client(project_id) -> bigquery.Client
+        project_tables: {project_id: [table_name, ...]}
+        requested_mode: Modo elegido por el usuario ("scan" o "metadata")
+        method: "metadata" o "dry_run"
+        max_bytes_per_job: Tope por query (0 = sin tope)
+        max_bytes_per_refresh: Presupuesto del refresco (0 = sin tope)
+        max_workers: Proyectos estimados en paralelo
+        run: Envoltorio opcional run(project_id, fn) (ej. AdaptiveConcurrencyLimiter.run)
+
+    Retorna:
+        RefreshPlan
+    """
+    now = pd.Timestamp.now(tz='UTC')
+    run = run or (lambda project_id, fn: fn())
+
+    def _estimate(project_id, table_names):
+        client = get_client(project_id) if project_id else None
+        try:
+            return run(project_id, lambda: estimate_project_cost(client, project_id, table_names, method, now=now))
+        except Exception as e:
+            # Cuota agotada tras los reintentos: el proyecto queda sin estimar
+            estimate = estimate_project_cost(None, None, [])
+            estimate['project_id'] = project_id
+            estimate['error'] = f"{type(e).__name__} - {str(e)}"
+            return estimate
+
+    estimates = []
+    if project_tables:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(project_tables))) as executor:
+            futures = [executor.submit(_estimate, project_id, sorted(set(table_names)))
+                       for project_id, table_names in project_tables.items()]
+            estimates = [future.result() for future in futures]
+
+    return RefreshPlan(requested_mode, estimates, max_bytes_per_job, max_bytes_per_refresh, method)
@@ -0,0 +1,239 @@
+"""
+Tabla de snapshot del ETL (pph-central.management.etl_monitoring_snapshot).
+
+Cada corrida del writer agrega una fila por compañía × endpoint con un único
+updated_at (el momento de la corrida), en una tabla particionada por
+DATE(updated_at) y clusterizada por company_id, endpoint_name:
+- actual_*: valores de esta corrida
+- last_*: actual_* de la fila más reciente anterior de la misma celda, leída
+  solo de la última partición (sin escanear el historial)
+
+Como una corrida completa cae en una sola partición, la última partición
+contiene la fotografía más reciente de todas las celdas: el dashboard filtra
+`updated_at >= inicio de la última partición` y BigQuery poda el resto.
+"""
+
+import logging
+
+from google.cloud import bigquery
+from google.api_core.exceptions import NotFound
+import pandas as pd
+
+SNAPSHOT_PROJECT = "pph-central"
+SNAPSHOT_DATASET = "management"
+SNAPSHOT_TABLE = "etl_monitoring_snapshot"
+SNAPSHOT_STAGING_TABLE = "etl_monitoring_snapshot_staging"  # Se sobrescribe en cada corrida
+
+# Ventana de búsqueda de la corrida anterior si no se puede leer la última partición
+DEFAULT_LOOKBACK_DAYS = 30
+
+RESULT_COLUMNS = ['company_id', 'endpoint_name', 'max_sync', 'actual_rows', 'actual_duration', 'actual_status']
+
+SCHEMA_SNAPSHOT = [
+    bigquery.SchemaField("company_id", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("endpoint_name", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("max_sync", "TIMESTAMP", mode="NULLABLE"),
+    bigquery.SchemaField("actual_rows", "INT64", mode="NULLABLE"),
+    bigquery.SchemaField("actual_duration", "FLOAT64", mode="NULLABLE"),
+    bigquery.SchemaField("actual_status", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("last_rows", "INT64", mode="NULLABLE"),
+    bigquery.SchemaField("last_duration", "FLOAT64", mode="NULLABLE"),
+    bigquery.SchemaField("last_status", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("updated_at", "TIMESTAMP", mode="REQUIRED"),
+]
+
+# La staging solo lleva los resultados de la corrida (last_* y updated_at los agrega el INSERT)
+SCHEMA_STAGING = [field for field in SCHEMA_SNAPSHOT if field.name in RESULT_COLUMNS]
+
+CLUSTERING_FIELDS = ["company_id", "endpoint_name"]
+
+# Nombres de tipo del esquema (API) → tipos de GoogleSQL para el CAST
+_LEGACY_SQL_TYPES = {"INTEGER": "INT64", "FLOAT": "FLOAT64", "BOOLEAN": "BOOL"}
+
+logger = logging.getLogger(__name__)
+
+
+def snapshot_table_ref(project=SNAPSHOT_PROJECT, dataset=SNAPSHOT_DATASET, table=SNAPSHOT_TABLE):
+    """Referencia completa project.dataset.table del snapshot."""
+    return f"{project}.{dataset}.{table}"
+
+
+def ensure_snapshot_table(client, table_ref=None, partition_expiration_days=None):
+    """
+    Crea la tabla de snapshot particionada y clusterizada si no existe.
+
+    Si ya existe sin partición, solo lo advierte (migración en
+    sql_create_etl_monitoring_matrix_latest.sql).
+
+    Retorna:
+        bigquery.Table
+    """
+    table_ref = table_ref or snapshot_table_ref()
+    try:
+        table = client.get_table(table_ref)
+    except NotFound:
+        table = bigquery.Table(table_ref, schema=SCHEMA_SNAPSHOT)
+        table.time_partitioning = bigquery.TimePartitioning(
+            type_=bigquery.TimePartitioningType.DAY,
+            field="updated_at",
+            expiration_ms=partition_expiration_days * 86_400_000 if partition_expiration_days else None,
+        )
+        table.clustering_fields = CLUSTERING_FIELDS
+        table = client.create_table(table)
+        logger.info(f"🆕 Tabla {table_ref} creada (partición diaria por updated_at, cluster {', '.join(CLUSTERING_FIELDS)})")
+        return table
+
+    if table.time_partitioning is None:
+        logger.warning(f"⚠️ {table_ref} no está particionada: las lecturas escanean toda la tabla")
+    return table
+
+
+def get_latest_partition_start(client, table_ref=None):
+    """
+    Inicio (UTC) de la última partición diaria del snapshot, desde INFORMATION_SCHEMA.PARTITIONS
+    (metadata, sin escanear la tabla).
+
+    Retorna:
+        pd.Timestamp (UTC) o None si la tabla no existe, no está particionada o está vacía
+    """
+    table_ref = table_ref or snapshot_table_ref()
+    project, dataset, table = table_ref.split(".")
+    query = f"""
+        SELECT MAX(partition_id) AS partition_id
+        FROM `{project}.{dataset}.INFORMATION_SCHEMA.PARTITIONS`
+        WHERE table_name = @table_name
+          AND partition_id NOT IN ('__NULL__', '__UNPARTITIONED__')
+          AND total_rows > 0
+    """
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ScalarQueryParameter("table_name", "STRING", table)]
+    )
+    df = client.query(query, job_config=job_config).to_dataframe()
+    if df.empty or df.iloc[0]['partition_id'] is None or pd.isna(df.iloc[0]['partition_id']):
+        return None
+    return pd.Timestamp(pd.to_datetime(df.iloc[0]['partition_id'], format="%Y%m%d"), tz='UTC')
+
+
+def normalize_results(results_df):
+    """
+    Normaliza los resultados de una corrida al esquema de staging:
+    company_id string sin '.0', endpoint_name en minúsculas, una fila por celda.
+    """
+    df = results_df.reindex(columns=RESULT_COLUMNS).copy()
+    df['company_id'] = df['company_id'].astype(str).str.strip().str.replace(r'\.0$', '', regex=True)
+    df['endpoint_name'] = df['endpoint_name'].astype(str).str.strip().str.lower()
+    df['max_sync'] = pd.to_datetime(df['max_sync'], utc=True)
+    df['actual_rows'] = pd.to_numeric(df['actual_rows'], errors='coerce').round().astype('Int64')
+    df['actual_duration'] = pd.to_numeric(df['actual_duration'], errors='coerce').astype('float64')
+    df['actual_status'] = df['actual_status'].astype('string')
+    df = df[(df['company_id'] != '') & (df['endpoint_name'] != '')]
+    return df.drop_duplicates(subset=['company_id', 'endpoint_name'], keep='last').reset_index(drop=True)
+
+
+def build_append_query(table_ref, staging_ref, company_id_type="STRING"):
+    """
+    INSERT de la corrida: resultados de staging + last_* de la fila anterior de cada celda.
+
+    La fila anterior se busca solo desde @since (inicio de la última partición),
+    por lo que la lectura del snapshot queda podada a esa partición.
+    """
+    return f"""
+        INSERT INTO `{table_ref}` (
+            company_id, endpoint_name, max_sync,
+            actual_rows, actual_duration, actual_status,
+            last_rows, last_duration, last_status, updated_at
+        )
+        WITH previous AS (
+            SELECT
+                REGEXP_REPLACE(TRIM(CAST(company_id AS STRING)), r'\\.0$', '') AS company_id,
+                LOWER(TRIM(endpoint_name)) AS endpoint_name,
+                actual_rows,
+                actual_duration,
+                actual_status
+            FROM `{table_ref}`
+            WHERE updated_at >= @since
+              AND updated_at < @run_at
+            QUALIFY ROW_NUMBER() OVER (
+                PARTITION BY REGEXP_REPLACE(TRIM(CAST(company_id AS STRING)), r'\\.0$', ''), LOWER(TRIM(endpoint_name))
+                ORDER BY updated_at DESC
+            ) = 1
+        )
+        SELECT
+            CAST(run.company_id AS {company_id_type}),
+            run.endpoint_name,
+            run.max_sync,
+            run.actual_rows,
+            run.actual_duration,
+            run.actual_status,
+            previous.actual_rows,
+            previous.actual_duration,
+            previous.actual_status,
+            @run_at
+        FROM `{staging_ref}` run
+        LEFT JOIN previous
+            ON previous.company_id = run.company_id
+           AND previous.endpoint_name = run.endpoint_name
+    """
+
+
+def append_snapshot(client, results_df, run_at=None, table_ref=None, staging_ref=None,
+                    lookback_days=DEFAULT_LOOKBACK_DAYS):
+    """
+    Agrega los resultados de una corrida al snapshot (load job a staging + un INSERT).
+
+    Args:
+        client: Cliente BigQuery
+        results_df: DataFrame con RESULT_COLUMNS (una fila por compañía × endpoint)
+        run_at: updated_at de toda la corrida (default: ahora, UTC)
+        table_ref: Tabla de snapshot (default: pph-central.management.etl_monitoring_snapshot)
+        staging_ref: Tabla staging (default: etl_monitoring_snapshot_staging)
+        lookback_days: Ventana para la fila anterior si no se conoce la última partición
+
+    Retorna:
+        int: Filas insertadas
+    """
+    table_ref = table_ref or snapshot_table_ref()
+    staging_ref = staging_ref or snapshot_table_ref(table=SNAPSHOT_STAGING_TABLE)
+    run_at = pd.Timestamp(run_at) if run_at is not None else pd.Timestamp.now(tz='UTC')
+    run_at = run_at.tz_localize('UTC') if run_at.tzinfo is None else run_at.tz_convert('UTC')
+
+    df = normalize_results(results_df)
+    if df.empty:
+        logger.warning("⚠️ No hay resultados para agregar al snapshot")
+        return 0
+
+    table = ensure_snapshot_table(client, table_ref)
+    # Una tabla previa puede tener company_id numérico: se respeta su tipo
+    company_id_type = next((field.field_type for field in table.schema if field.name == 'company_id'), "STRING")
+    company_id_type = _LEGACY_SQL_TYPES.get(company_id_type, company_id_type)
+
+    # 1. Resultados de la corrida a staging (load job: sin cuota de streaming ni DML)
+    load_config = bigquery.LoadJobConfig(
+        schema=SCHEMA_STAGING,
+        write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
+        source_format=bigquery.SourceFormat.PARQUET,
+    )
+    client.load_table_from_dataframe(df, staging_ref, job_config=load_config).result()
+    logger.info(f"📦 Cargadas {len(df)} filas en {staging_ref}")
+
+    # 2. Fila anterior solo desde la última partición (o la ventana de respaldo)
+    try:
+        since = get_latest_partition_start(client, table_ref)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo leer la última partición de {table_ref}: {str(e)}")
+        since = None
+    if since is None or since > run_at:
+        since = run_at.floor('D') - pd.Timedelta(days=lookback_days)
+
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ScalarQueryParameter("since", "TIMESTAMP", since.to_pydatetime()),
+        bigquery.ScalarQueryParameter("run_at", "TIMESTAMP", run_at.to_pydatetime()),
+    ])
+    query_job = client.query(build_append_query(table_ref, staging_ref, company_id_type), job_config=job_config)
+    query_job.result()
+    inserted = query_job.num_dml_affected_rows or 0
+    logger.info(
+        f"✅ Snapshot {table_ref}: {inserted} filas agregadas (updated_at={run_at.isoformat()}, "
+        f"anterior desde {since.date()}, {(query_job.total_bytes_processed or 0) / 1024 ** 2:.1f} MiB leídos)"
+    )
+    return inserted
@@ -0,0 +1,1211 @@
+"""
+Sustituto local de BigQuery sobre SQLite para pruebas y benchmarks sin GCP.
+
+Implementa el subconjunto del cliente que usan los módulos del monitor:
+- query(sql, job_config) → job con result(), to_dataframe(), done(),
+  total_bytes_processed y num_dml_affected_rows (también dry_run, que valida
+  el SQL y lanza el error en query() como BigQuery, y maximum_bytes_billed)
+- get_table, get_dataset, list_datasets, list_tables, create_table,
+  update_table (schema), insert_rows_json, load_table_from_dataframe y
+  load_table_from_json (job_id explícito: Conflict si se repite), get_job, list_jobs
+
+Las tablas viven en una base SQLite en memoria con el nombre completo
+"project.dataset.table". Las vistas de metadata (`__TABLES__`,
+`INFORMATION_SCHEMA.TABLES`, `.PARTITIONS`, `.TABLE_STORAGE`, `.SCHEMATA` y
+`.OBJECT_PRIVILEGES`) se generan desde el catálogo en cada query. El SQL de GoogleSQL se traduce con reglas
+simples (referencias con backticks, @parámetros, IN UNNEST(@array), CAST,
+r'...', CURRENT_TIMESTAMP(), TIMESTAMP_MILLIS, TIMESTAMP_SUB, ANY_VALUE,
+REGEXP_REPLACE, campos STRUCT, QUALIFY al final de un SELECT,
+SELECT * REPLACE sobre una tabla y MERGE ... WHEN MATCHED THEN UPDATE);
+lo demás falla con BadRequest. Las funciones de tabla no existen (NotFound).
+
+Simulación:
+- latency: segundos por query (número, tupla (min, max) o función sql -> segundos);
+  el job queda "RUNNING" hasta que vence, sin bloquear (sirve con bq_async_runner)
+- api_latency: segundos por llamada de metadata (get_dataset, list_tables, ...)
+- error_rate / error_factory: probabilidad de fallo aleatorio (default 429 de cuota)
+- fail_on: {regex: excepción} para fallos deterministas; se evalúa contra el
+  SQL o contra "operación:recurso" (ej. "get_dataset:proj.bronze")
+
+Uso:
+    backend = FakeBigQueryBackend.from_fixture(build_fleet_fixture(companies=500, tables=40))
+    client = backend.client("pph-central")
+    # o para todo el proceso: BQ_BACKEND=fake BQ_FAKE_FIXTURE=fleet.json (ver bq_client_pool)
+
+Generar un fixture:
+    python fake_bigquery.py --companies 500 --tables 40 --out fleet_500.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from google.api_core.exceptions import BadRequest, Conflict, NotFound, TooManyRequests
+from google.cloud import bigquery
+from google.cloud.bigquery.table import Row
+import pandas as pd
+import pyarrow as pa
+
+BQ_FAKE_FIXTURE = os.environ.get("BQ_FAKE_FIXTURE", "")
+BQ_FAKE_LATENCY = float(os.environ.get("BQ_FAKE_LATENCY", "0"))
+BQ_FAKE_ERROR_RATE = float(os.environ.get("BQ_FAKE_ERROR_RATE", "0"))
+
+# Bytes por valor para estimar total_bytes_processed
+BYTES_PER_VALUE = 8
+
+_SQLITE_TYPES = {
+    "STRING": "TEXT", "TIMESTAMP": "TEXT", "DATETIME": "TEXT", "DATE": "TEXT",
+    "INTEGER": "INTEGER", "INT64": "INTEGER", "BOOLEAN": "INTEGER", "BOOL": "INTEGER",
+    "FLOAT": "REAL", "FLOAT64": "REAL", "NUMERIC": "REAL", "RECORD": "TEXT", "STRUCT": "TEXT",
+}
+
+_CAST_TYPES = {
+    "STRING": "TEXT", "INT64": "INTEGER", "FLOAT64": "REAL", "NUMERIC": "REAL",
+    "BOOL": "INTEGER", "TIMESTAMP": "TEXT", "DATE": "TEXT",
+}
+
+_TIMESTAMP_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}")
+
+_METADATA_VIEWS = ("__TABLES__", "INFORMATION_SCHEMA.TABLES", "INFORMATION_SCHEMA.PARTITIONS",
+                   "INFORMATION_SCHEMA.TABLE_STORAGE", "INFORMATION_SCHEMA.SCHEMATA",
+                   "INFORMATION_SCHEMA.OBJECT_PRIVILEGES")
+
+# Prefijo del grantee de OBJECT_PRIVILEGES por tipo de access entry, y roles legacy → predefinidos
+_GRANTEE_PREFIXES = {"userByEmail": "user", "groupByEmail": "group", "specialGroup": "specialGroup", "domain": "domain"}
+_LEGACY_ROLES = {"READER": "roles/bigquery.dataViewer", "WRITER": "roles/bigquery.dataEditor",
+                 "OWNER": "roles/bigquery.dataOwner"}
+
+
+# ========== CONVERSIÓN DE VALORES ==========
+
+def _to_timestamp_text(value):
+    """Timestamp (datetime, pd.Timestamp, str, epoch) → texto ISO UTC uniforme (ordenable)."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    ts = None
+    if isinstance(value, datetime):
+        ts = value
+    elif isinstance(value, str):
+        try:
+            ts = datetime.fromisoformat(value)  # Camino rápido para fixtures grandes
+        except ValueError:
+            pass
+    if ts is None:
+        ts = pd.Timestamp(value).to_pydatetime()
+    ts = ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts.astimezone(timezone.utc)
+    return ts.strftime("%Y-%m-%d %H:%M:%S.%f+00:00")
+
+
+def _now_text():
+    return _to_timestamp_text(datetime.now(timezone.utc))
+
+
+def _timestamp_millis(ms):
+    return None if ms is None else _to_timestamp_text(pd.Timestamp(int(ms), unit='ms', tz='UTC'))
+
+
+def _timestamp_add(value, amount, unit):
+    if value is None:
+        return None
+    delta = pd.Timedelta(**{unit.lower() + "s": float(amount)}) if unit.upper() != "DAY" else pd.Timedelta(days=float(amount))
+    return _to_timestamp_text(pd.Timestamp(value) + delta)
+
+
+def _regexp_replace(value, pattern, replacement):
+    return None if value is None else re.sub(pattern, replacement, str(value))
+
+
+def _storage_value(field, value):
+    """Valor de una fila (JSON/pandas) → valor SQLite según el tipo del campo."""
+    if value is None or (not isinstance(value, (str, dict, list)) and pd.isna(value)):
+        return None
+    field_type = field.field_type.upper()
+    if field_type in ("TIMESTAMP", "DATETIME"):
+        return _to_timestamp_text(value)
+    if field_type in ("BOOLEAN", "BOOL"):
+        return int(bool(value))
+    if field_type in ("INTEGER", "INT64"):
+        return int(value)
+    if field_type in ("FLOAT", "FLOAT64", "NUMERIC"):
+        return float(value)
+    if field_type in ("RECORD", "STRUCT"):
+        return json.dumps(value, default=str)
+    return str(value)
+
+
+# ========== TRADUCCIÓN GoogleSQL → SQLite ==========
+
+def translate_sql(sql, default_project, struct_columns=(), table_columns=None):
+    """
+    Traduce el subconjunto de GoogleSQL usado en el repo a SQLite.
+
+    Args:
+        sql: Query de GoogleSQL
+        default_project: Proyecto para referencias dataset.table
+        struct_columns: Columnas aplanadas de STRUCT ("endpoint.name", ...)
+        table_columns: Función ref -> [columnas] (para SELECT * REPLACE)
+
+    Retorna:
+        tuple (sql traducido, set de referencias completas usadas)
+    """
+    refs = set()
+
+    def _ref(match):
+        ref = match.group(1)
+        if ref.count(".") == 1 or (ref.startswith("region-") and "INFORMATION_SCHEMA" in ref):
+            ref = f"{default_project}.{ref}"
+        refs.add(ref)
+        return f'"{ref}"'
+
+    sql = re.sub(r"`([^`]+)`", _ref, sql)
+    sql = re.sub(r"(?<![\w])r'", "'", sql)
+    sql = re.sub(r"\bCURRENT_TIMESTAMP\(\)", "bq_current_timestamp()", sql, flags=re.IGNORECASE)
+    sql = re.sub(
+        r"\bTIMESTAMP_SUB\((.+?),\s*INTERVAL\s+(\S+)\s+(\w+)\)",
+        r"bq_timestamp_add(\1, -(\2), '\3')", sql, flags=re.IGNORECASE
+    )
+    sql = re.sub(
+        r"\bTIMESTAMP_ADD\((.+?),\s*INTERVAL\s+(\S+)\s+(\w+)\)",
+        r"bq_timestamp_add(\1, \2, '\3')", sql, flags=re.IGNORECASE
+    )
+    sql = re.sub(r"\bCURRENT_DATE\(\)", "date('now')", sql, flags=re.IGNORECASE)
+    sql = re.sub(
+        r"\bDATE_(SUB|ADD)\((.+?),\s*INTERVAL\s+(\S+)\s+DAY\)",
+        lambda m: f"date({m.group(2)}, {'-' if m.group(1).upper() == 'SUB' else '+'}({m.group(3)}) || ' days')",
+        sql, flags=re.IGNORECASE
+    )
+    sql = re.sub(r"\bIN\s+UNNEST\(\s*@(\w+)\s*\)", r"IN (SELECT value FROM json_each(:\1))", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"(?<![\w@.:])@(\w+)", r":\1", sql)
+    sql = re.sub(
+        r"\bAS\s+(STRING|INT64|FLOAT64|NUMERIC|BOOL|TIMESTAMP|DATE)\s*\)",
+        lambda m: f"AS {_CAST_TYPES[m.group(1).upper()]})", sql, flags=re.IGNORECASE
+    )
+    sql = re.sub(r"\bANY_VALUE\(", "MIN(", sql, flags=re.IGNORECASE)
+    for column in sorted(struct_columns, key=len, reverse=True):
+        sql = re.sub(rf'(?<![\w."]){re.escape(column)}\b', f'"{column}"', sql)
+    sql = _rewrite_merge(sql)
+    while re.search(r"SELECT\s+\*\s+REPLACE\s*\(", sql, flags=re.IGNORECASE):
+        sql = _expand_star_replace(sql, table_columns or (lambda ref: None))
+    while re.search(r"\bQUALIFY\b", sql, flags=re.IGNORECASE):
+        sql = _rewrite_qualify(sql)
+    return sql, refs
+
+
+def _rewrite_merge(sql):
+    """
+    MERGE ... WHEN MATCHED THEN UPDATE SET ... → UPDATE ... FROM (única forma soportada).
+    """
+    if not re.match(r"\s*MERGE\b", sql, flags=re.IGNORECASE):
+        return sql
+    match = re.match(
+        r"\s*MERGE\s+(\S+)\s+(?:AS\s+)?(\w+)\s+USING\s+(\S+)\s+(?:AS\s+)?(\w+)\s+ON\s+(.+?)\s+"
+        r"WHEN\s+MATCHED\s+THEN\s+UPDATE\s+SET\s+(.+?)\s*;?\s*$",
+        sql, flags=re.IGNORECASE | re.DOTALL
+    )
+    # Otras cláusulas (WHEN NOT MATCHED, ...) no se soportan; CASE WHEN dentro del SET sí
+    if match is None or re.search(r"\bWHEN\s+(NOT\s+)?MATCHED\b", match.group(6), flags=re.IGNORECASE):
+        raise BadRequest("FakeBigQueryClient solo soporta MERGE ... WHEN MATCHED THEN UPDATE SET ...")
+    target, target_alias, source, source_alias, condition, assignments = match.groups()
+    return (f"UPDATE {target} AS {target_alias} SET {assignments} "
+            f"FROM {source} AS {source_alias} WHERE {condition}")
+
+
+def _expand_star_replace(sql, table_columns):
+    """`SELECT * REPLACE (expr AS col, ...) FROM "tabla"` → lista explícita de columnas de la tabla."""
+    match = re.search(r"SELECT\s+\*\s+REPLACE\s*\(", sql, flags=re.IGNORECASE)
+    depths = _paren_depths(sql)
+    open_at = match.end() - 1
+    close_at = open_at + 1
+    while sql[close_at] != ")" or depths[close_at] >= depths[open_at]:
+        close_at += 1
+    from_match = re.match(r'\s*FROM\s+"([^"]+)"', sql[close_at + 1:], flags=re.IGNORECASE)
+    columns = table_columns(from_match.group(1)) if from_match else None
+    if columns is None:
+        raise BadRequest("SELECT * REPLACE solo soportado sobre una tabla (fake)")
+    replacements = {}
+    item_start = open_at + 1
+    for position in range(open_at + 1, close_at + 1):
+        if position == close_at or (sql[position] == "," and depths[position] == depths[open_at]):
+            expression, name = re.match(r"\s*(.+)\s+AS\s+(\w+)\s*$", sql[item_start:position],
+                                        flags=re.IGNORECASE | re.DOTALL).groups()
+            replacements[name] = expression
+            item_start = position + 1
+    selected = ", ".join(
+        f"{replacements[name]} AS {name}" if name in replacements else _quote(name) for name in columns
+    )
+    return f"{sql[:match.start()]}SELECT {selected}{sql[close_at + 1:]}"
+
+
+def _paren_depths(sql):
+    """Profundidad de paréntesis por posición (ignorando literales entre comillas simples)."""
+    depths = []
+    depth = 0
+    in_string = False
+    for char in sql:
+        if char == "'":
+            in_string = not in_string
+        elif not in_string and char == "(":
+            depth += 1
+        elif not in_string and char == ")":
+            depth -= 1
+        depths.append(depth)
+    return depths
+
+
+def _rewrite_qualify(sql):
+    """
+    Reescribe el primer `SELECT ... QUALIFY expr` (último clause de su subquery) como
+    `SELECT * FROM (SELECT ..., (expr) AS _qualify ...) WHERE _qualify`.
+    """
+    qualify_at = re.search(r"\bQUALIFY\b", sql, flags=re.IGNORECASE).start()
+    depths = _paren_depths(sql)
+    level = depths[qualify_at]
+    start = qualify_at
+    while start > 0 and not (sql[start - 1] == "(" and depths[start - 1] == level):
+        start -= 1
+    end = qualify_at
+    while end < len(sql) and not (sql[end] == ")" and depths[end] == level - 1):
+        end += 1
+    select_part = sql[start:qualify_at]
+    from_match = next(
+        (m for m in re.finditer(r"\bFROM\b", select_part, flags=re.IGNORECASE) if depths[start + m.start()] == level),
+        None
+    )
+    if from_match is None:
+        raise BadRequest("QUALIFY sin FROM no soportado por FakeBigQueryClient")
+    expression = sql[qualify_at + len("QUALIFY"):end]
+    rewritten = (f"SELECT * FROM ({select_part[:from_match.start()]}, ({expression}) AS _qualify "
+                 f"{select_part[from_match.start():]}) WHERE _qualify")
+    return sql[:start] + rewritten + sql[end:]
+
+
+def _query_parameters(job_config):
+    """Parámetros del job_config → dict para sqlite3 (arrays como JSON para json_each)."""
+    params = {}
+    for param in getattr(job_config, "query_parameters", None) or []:
+        if isinstance(param, bigquery.ArrayQueryParameter):
+            params[param.name] = json.dumps(list(param.values), default=str)
+        else:
+            value = param.value
+            if param.type_ in ("TIMESTAMP", "DATETIME"):
+                value = _to_timestamp_text(value)
+            elif param.type_ == "BOOL":
+                value = int(bool(value))
+            params[param.name] = value
+    return params
+
+
+# ========== RESULTADOS Y JOBS ==========
+
+class FakeRowIterator:
+    """
+    Resultado de un job: iterable de Row, con total_rows, schema, to_arrow y to_dataframe.
+    """
+
+    def __init__(self, arrow_table):
+        self._arrow = arrow_table
+        self.total_rows = arrow_table.num_rows
+        self.schema = [bigquery.SchemaField(name, _arrow_to_bq_type(field.type))
+                       for name, field in zip(arrow_table.column_names, arrow_table.schema)]
+
+    def __iter__(self):
+        field_to_index = {name: index for index, name in enumerate(self._arrow.column_names)}
+        for values in zip(*(column.to_pylist() for column in self._arrow.columns)):
+            yield Row(values, field_to_index)
+
+    def to_arrow(self, **kwargs):
+        return self._arrow
+
+    def to_dataframe(self, **kwargs):
+        return self._arrow.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype(), pa.bool_(): pd.BooleanDtype()}.get)
+
+
+def _arrow_to_bq_type(arrow_type):
+    if pa.types.is_integer(arrow_type):
+        return "INT64"
+    if pa.types.is_floating(arrow_type):
+        return "FLOAT64"
+    if pa.types.is_boolean(arrow_type):
+        return "BOOL"
+    if pa.types.is_timestamp(arrow_type):
+        return "TIMESTAMP"
+    return "STRING"
+
+
+class FakeQueryJob:
+    """
+    Job de query simulado: se ejecuta al crearse y queda RUNNING hasta que vence su latencia.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, project, result=None, error=None, latency=0.0, total_bytes_processed=0,
+                 num_dml_affected_rows=None, dry_run=False, job_id=None):
+        self.project = project
+        self.job_id = job_id or f"fake_job_{next(self._ids)}"
+        self.created = datetime.now(timezone.utc)
+        self.total_bytes_processed = total_bytes_processed
+        self.num_dml_affected_rows = num_dml_affected_rows
+        self.dry_run = dry_run
+        self._result = result
+        self._error = error
+        self._completes_at = time.monotonic() + (0.0 if dry_run else latency)
+
+    @property
+    def state(self):
+        return "DONE" if self.done() else "RUNNING"
+
+    def done(self, *args, **kwargs):
+        return time.monotonic() >= self._completes_at
+
+    @property
+    def error_result(self):
+        if self._error is None or not self.done():
+            return None
+        return {"reason": type(self._error).__name__, "message": str(self._error)}
+
+    def result(self, *args, **kwargs):
+        remaining = self._completes_at - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+        if self._error is not None:
+            raise self._error
+        return self._result if self._result is not None else FakeRowIterator(pa.table({}))
+
+    def __iter__(self):
+        return iter(self.result())
+
+    def to_dataframe(self, *args, **kwargs):
+        return self.result().to_dataframe()
+
+    def to_arrow(self, *args, **kwargs):
+        return self.result().to_arrow()
+
+
+# ========== BACKEND ==========
+
+class FakeBigQueryBackend:
+    """
+    Catálogo + base SQLite compartidos por todos los clientes (uno por proyecto).
+    """
+
+    def __init__(self, latency=0.0, api_latency=0.0, error_rate=0.0, error_factory=None, fail_on=None, seed=None):
+        """
+        Args:
+            latency: Segundos por query: número, tupla (min, max) o función sql -> segundos
+            api_latency: Segundos por llamada de metadata (get_dataset, list_tables, ...)
+            error_rate: Probabilidad de fallo aleatorio por operación (0-1)
+            error_factory: Función que crea la excepción aleatoria (default: TooManyRequests)
+            fail_on: {regex: excepción o clase} de fallos deterministas
+            seed: Semilla de la latencia y los fallos aleatorios
+        """
+        self.latency = latency
+        self.api_latency = api_latency
+        self.error_rate = error_rate
+        self.error_factory = error_factory or (lambda: TooManyRequests("Rate limit exceeded (fake)"))
+        self.fail_on = {re.compile(pattern): error for pattern, error in (fail_on or {}).items()}
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._connections = {}     # {project: sqlite3.Connection}
+        self._datasets = {}        # {"project.dataset": bigquery.Dataset}
+        self._tables = {}          # {"project.dataset.table": {'table', 'row_count', 'last_modified', 'created'}}
+        self._project_tables = {}  # {project: [table_ref, ...]}
+        self._table_grants = {}    # {"project.dataset.table": [(role, grantee), ...]}
+        self._struct_columns = set()
+        self._jobs = []
+        self._jobs_by_id = {}      # {(project, job_id): job} de los jobs con ID explícito
+        self.stats = {'queries': 0, 'api_calls': 0, 'errors': 0}
+
+    # ----- Fixtures -----
+
+    @classmethod
+    def from_fixture(cls, fixture, **options):
+        """
+        Crea un backend sembrado desde un fixture (dict o ruta a JSON).
+
+        Formato:
+            {
+              "datasets": {"project.dataset": {"access": [{"role", "entity_type", "entity_id"}], "labels": {}}},
+              "tables": {"project.dataset.table": {
+                  "schema": [{"name", "type", "mode", "fields"}],
+                  "rows": [{...}],
+                  "row_count": int (opcional, filas "virtuales" para __TABLES__ y bytes),
+                  "last_modified_time": ISO (opcional),
+                  "partition_field": str (opcional),
+                  "grants": [{"role", "grantee"}] (opcional, IAM a nivel tabla)
+              }}
+            }
+        """
+        if isinstance(fixture, (str, os.PathLike)):
+            with open(fixture) as f:
+                fixture = json.load(f)
+        backend = cls(**options)
+        for dataset_ref, spec in fixture.get("datasets", {}).items():
+            backend.add_dataset(dataset_ref, access=spec.get("access"), labels=spec.get("labels"))
+        for table_ref, spec in fixture.get("tables", {}).items():
+            backend.add_table(
+                table_ref,
+                [_schema_field(field) for field in spec["schema"]],
+                rows=spec.get("rows", []),
+                row_count=spec.get("row_count"),
+                last_modified_time=spec.get("last_modified_time"),
+                partition_field=spec.get("partition_field"),
+            )
+            for grant in spec.get("grants", []):
+                backend.add_table_grant(table_ref, grant["role"], grant["grantee"])
+        return backend
+
+    def client(self, project=None):
+        """Cliente para un proyecto (comparte catálogo y datos)."""
+        return FakeBigQueryClient(self, project)
+
+    def _database_uri(self, project):
+        return f"file:fakebq_{id(self)}_{project}?mode=memory&cache=shared"
+
+    def _connection(self, project):
+        """
+        Base SQLite en memoria del proyecto (llamar con el lock tomado).
+
+        Una base por proyecto: SQLite reprocesa el esquema completo en cada CREATE TABLE,
+        así que miles de tablas en una sola base hacen la carga cuadrática. Las queries
+        entre proyectos adjuntan (ATTACH) las demás bases.
+        """
+        connection = self._connections.get(project)
+        if connection is None:
+            connection = sqlite3.connect(
+                self._database_uri(project), uri=True, check_same_thread=False, isolation_level=None
+            )
+            connection.create_function("bq_current_timestamp", 0, _now_text)
+            connection.create_function("timestamp_millis", 1, _timestamp_millis)
+            connection.create_function("bq_timestamp_add", 3, _timestamp_add)
+            connection.create_function("regexp_replace", 3, _regexp_replace)
+            connection.create_function("timestamp", 1, _to_timestamp_text)
+            self._connections[project] = connection
+        return connection
+
+    def add_dataset(self, dataset_ref, access=None, labels=None):
+        """Registra un dataset con sus access entries [{role, entity_type, entity_id}]."""
+        with self._lock:
+            dataset = bigquery.Dataset(dataset_ref)
+            dataset.access_entries = [
+                bigquery.AccessEntry(entry.get("role"), entry["entity_type"], entry["entity_id"])
+                for entry in access or []
+            ]
+            dataset.labels = labels or {}
+            self._datasets[dataset_ref] = dataset
+            return dataset
+
+    def add_table(self, table_ref, schema, rows=(), row_count=None, last_modified_time=None,
+                  partition_field=None, exists_ok=False):
+        """Crea una tabla (y su dataset si falta) e inserta filas."""
+        with self._lock:
+            if table_ref in self._tables:
+                if exists_ok:
+                    return self._tables[table_ref]['table']
+                raise Conflict(f"Already Exists: Table {table_ref}")
+            dataset_ref = table_ref.rsplit(".", 1)[0]
+            if dataset_ref not in self._datasets:
+                self.add_dataset(dataset_ref)
+            table = bigquery.Table(table_ref, schema=schema)
+            if partition_field:
+                table.time_partitioning = bigquery.TimePartitioning(field=partition_field)
+            columns = _sqlite_columns(schema)
+            self._connection(_project_of(table_ref)).execute(
+                f'CREATE TABLE "{table_ref}" ({", ".join(f"{_quote(name)} {sql_type}" for name, sql_type in columns)})'
+            )
+            self._project_tables.setdefault(_project_of(table_ref), []).append(table_ref)
+            self._struct_columns.update(name for name, _ in columns if "." in name)
+            now = datetime.now(timezone.utc)
+            self._tables[table_ref] = {
+                'table': table,
+                'row_count': row_count,
+                'last_modified': pd.Timestamp(last_modified_time, tz='UTC') if last_modified_time else now,
+                'created': now,
+            }
+            if rows:
+                self._insert(table_ref, rows, touch=last_modified_time is None)
+            return table
+
+    def add_table_grant(self, table_ref, role, grantee):
+        """Agrega un binding IAM a nivel tabla (grantee: 'user:x@y.com', 'group:...', ...)."""
+        with self._lock:
+            self._table_grants.setdefault(table_ref, []).append((role, grantee))
+
+    def update_schema(self, table_ref, fields):
+        """Reemplaza el esquema de una tabla agregando las columnas nuevas (update_table con ['schema'])."""
+        with self._lock:
+            entry = self._tables[table_ref]
+            connection = self._connection(_project_of(table_ref))
+            # get_table entrega el objeto del catálogo, así que el esquema ya puede venir modificado
+            existing = {row[1] for row in connection.execute(f'PRAGMA table_info("{table_ref}")')}
+            for name, sql_type in _sqlite_columns(fields):
+                if name not in existing:
+                    connection.execute(f'ALTER TABLE "{table_ref}" ADD COLUMN {_quote(name)} {sql_type}')
+            entry['table'].schema = list(fields)
+            self._struct_columns.update(name for name, _ in _sqlite_columns(fields) if "." in name)
+            return entry['table']
+
+    def _insert(self, table_ref, rows, touch=True):
+        """Inserta filas (dicts) en una tabla existente. Retorna errores estilo insert_rows_json."""
+        entry = self._tables[table_ref]
+        schema = entry['table'].schema
+        names = [name for name, _ in _sqlite_columns(schema)]
+        known = {field.name for field in schema}
+        errors = []
+        values = []
+        for index, row in enumerate(rows):
+            unknown = set(row) - known
+            if unknown:
+                errors.append({'index': index, 'errors': [{'reason': 'invalid', 'message': f"no such field: {', '.join(sorted(unknown))}"}]})
+                continue
+            values.append(_flatten_row(schema, row))
+        if values:
+            placeholders = ", ".join("?" for _ in names)
+            quoted = ", ".join(f'"{name}"' for name in names)
+            self._connection(_project_of(table_ref)).executemany(
+                f'INSERT INTO "{table_ref}" ({quoted}) VALUES ({placeholders})', values
+            )
+            if touch:
+                entry['last_modified'] = datetime.now(timezone.utc)
+        return errors
+
+    def drop_table(self, table_ref):
+        """Elimina una tabla del catálogo y de su base."""
+        with self._lock:
+            self._connection(_project_of(table_ref)).execute(f'DROP TABLE "{table_ref}"')
+            del self._tables[table_ref]
+            self._table_grants.pop(table_ref, None)
+            self._project_tables[_project_of(table_ref)].remove(table_ref)
+
+    # ----- Simulación -----
+
+    def _latency(self, sql):
+        if callable(self.latency):
+            return float(self.latency(sql))
+        if isinstance(self.latency, (tuple, list)):
+            return self._random.uniform(*self.latency)
+        return float(self.latency or 0.0)
+
+    def _injected_error(self, operation):
+        """Excepción a lanzar para la operación (fail_on o error_rate), o None."""
+        for pattern, error in self.fail_on.items():
+            if pattern.search(operation):
+                self.stats['errors'] += 1
+                return error(f"Injected failure: {operation[:80]}") if isinstance(error, type) else error
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.stats['errors'] += 1
+            return self.error_factory()
+        return None
+
+    def api_call(self, operation):
+        """Latencia y fallos de una llamada de metadata."""
+        self.stats['api_calls'] += 1
+        if self.api_latency:
+            time.sleep(self.api_latency)
+        error = self._injected_error(operation)
+        if error is not None:
+            raise error
+
+    # ----- Vistas de metadata -----
+
+    def _materialize_metadata_view(self, connection, ref):
+        """Crea (TEMP, en `connection`) la vista de metadata `ref` desde el catálogo."""
+        for view in _METADATA_VIEWS:
+            if ref.endswith("." + view):
+                scope = ref[: -len(view) - 1]
+                break
+        else:
+            return False
+
+        project, _, dataset = scope.partition(".")
+        if dataset.startswith("region-"):
+            dataset = None  # Región: todos los datasets del proyecto
+        entries = [
+            (table_ref, self._tables[table_ref]) for table_ref in self._project_tables.get(project, [])
+            if dataset is None or table_ref.split(".")[1] == dataset
+        ]
+
+        if view == "__TABLES__":
+            columns = ["project_id", "dataset_id", "table_id", "creation_time", "last_modified_time",
+                       "row_count", "size_bytes", "type"]
+            rows = []
+            for table_ref, entry in entries:
+                row_count = self._row_count(table_ref)
+                rows.append((*table_ref.split("."), int(entry['created'].timestamp() * 1000),
+                             int(pd.Timestamp(entry['last_modified']).timestamp() * 1000),
+                             row_count, row_count * BYTES_PER_VALUE * len(entry['table'].schema), 1))
+        elif view == "INFORMATION_SCHEMA.TABLES":
+            columns = ["table_catalog", "table_schema", "table_name", "table_type", "creation_time"]
+            rows = [(*table_ref.split("."), "BASE TABLE", _to_timestamp_text(entry['created'])) for table_ref, entry in entries]
+        elif view == "INFORMATION_SCHEMA.TABLE_STORAGE":
+            columns = ["project_id", "table_schema", "table_name", "total_rows", "total_logical_bytes", "deleted"]
+            rows = []
+            for table_ref, entry in entries:
+                row_count = self._row_count(table_ref)
+                rows.append((*table_ref.split("."), row_count,
+                             row_count * BYTES_PER_VALUE * len(entry['table'].schema), 0))
+        elif view == "INFORMATION_SCHEMA.OBJECT_PRIVILEGES":
+            columns = ["object_catalog", "object_schema", "object_name", "object_type", "privilege_type", "grantee"]
+            rows = []
+            for dataset_ref, dataset_obj in self._datasets.items():
+                if _project_of(dataset_ref) != project or (dataset is not None and dataset_ref.split(".")[1] != dataset):
+                    continue
+                for access in dataset_obj.access_entries:
+                    prefix = _GRANTEE_PREFIXES.get(access.entity_type)
+                    if prefix is None or access.role is None:
+                        continue  # Vistas/rutinas autorizadas no son grants
+                    if prefix == "user" and access.entity_id.endswith(".gserviceaccount.com"):
+                        prefix = "serviceAccount"
+                    rows.append((project, None, dataset_ref.split(".")[1], "SCHEMA",
+                                 _LEGACY_ROLES.get(access.role, access.role), f"{prefix}:{access.entity_id}"))
+            for table_ref, entry in entries:
+                object_type = "VIEW" if entry['table'].table_type == "VIEW" else "TABLE"
+                rows.extend((*table_ref.split("."), object_type, role, grantee)
+                            for role, grantee in self._table_grants.get(table_ref, []))
+        elif view == "INFORMATION_SCHEMA.SCHEMATA":
+            columns = ["catalog_name", "schema_name", "location"]
+            rows = [
+                (*dataset_ref.split("."), "US") for dataset_ref in self._datasets
+                if _project_of(dataset_ref) == project and (dataset is None or dataset_ref.split(".")[1] == dataset)
+            ]
+        else:
+            columns = ["table_catalog", "table_schema", "table_name", "partition_id", "total_rows", "last_modified_time"]
+            rows = []
+            for table_ref, entry in entries:
+                rows.extend((*table_ref.split("."), partition_id, total_rows, _to_timestamp_text(entry['last_modified']))
+                            for partition_id, total_rows in self._partitions(table_ref, entry))
+
+        connection.execute(f'DROP TABLE IF EXISTS temp."{ref}"')
+        connection.execute(f'CREATE TEMP TABLE "{ref}" ({", ".join(columns)})')
+        if rows:
+            connection.executemany(f'INSERT INTO temp."{ref}" VALUES ({", ".join("?" for _ in columns)})', rows)
+        return True
+
+    def _row_count(self, table_ref):
+        actual = self._connection(_project_of(table_ref)).execute(f'SELECT COUNT(*) FROM "{table_ref}"').fetchone()[0]
+        return max(actual, self._tables[table_ref]['row_count'] or 0)
+
+    def _partitions(self, table_ref, entry):
+        partitioning = entry['table'].time_partitioning
+        if partitioning is None or not partitioning.field:
+            return [("__UNPARTITIONED__", self._row_count(table_ref))]
+        return self._connection(_project_of(table_ref)).execute(
+            f'SELECT REPLACE(SUBSTR("{partitioning.field}", 1, 10), \'-\', \'\'), COUNT(*) '
+            f'FROM "{table_ref}" GROUP BY 1'
+        ).fetchall()
+
+    def _table_columns(self, ref):
+        """Columnas de una tabla del catálogo (None si no existe)."""
+        entry = self._tables.get(ref)
+        return None if entry is None else [field.name for field in entry['table'].schema]
+
+    def _column_types(self, refs):
+        """{columna: tipo} de las tablas referenciadas (para tipar el resultado)."""
+        types = {}
+        for ref in refs:
+            entry = self._tables.get(ref)
+            if entry is None:
+                continue
+            for field in entry['table'].schema:
+                types.setdefault(field.name, field.field_type.upper())
+        return types
+
+    # ----- Ejecución -----
+
+    def run_query(self, project, sql, job_config=None):
+        """Ejecuta una query y retorna un FakeQueryJob (los errores se lanzan en result())."""
+        self.stats['queries'] += 1
+        latency = self._latency(sql)
+        dry_run = bool(getattr(job_config, "dry_run", False))
+        maximum_bytes_billed = getattr(job_config, "maximum_bytes_billed", None)
+
+        error = self._injected_error(sql)
+        if error is not None:
+            if dry_run:
+                raise error
+            return FakeQueryJob(project, error=error, latency=latency)
+
+        with self._lock:
+            try:
+                job = self._execute(project, sql, job_config, latency, dry_run, maximum_bytes_billed)
+            except (NotFound, BadRequest) as e:
+                job = FakeQueryJob(project, error=e, latency=latency)
+            except sqlite3.OperationalError as e:
+                message = str(e)
+                table_match = re.match(r"no such table: (.+)", message)
+                if table_match:
+                    error = NotFound(f"Not found: Table {table_match.group(1)} was not found")
+                elif "no such column" in message:
+                    error = BadRequest(f"Unrecognized name: {message.split(': ', 1)[-1]}")
+                else:
+                    error = BadRequest(f"{message} (fake)")
+                job = FakeQueryJob(project, error=error, latency=latency)
+            except sqlite3.Error as e:
+                job = FakeQueryJob(project, error=BadRequest(str(e)), latency=latency)
+            if dry_run and job._error is not None:
+                # BigQuery rechaza el dry run en la misma llamada
+                raise job._error
+            self._jobs.append(job)
+        return job
+
+    def _execute(self, project, sql, job_config, latency, dry_run, maximum_bytes_billed):
+        """Traduce y ejecuta la query en la base del proyecto de sus tablas (llamar con el lock tomado)."""
+        translated, refs = translate_sql(sql, project, self._struct_columns, self._table_columns)
+        table_refs = sorted(ref for ref in refs if ref in self._tables)
+        projects = list(dict.fromkeys(_project_of(ref) for ref in table_refs)) or [project]
+        connection = self._connection(projects[0])
+        for ref in refs:
+            if ref not in self._tables and not self._materialize_metadata_view(connection, ref):
+                raise NotFound(f"Not found: Table {ref} was not found")
+
+        bytes_processed = sum(self._row_count(ref) * BYTES_PER_VALUE for ref in table_refs)
+        if maximum_bytes_billed and bytes_processed > int(maximum_bytes_billed):
+            raise BadRequest(
+                f"Query exceeded limit for bytes billed: {maximum_bytes_billed}. "
+                f"{bytes_processed} or higher required. (bytesBilledLimitExceeded)"
+            )
+
+        # Tablas de otros proyectos: adjuntar su base y calificar la referencia
+        attached = []
+        for index, other in enumerate(projects[1:]):
+            alias = f"p{index}"
+            connection.execute(f"ATTACH DATABASE ? AS {alias}", (self._database_uri(other),))
+            attached.append(alias)
+            for ref in table_refs:
+                if _project_of(ref) == other:
+                    translated = translated.replace(f'"{ref}"', f'{alias}."{ref}"')
+        try:
+            if dry_run:
+                # EXPLAIN compila la query (tablas y columnas) sin ejecutarla
+                connection.execute(f"EXPLAIN {translated}", _query_parameters(job_config))
+                return FakeQueryJob(project, total_bytes_processed=bytes_processed, dry_run=True)
+            cursor = connection.execute(translated, _query_parameters(job_config))
+            if cursor.description is None:
+                self._touch_written(translated)
+                return FakeQueryJob(project, result=FakeRowIterator(pa.table({})), latency=latency,
+                                    total_bytes_processed=bytes_processed, num_dml_affected_rows=cursor.rowcount)
+            names = [column[0] for column in cursor.description]
+            rows = cursor.fetchall()
+        finally:
+            for alias in attached:
+                connection.execute(f"DETACH DATABASE {alias}")
+        result = FakeRowIterator(_arrow_result(names, rows, self._column_types(refs)))
+        return FakeQueryJob(project, result=result, latency=latency, total_bytes_processed=bytes_processed)
+
+    def _touch_written(self, translated):
+        match = re.match(r'\s*(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM)\s+(?:\w+\.)?"([^"]+)"', translated, flags=re.IGNORECASE)
+        if match and match.group(1) in self._tables:
+            self._tables[match.group(1)]['last_modified'] = datetime.now(timezone.utc)
+
+    def register_job(self, job, explicit_id=False):
+        """Agrega un job al historial; un job_id explícito repetido falla con Conflict (409) como en BigQuery."""
+        with self._lock:
+            if explicit_id:
+                key = (job.project, job.job_id)
+                if key in self._jobs_by_id:
+                    raise Conflict(f"Already Exists: Job {job.project}:{job.job_id}")
+                self._jobs_by_id[key] = job
+            self._jobs.append(job)
+        return job
+
+    def get_job(self, project, job_id):
+        with self._lock:
+            job = self._jobs_by_id.get((project, job_id))
+        if job is None:
+            raise NotFound(f"Not found: Job {project}:{job_id}")
+        return job
+
+    def list_jobs(self, project=None, state_filter=None, min_creation_time=None, max_creation_time=None):
+        with self._lock:
+            jobs = list(self._jobs)
+        return [
+            job for job in jobs
+            if (project is None or job.project == project)
+            and (min_creation_time is None or job.created >= min_creation_time)
+            and (max_creation_time is None or job.created <= max_creation_time)
+            and (state_filter is None or job.state.lower() == state_filter.lower())
+        ]
+
+
+def _project_of(table_ref):
+    return table_ref.split(".", 1)[0]
+
+
+def _quote(name):
+    return f'"{name}"'
+
+
+def _schema_field(spec):
+    """dict del fixture → SchemaField (con subcampos de RECORD)."""
+    return bigquery.SchemaField(
+        spec["name"], spec.get("type", "STRING"), mode=spec.get("mode", "NULLABLE"),
+        fields=[_schema_field(sub) for sub in spec.get("fields", [])]
+    )
+
+
+def _sqlite_columns(schema):
+    """Columnas SQLite de un esquema: los RECORD se guardan como JSON y además aplanados (padre.hijo)."""
+    columns = []
+    for field in schema:
+        columns.append((field.name, _SQLITE_TYPES.get(field.field_type.upper(), "TEXT")))
+        if field.field_type.upper() in ("RECORD", "STRUCT"):
+            columns.extend((f"{field.name}.{sub.name}", _SQLITE_TYPES.get(sub.field_type.upper(), "TEXT"))
+                           for sub in field.fields)
+    return columns
+
+
+def _flatten_row(schema, row):
+    values = []
+    for field in schema:
+        value = row.get(field.name)
+        values.append(_storage_value(field, value))
+        if field.field_type.upper() in ("RECORD", "STRUCT"):
+            for sub in field.fields:
+                values.append(_storage_value(sub, (value or {}).get(sub.name)))
+    return values
+
+
+def _arrow_result(names, rows, column_types):
+    """Filas SQLite → pyarrow.Table, tipando TIMESTAMP/BOOL por esquema o por forma del valor."""
+    columns = {}
+    for index, name in enumerate(names):
+        if name == "_qualify":
+            continue
+        values = [row[index] for row in rows]
+        declared = column_types.get(name)
+        non_null = [value for value in values if value is not None]
+        if declared in ("TIMESTAMP", "DATETIME") or (
+            non_null and all(isinstance(value, str) and _TIMESTAMP_PATTERN.match(value) for value in non_null)
+        ):
+            columns[name] = pa.array(
+                [None if value is None else pd.Timestamp(value).tz_convert('UTC').to_pydatetime() for value in values],
+                type=pa.timestamp('us', tz='UTC')
+            )
+        elif declared in ("BOOL", "BOOLEAN") and all(isinstance(value, int) for value in non_null):
+            columns[name] = pa.array([None if value is None else bool(value) for value in values], type=pa.bool_())
+        else:
+            columns[name] = pa.array(values)
+    # Nombres repetidos (ej. dos columnas sin alias) se desambiguan como BigQuery (_f1, ...)
+    if len(set(columns)) < len(names):
+        return pa.table({f"{name}_{index}" if names.count(name) > 1 else name: pa.array([row[index] for row in rows])
+                         for index, name in enumerate(names)})
+    return pa.table(columns)
+
+
+# ========== CLIENTE ==========
+
+class FakeBigQueryClient:
+    """
+    Cliente con la interfaz de bigquery.Client (subconjunto) sobre un FakeBigQueryBackend.
+    """
+
+    def __init__(self, backend, project=None):
+        self.backend = backend
+        self.project = project or "fake-project"
+
+    def _table_ref(self, table):
+        ref = table if isinstance(table, str) else str(getattr(table, "reference", table)).replace(":", ".")
+        if hasattr(table, "project") and hasattr(table, "dataset_id") and hasattr(table, "table_id"):
+            ref = f"{table.project}.{table.dataset_id}.{table.table_id}"
+        return ref if ref.count(".") == 2 else f"{self.project}.{ref}"
+
+    def _dataset_ref(self, dataset):
+        if hasattr(dataset, "project") and hasattr(dataset, "dataset_id"):
+            return f"{dataset.project}.{dataset.dataset_id}"
+        ref = str(dataset)
+        return ref if "." in ref else f"{self.project}.{ref}"
+
+    def query(self, query, job_config=None, **kwargs):
+        return self.backend.run_query(self.project, query, job_config)
+
+    def get_table(self, table):
+        ref = self._table_ref(table)
+        self.backend.api_call(f"get_table:{ref}")
+        with self.backend._lock:
+            entry = self.backend._tables.get(ref)
+            if entry is None:
+                raise NotFound(f"Not found: Table {ref}")
+            entry['table']._properties["numRows"] = str(self.backend._row_count(ref))
+            return entry['table']
+
+    def get_dataset(self, dataset):
+        ref = self._dataset_ref(dataset)
+        self.backend.api_call(f"get_dataset:{ref}")
+        with self.backend._lock:
+            if ref not in self.backend._datasets:
+                raise NotFound(f"Not found: Dataset {ref}")
+            return self.backend._datasets[ref]
+
+    def list_datasets(self, project=None, **kwargs):
+        project = project or self.project
+        self.backend.api_call(f"list_datasets:{project}")
+        with self.backend._lock:
+            return [dataset for ref, dataset in sorted(self.backend._datasets.items()) if ref.split(".")[0] == project]
+
+    def list_tables(self, dataset, **kwargs):
+        ref = self._dataset_ref(dataset)
+        self.backend.api_call(f"list_tables:{ref}")
+        with self.backend._lock:
+            if ref not in self.backend._datasets:
+                raise NotFound(f"Not found: Dataset {ref}")
+            return [entry['table'] for table_ref, entry in sorted(self.backend._tables.items())
+                    if table_ref.rsplit(".", 1)[0] == ref]
+
+    def create_table(self, table, exists_ok=False, **kwargs):
+        if isinstance(table, str):
+            table = bigquery.Table(self._table_ref(table))
+        ref = self._table_ref(table)
+        self.backend.api_call(f"create_table:{ref}")
+        partitioning = table.time_partitioning
+        created = self.backend.add_table(
+            ref, list(table.schema), partition_field=partitioning.field if partitioning else None, exists_ok=exists_ok
+        )
+        created.clustering_fields = table.clustering_fields
+        return created
+
+    def update_table(self, table, fields, **kwargs):
+        ref = self._table_ref(table)
+        self.backend.api_call(f"update_table:{ref}")
+        if list(fields) != ["schema"]:
+            raise BadRequest(f"update_table solo soporta ['schema'] (fake): {fields}")
+        with self.backend._lock:
+            if ref not in self.backend._tables:
+                raise NotFound(f"Not found: Table {ref}")
+            return self.backend.update_schema(ref, list(table.schema))
+
+    def insert_rows_json(self, table, json_rows, **kwargs):
+        ref = self._table_ref(table)
+        # Igual que el cliente real: las filas deben ser serializables a JSON (sin date/datetime)
+        json.dumps(json_rows)
+        self.backend.api_call(f"insert_rows_json:{ref}")
+        with self.backend._lock:
+            if ref not in self.backend._tables:
+                raise NotFound(f"Not found: Table {ref}")
+            return self.backend._insert(ref, json_rows)
+
+    def _load(self, ref, records, schema, job_config, job_id):
+        """Load job atómico sobre `records` (dicts); crea la tabla con `schema` si no existe."""
+        with self.backend._lock:
+            if job_id is not None and (self.project, job_id) in self.backend._jobs_by_id:
+                raise Conflict(f"Already Exists: Job {self.project}:{job_id}")
+            truncate = getattr(job_config, "write_disposition", None) == bigquery.WriteDisposition.WRITE_TRUNCATE
+            if ref in self.backend._tables and truncate:
+                self.backend.drop_table(ref)
+            if ref not in self.backend._tables:
+                self.backend.add_table(ref, schema)
+            known = {field.name for field in self.backend._tables[ref]['table'].schema}
+            unknown = {name for record in records for name in record} - known
+            if unknown:
+                # Los load jobs son atómicos: con columnas desconocidas no se escribe nada
+                error = BadRequest(f"Provided Schema does not match Table {ref}: no such field {', '.join(sorted(unknown))}")
+                job = FakeQueryJob(self.project, error=error, job_id=job_id)
+            else:
+                self.backend._insert(ref, records)
+                job = FakeQueryJob(self.project, latency=0.0, job_id=job_id)
+            return self.backend.register_job(job, explicit_id=job_id is not None)
+
+    def load_table_from_dataframe(self, dataframe, destination, job_config=None, job_id=None, **kwargs):
+        ref = self._table_ref(destination)
+        self.backend.api_call(f"load_table_from_dataframe:{ref}")
+        schema = list(getattr(job_config, "schema", None) or []) or [
+            bigquery.SchemaField(name, _arrow_to_bq_type(field.type))
+            for name, field in zip(dataframe.columns, pa.Table.from_pandas(dataframe, preserve_index=False).schema)
+        ]
+        records = dataframe.astype(object).where(dataframe.notna(), None).to_dict(orient="records")
+        return self._load(ref, records, schema, job_config, job_id)
+
+    def load_table_from_json(self, json_rows, destination, job_config=None, job_id=None, **kwargs):
+        ref = self._table_ref(destination)
+        # Igual que el cliente real: cada fila se serializa con json.dumps
+        json_rows = [json.loads(json.dumps(row)) for row in json_rows]
+        self.backend.api_call(f"load_table_from_json:{ref}")
+        schema = list(getattr(job_config, "schema", None) or [])
+        if not schema and ref not in self.backend._tables:
+            raise BadRequest(f"load_table_from_json sin schema no soportado (fake): {ref}")
+        return self._load(ref, json_rows, schema, job_config, job_id)
+
+    def get_job(self, job_id, project=None, **kwargs):
+        self.backend.api_call(f"get_job:{job_id}")
+        return self.backend.get_job(project or self.project, job_id)
+
+    def list_jobs(self, project=None, state_filter=None, min_creation_time=None, max_creation_time=None, **kwargs):
+        return self.backend.list_jobs(project or self.project, state_filter, min_creation_time, max_creation_time)
+
+
+# ========== FIXTURE DE FLOTA SINTÉTICA ==========
+
+def build_fleet_fixture(companies=50, tables=40, rows_per_table=2, environment_project="platform-partners-qua",
+                        missing_table_rate=0.02, include_bronze=True, seed=0, now=None):
+    """
+    Genera un fixture con N compañías × M tablas bronze y las tablas centrales del monitor.
+
+    Incluye settings.companies (en environment_project, con access entries), metadata_consolidated_tables,
+    companies_consolidated, etl_monitoring_snapshot (una corrida) y un proyecto por
+    compañía con dataset bronze (con access entries para el monitor IAM).
+
+    Args:
+        companies: Número de compañías (cada una en su propio proyecto)
+        tables: Número de tablas bronze por compañía
+        rows_per_table: Filas reales por tabla (row_count "virtual" aleatorio aparte)
+        environment_project: Proyecto del ambiente con settings.companies
+        missing_table_rate: Fracción de tablas bronze que no existen
+        include_bronze: False = sin proyectos de compañía (solo tablas centrales, para benchmarks del dashboard)
+        seed: Semilla
+        now: Momento de referencia (default: ahora)
+
+    Retorna:
+        dict (ver FakeBigQueryBackend.from_fixture)
+    """
+    rng = random.Random(seed)
+    now = pd.Timestamp(now, tz='UTC') if now is not None else pd.Timestamp.now(tz='UTC')
+    table_names = [f"table_{index:02d}" for index in range(tables)]
+    statuses = ["SUCCESS"] * 8 + ["FAILED", "PARTIAL"]
+    fixture = {"datasets": {}, "tables": {}}
+
+    company_rows = []
+    consolidated_rows = []
+    snapshot_rows = []
+    for index in range(companies):
+        company_id = 1000 + index
+        project_id = f"company-{company_id}"
+        company_rows.append({
+            "company_id": company_id,
+            "company_name": f"Company {company_id}",
+            "company_project_id": project_id,
+            "company_fivetran_status": True,
+        })
+        if include_bronze:
+            fixture["datasets"][f"{project_id}.bronze"] = {"access": [
+                {"role": "OWNER", "entity_type": "userByEmail", "entity_id": "etl-servicetitan@fake.iam.gserviceaccount.com"},
+                {"role": "READER", "entity_type": "groupByEmail", "entity_id": f"analysts-{company_id % 7}@fake.com"},
+                {"role": "WRITER", "entity_type": "specialGroup", "entity_id": "projectWriters"},
+            ]}
+        for table_name in table_names:
+            max_sync = now - pd.Timedelta(minutes=rng.randint(5, 72 * 60))
+            row_count = rng.randint(1_000, 5_000_000)
+            consolidated_rows.append({
+                "company_id": company_id, "table_name": table_name,
+                "last_etl_synced": max_sync.isoformat(), "row_count": row_count,
+            })
+            snapshot_rows.append({
+                "company_id": str(company_id), "endpoint_name": table_name, "max_sync": max_sync.isoformat(),
+                "actual_rows": rng.randint(0, 50_000), "actual_duration": round(rng.uniform(1, 600), 1),
+                "actual_status": rng.choice(statuses), "last_rows": rng.randint(0, 50_000),
+                "last_duration": round(rng.uniform(1, 600), 1), "last_status": rng.choice(statuses),
+                "updated_at": now.isoformat(),
+            })
+            if not include_bronze or rng.random() < missing_table_rate:
+                continue
+            fixture["tables"][f"{project_id}.bronze.{table_name}"] = {
+                "schema": [{"name": "id", "type": "INT64"}, {"name": "_etl_synced", "type": "TIMESTAMP"}],
+                "rows": [
+                    {"id": row, "_etl_synced": (max_sync - pd.Timedelta(minutes=row)).isoformat()}
+                    for row in range(rows_per_table)
+                ],
+                "row_count": row_count,
+                "last_modified_time": max_sync.isoformat(),
+            }
+            if table_name == table_names[0]:
+                fixture["tables"][f"{project_id}.bronze.{table_name}"]["grants"] = [
+                    {"role": "roles/bigquery.dataViewer", "grantee": f"user:auditor-{company_id % 3}@fake.com"},
+                ]
+
+    fixture["datasets"][f"{environment_project}.settings"] = {"access": [
+        {"role": "OWNER", "entity_type": "specialGroup", "entity_id": "projectOwners"},
+        {"role": "READER", "entity_type": "userByEmail", "entity_id": "streamlit-monitor@fake.iam.gserviceaccount.com"},
+    ]}
+    fixture["tables"][f"{environment_project}.settings.companies"] = {
+        "schema": [
+            {"name": "company_id", "type": "INT64"},
+            {"name": "company_name", "type": "STRING"},
+            {"name": "company_project_id", "type": "STRING"},
+            {"name": "company_fivetran_status", "type": "BOOL"},
+        ],
+        "rows": company_rows,
+    }
+    fixture["tables"]["pph-central.management.metadata_consolidated_tables"] = {
+        "schema": [
+            {"name": "table_name", "type": "STRING"},
+            {"name": "endpoint", "type": "RECORD", "fields": [{"name": "name", "type": "STRING"}]},
+            {"name": "active", "type": "BOOL"},
+            {"name": "silver_use_bronze", "type": "BOOL"},
+        ],
+        "rows": [
+            {"table_name": table_name, "endpoint": {"name": table_name}, "active": True, "silver_use_bronze": True}
+            for table_name in table_names
+        ],
+    }
+    fixture["tables"]["pph-central.settings.companies_consolidated"] = {
+        "schema": [
+            {"name": "company_id", "type": "INT64"},
+            {"name": "table_name", "type": "STRING"},
+            {"name": "last_etl_synced", "type": "TIMESTAMP"},
+            {"name": "row_count", "type": "INT64"},
+            {"name": "updated_at", "type": "TIMESTAMP"},
+        ],
+        "rows": consolidated_rows,
+    }
+    fixture["tables"]["pph-central.management.etl_monitoring_snapshot"] = {
+        "schema": [
+            {"name": "company_id", "type": "STRING"},
+            {"name": "endpoint_name", "type": "STRING"},
+            {"name": "max_sync", "type": "TIMESTAMP"},
+            {"name": "actual_rows", "type": "INT64"},
+            {"name": "actual_duration", "type": "FLOAT64"},
+            {"name": "actual_status", "type": "STRING"},
+            {"name": "last_rows", "type": "INT64"},
+            {"name": "last_duration", "type": "FLOAT64"},
+            {"name": "last_status", "type": "STRING"},
+            {"name": "updated_at", "type": "TIMESTAMP"},
+        ],
+        "rows": snapshot_rows,
+        "partition_field": "updated_at",
+    }
+    return fixture
+
+
+_env_backend = None
+_env_backend_lock = threading.Lock()
+
+
+def create_backend_from_env():
+    """
+    Backend del proceso (singleton) configurado por variables de entorno (BQ_BACKEND=fake):
+    BQ_FAKE_FIXTURE (JSON; vacío = flota de 50 × 40), BQ_FAKE_LATENCY, BQ_FAKE_ERROR_RATE.
+    """
+    global _env_backend
+    with _env_backend_lock:
+        if _env_backend is None:
+            fixture = BQ_FAKE_FIXTURE or build_fleet_fixture()
+            _env_backend = FakeBigQueryBackend.from_fixture(
+                fixture, latency=BQ_FAKE_LATENCY, error_rate=BQ_FAKE_ERROR_RATE
+            )
+        return _env_backend
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera un fixture de flota sintética para FakeBigQueryClient")
+    parser.add_argument("--companies", type=int, default=50)
+    parser.add_argument("--tables", type=int, default=40)
+    parser.add_argument("--rows-per-table", type=int, default=2)
+    parser.add_argument("--environment-project", default="platform-partners-qua")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", required=True, help="Ruta del JSON a escribir")
+    args = parser.parse_args(argv)
+
+    fixture = build_fleet_fixture(args.companies, args.tables, args.rows_per_table,
+                                  args.environment_project, seed=args.seed)
+    with open(args.out, "w") as f:
+        json.dump(fixture, f)
+    print(f"✅ Fixture: {args.companies} compañías × {args.tables} tablas → {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,10 @@ import os
 from typing import Dict, List, Tuple, Set
 from collections import defaultdict
 
+from bq_client_pool import BigQueryClientPool
+from table_inventory import load_table_inventory
+from object_privileges import DEFAULT_ACCESS_BACKEND, load_object_privileges
+
 # ========== CONFIGURACIÓN ==========
 st.set_page_config(
     page_title="IAM Access Monitor - BigQuery",
@@ -93,9 +97,13 @@ def detect_environment() -> str:
     return 'dev'
 
 @st.cache_resource
-def get_bigquery_client():
-    """Obtiene cliente de BigQuery."""
-    return bigquery.Client()
+def get_client_pool():
+    """Pool de clientes BigQuery compartido por todas las sesiones del proceso."""
+    return BigQueryClientPool()
+
+def get_bigquery_client(project_id: str = None) -> bigquery.Client:
+    """Obtiene el cliente BigQuery (compartido) de un proyecto."""
+    return get_client_pool().get_client(project_id)
 
 @st.cache_resource
 def get_iam_client():
@@ -119,7 +127,7 @@ def get_project_iam_policy(project_id: str) -> Dict:
         Dict con bindings de IAM
     """
     try:
-        client = bigquery.Client(project=project_id)
+        client = get_bigquery_client(project_id)
         
         # Crear una consulta para obtener información de datasets
         datasets = []
@@ -150,7 +158,7 @@ def get_dataset_iam_policy(project_id: str, dataset_id: str) -> Dict:
         Dict con información de acceso
     """
     try:
-        client = bigquery.Client(project=project_id)
+        client = get_bigquery_client(project_id)
         dataset = client.get_dataset(f"{project_id}.{dataset_id}")
         
         # Obtener acceso del dataset
@@ -164,11 +172,25 @@ def get_dataset_iam_policy(project_id: str, dataset_id: str) -> Dict:
     except Exception as e:
         return {"project_id": project_id, "dataset_id": dataset_id, "access_entries": []}
 
+@st.cache_data(ttl=3600)
+def get_project_table_inventory(project_id: str) -> Dict[str, Dict]:
+    """
+    Inventario de tablas de todos los datasets del proyecto (una query a INFORMATION_SCHEMA).
+    
+    Returns:
+        {dataset_id: {'table_count', 'view_count', 'tables', 'total_rows', 'total_logical_bytes'}}
+        ({} si no se pudo leer)
+    """
+    return load_table_inventory(get_bigquery_client(project_id), project_id)
+
 @st.cache_data(ttl=3600)
 def get_dataset_tables(project_id: str, dataset_id: str) -> List[str]:
     """
     Obtiene lista de tablas en un dataset.
     
+    Usa el inventario del proyecto; si el dataset no está (otra región o
+    inventario no disponible) recurre a list_tables.
+    
     Args:
         project_id: ID del proyecto
         dataset_id: ID del dataset
@@ -176,8 +198,12 @@ def get_dataset_tables(project_id: str, dataset_id: str) -> List[str]:
     Returns:
         Lista de IDs de tablas
     """
+    inventory = get_project_table_inventory(project_id)
+    if dataset_id in inventory:
+        return inventory[dataset_id]["tables"]
+    
     try:
-        client = bigquery.Client(project=project_id)
+        client = get_bigquery_client(project_id)
         tables = []
         for table in client.list_tables(dataset_id):
             tables.append(table.table_id)
@@ -185,18 +211,36 @@ def get_dataset_tables(project_id: str, dataset_id: str) -> List[str]:
     except Exception:
         return []
 
+@st.cache_data(ttl=3600)
+def get_project_object_privileges(project_id: str) -> List[Dict]:
+    """
+    Grants de datasets y tablas del proyecto en una query a INFORMATION_SCHEMA.OBJECT_PRIVILEGES.
+    
+    Returns:
+        Lista de grants normalizados (ver object_privileges); [] si no se pudo leer
+    """
+    datasets = get_project_iam_policy(project_id)["datasets"]
+    inventory = get_project_table_inventory(project_id)
+    object_names = datasets + [table for dataset in inventory.values() for table in dataset["tables"]]
+    return load_object_privileges(get_bigquery_client(project_id), project_id, object_names) or []
+
 def build_access_matrix(
     project_id: str,
     selected_resources: List[str],
-    resource_type: str
+    resource_type: str,
+    include_inherited: bool = False
 ) -> Tuple[pd.DataFrame, Dict]:
     """
     Construye una matriz de acceso: Roles (filas) vs Usuarios (columnas).
     
+    Los datasets se leen con get_dataset (o de OBJECT_PRIVILEGES si
+    IAM_ACCESS_BACKEND=object_privileges); las tablas siempre de OBJECT_PRIVILEGES.
+    
     Args:
         project_id: ID del proyecto
-        selected_resources: Lista de recursos seleccionados
+        selected_resources: Lista de recursos seleccionados (tablas como 'dataset.tabla')
         resource_type: Tipo de recurso ('Dataset', 'Table', etc)
+        include_inherited: En tablas, incluir los grants heredados del dataset
         
     Returns:
         Tupla con (DataFrame de matriz, diccionario de roles por recurso)
@@ -206,9 +250,29 @@ def build_access_matrix(
     all_users = set()
     all_roles = set()
     
-    client = bigquery.Client(project=project_id)
+    client = get_bigquery_client(project_id)
     
-    if resource_type == "Dataset":
+    if resource_type == "Table" or (resource_type == "Dataset" and DEFAULT_ACCESS_BACKEND == "object_privileges"):
+        selected = set(selected_resources)
+        for privilege in get_project_object_privileges(project_id):
+            if resource_type == "Dataset":
+                resources = [privilege["dataset_id"]] if privilege["table_id"] is None else []
+            elif privilege["table_id"] is not None:
+                resources = [f"{privilege['dataset_id']}.{privilege['table_id']}"]
+            elif include_inherited:
+                resources = [resource for resource in selected_resources
+                             if resource.split(".", 1)[0] == privilege["dataset_id"]]
+            else:
+                resources = []
+            
+            user_id = privilege["principal_email"] or privilege["special_group"]
+            for resource in resources:
+                if resource in selected:
+                    roles_dict[resource][privilege["role"]].append(user_id)
+                    all_users.add(user_id)
+                    all_roles.add(privilege["role"])
+    
+    elif resource_type == "Dataset":
         for dataset_id in selected_resources:
             try:
                 dataset = client.get_dataset(f"{project_id}.{dataset_id}")
@@ -320,7 +384,7 @@ def main():
     project_id = selected_projects[0]
     
     try:
-        client = bigquery.Client(project=project_id)
+        client = get_bigquery_client(project_id)
         
         if resource_type == "Dataset":
             st.subheader("Datasets Disponibles")
@@ -423,8 +487,93 @@ def main():
                 else:
                     st.warning("No se pudieron construir la matriz. Verifica los permisos.")
         
+        elif resource_type == "Table":
+            st.subheader("Tablas Disponibles")
+            
+            datasets = get_project_iam_policy(project_id)["datasets"]
+            if not datasets:
+                st.info("No hay datasets disponibles en este proyecto")
+                return
+            
+            dataset_id = st.selectbox("Dataset:", options=datasets)
+            tables = get_dataset_tables(project_id, dataset_id)
+            if not tables:
+                st.info(f"El dataset {dataset_id} no tiene tablas")
+                return
+            
+            selected_tables = st.multiselect(
+                f"Selecciona tablas a analizar ({len(tables)} disponibles):",
+                options=tables,
+                default=tables[:min(5, len(tables))],
+                help="Permisos a nivel tabla desde INFORMATION_SCHEMA.OBJECT_PRIVILEGES"
+            )
+            
+            if selected_tables:
+                resources = [f"{dataset_id}.{table_id}" for table_id in selected_tables]
+                with st.spinner("Construyendo matriz de acceso..."):
+                    df_matrix, roles_dict = build_access_matrix(
+                        project_id,
+                        resources,
+                        resource_type,
+                        include_inherited=show_inherited
+                    )
+                
+                if not df_matrix.empty:
+                    st.write("")
+                    stats_col1, stats_col2, stats_col3 = st.columns(3)
+                    
+                    with stats_col1:
+                        st.metric("Total Tablas", len(selected_tables))
+                    
+                    with stats_col2:
+                        st.metric("Usuarios Únicos", df_matrix.shape[1])
+                    
+                    with stats_col3:
+                        own_grants = {
+                            privilege["table_id"] for privilege in get_project_object_privileges(project_id)
+                            if privilege["dataset_id"] == dataset_id and privilege["table_id"] in selected_tables
+                        }
+                        st.metric("Tablas con Grants Propios", len(own_grants))
+                    
+                    st.write("")
+                    st.subheader("Matriz: Tablas vs Usuarios")
+                    
+                    df_display = df_matrix.copy()
+                    df_display.columns = [format_user_display(col) for col in df_display.columns]
+                    
+                    st.dataframe(
+                        df_display,
+                        use_container_width=True,
+                        height=400
+                    )
+                    
+                    csv = df_display.to_csv(index=True)
+                    st.download_button(
+                        label="📥 Descargar como CSV",
+                        data=csv,
+                        file_name=f"iam_access_matrix_tables_{environment}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                        mime="text/csv"
+                    )
+                    
+                    st.write("")
+                    st.subheader("📋 Análisis Detallado por Tabla")
+                    
+                    for resource in resources:
+                        with st.expander(f"📄 {resource}"):
+                            grants = [
+                                {"Rol": role, "Usuario": user_id}
+                                for role, users in roles_dict.get(resource, {}).items()
+                                for user_id in users
+                            ]
+                            if grants:
+                                st.dataframe(pd.DataFrame(grants), use_container_width=True)
+                            else:
+                                st.info("Sin grants específicos")
+                else:
+                    st.warning("Las tablas seleccionadas no tienen grants propios (activa 'Mostrar permisos heredados' para ver los del dataset).")
+        
         else:
-            st.info(f"El tipo de recurso '{resource_type}' aún no está disponible. Comienza con 'Dataset'.")
+            st.info(f"El tipo de recurso '{resource_type}' aún no está disponible. Comienza con 'Dataset' o 'Table'.")
     
     except PermissionDenied:
         st.error(f"❌ Permisos insuficientes en el proyecto {project_id}")
@@ -0,0 +1,146 @@
+"""
+Crawler paralelo de datasets para el snapshot de IAM.
+
+Para cada proyecto lista los datasets una vez y ejecuta las tareas por dataset
+(ej. access entries y conteo de tablas) en paralelo:
+- Un solo cliente por proyecto (pool del proceso, ver bq_client_pool)
+- Un ThreadPoolExecutor global acotado (`max_workers`) y un límite de tareas
+  simultáneas por proyecto (`per_project_limit`)
+- Reintentos con backoff exponencial con jitter ante errores transitorios
+  (cuota/429, 5xx, timeouts, conexión; ver bq_retry); los errores de permisos
+  o NotFound se registran en el resultado del dataset sin reintentar
+
+Uso:
+    crawler = DatasetCrawler(max_workers=16, per_project_limit=8)
+    datasets = crawler.crawl(project_id, {
+        'access_entries': fetch_access_entries,   # fn(client, project_id, dataset_id)
+        'table_count': count_dataset_tables,
+    })
+"""
+
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+
+from bq_client_pool import get_client
+from bq_retry import call_with_retry, DEFAULT_MAX_RETRIES
+
+# Tareas simultáneas en total y por proyecto (el pool HTTP debe ser >= max_workers)
+DEFAULT_CRAWL_MAX_WORKERS = int(os.environ.get("IAM_CRAWL_MAX_WORKERS", "16"))
+DEFAULT_CRAWL_PER_PROJECT = int(os.environ.get("IAM_CRAWL_PER_PROJECT", "8"))
+DEFAULT_CRAWL_MAX_RETRIES = int(os.environ.get("IAM_CRAWL_MAX_RETRIES", str(DEFAULT_MAX_RETRIES)))
+
+logger = logging.getLogger(__name__)
+
+
+class DatasetCrawler:
+    """
+    Ejecuta tareas por dataset en paralelo, con límite por proyecto y reintentos.
+    """
+
+    def __init__(self, max_workers=DEFAULT_CRAWL_MAX_WORKERS, per_project_limit=DEFAULT_CRAWL_PER_PROJECT,
+                 max_retries=DEFAULT_CRAWL_MAX_RETRIES, get_client=get_client):
+        """
+        Args:
+            max_workers: Tareas simultáneas en total
+            per_project_limit: Tareas simultáneas contra un mismo proyecto
+            max_retries: Reintentos por tarea ante errores transitorios
+            get_client: Función get_client(project_id) -> cliente compartido del proyecto
+        """
+        self.max_workers = max_workers
+        self.per_project_limit = per_project_limit
+        self.max_retries = max_retries
+        self._get_client = get_client
+        self._semaphores = {}
+        self._lock = threading.Lock()
+        self._stats = {'tasks': 0, 'retries': 0, 'errors': 0}
+
+    def _semaphore(self, project_id):
+        with self._lock:
+            semaphore = self._semaphores.get(project_id)
+            if semaphore is None:
+                semaphore = self._semaphores[project_id] = threading.BoundedSemaphore(self.per_project_limit)
+            return semaphore
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def run(self, project_id, fn):
+        """Ejecuta fn() respetando el límite del proyecto y reintentando errores transitorios."""
+        def _on_retry(error, attempt):
+            self._count('retries')
+            logger.debug(f"🔁 Reintento {attempt + 1} en {project_id}: {type(error).__name__}")
+
+        with self._semaphore(project_id):
+            self._count('tasks')
+            return call_with_retry(fn, self.max_retries, on_retry=_on_retry)
+
+    def list_dataset_ids(self, project_id):
+        """IDs de los datasets del proyecto (una llamada paginada, con reintentos)."""
+        client = self._get_client(project_id)
+        return self.run(project_id, lambda: [dataset.dataset_id for dataset in client.list_datasets()])
+
+    def crawl(self, project_id, tasks, dataset_ids=None):
+        """
+        Ejecuta cada tarea para cada dataset de un proyecto, en paralelo.
+
+        Args:
+            project_id: ID del proyecto
+            tasks: {nombre: fn(client, project_id, dataset_id)}
+            dataset_ids: Datasets a recorrer (default: todos los del proyecto)
+
+        Retorna:
+            Lista (en el orden de dataset_ids) de dicts:
+                {'dataset_id': str, <nombre>: resultado o None, 'errors': {nombre: excepción}}
+        """
+        return self.crawl_projects({project_id: dataset_ids}, tasks)[project_id]
+
+    def crawl_projects(self, project_datasets, tasks):
+        """
+        Como crawl(), para varios proyectos compartiendo el mismo pool de workers.
+
+        Args:
+            project_datasets: {project_id: [dataset_id, ...] o None (todos)}
+            tasks: {nombre: fn(client, project_id, dataset_id)}
+
+        Retorna:
+            {project_id: lista de resultados por dataset (ver crawl)}
+        """
+        started = time.perf_counter()
+        results = {}
+        jobs = []
+        for project_id, dataset_ids in project_datasets.items():
+            if dataset_ids is None:
+                dataset_ids = self.list_dataset_ids(project_id)
+            results[project_id] = [{'dataset_id': dataset_id, 'errors': {}} for dataset_id in dataset_ids]
+            for entry in results[project_id]:
+                jobs.extend((project_id, entry, name, fn) for name, fn in tasks.items())
+
+        def _task(project_id, entry, name, fn):
+            client = self._get_client(project_id)
+            try:
+                entry[name] = self.run(project_id, lambda: fn(client, project_id, entry['dataset_id']))
+            except Exception as e:
+                self._count('errors')
+                entry[name] = None
+                entry['errors'][name] = e
+
+        if jobs:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.max_workers, len(jobs))) as executor:
+                for future in [executor.submit(_task, *job) for job in jobs]:
+                    future.result()
+
+        datasets = sum(len(entries) for entries in results.values())
+        logger.info(
+            f"🕸️ Crawler: {datasets} datasets, {len(jobs)} tareas en {time.perf_counter() - started:.1f}s "
+            f"({self._stats['retries']} reintentos, {self._stats['errors']} errores)"
+        )
+        return results
+
+    def stats(self):
+        """Contadores acumulados: tareas, reintentos y errores."""
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,142 @@
+"""
+Diff de snapshots de IAM por huella (hash) de cada grant.
+
+Cada grant se identifica por su huella (proyecto, dataset, tabla, principal,
+rol). Con un dict huella → registro por snapshot, el diff es O(n): lo que
+está solo en el actual es ADDED y lo que está solo en el anterior es
+REMOVED. Si un mismo principal sobre el mismo recurso pierde un rol y gana
+otro, el par se reporta como MODIFIED (rol anterior → rol nuevo).
+
+La clave incluye la tabla porque con OBJECT_PRIVILEGES un mismo principal
+puede tener grants propios por tabla (table_id NULL = grant del dataset).
+
+Los datasets cuya lectura falló en el snapshot actual se excluyen de ambos
+lados (exclude_datasets): sin sus grants, el diff los reportaría como REMOVED.
+Los que fallaron en el snapshot anterior se comparan contra el último snapshot
+donde sí se leyeron (select_datasets); si no, todos sus grants serían ADDED.
+
+Uso:
+    previous_records = exclude_datasets(previous_records, failed_datasets)
+    current_records = exclude_datasets(current_records, failed_datasets)
+    changes = diff_snapshots(previous_records, current_records)
+    history = build_history_records(changes, snapshot_timestamp)
+"""
+
+import hashlib
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Campos que identifican un grant y, sin el rol, a un principal sobre un recurso
+GRANT_KEY_FIELDS = ("source_project_id", "dataset_id", "table_id", "principal_email", "role")
+IDENTITY_FIELDS = GRANT_KEY_FIELDS[:-1]
+
+# Campos del grant guardados en previous_value / new_value
+GRANT_VALUE_FIELDS = ("dataset_id", "table_id", "principal_email", "principal_type", "role",
+                      "access_type", "special_group")
+
+
+def _key_text(record: Dict, fields: Tuple[str, ...]) -> str:
+    return "\x1f".join("" if record.get(field) is None else str(record[field]) for field in fields)
+
+
+def grant_fingerprint(record: Dict) -> str:
+    """Huella SHA-1 de un grant (proyecto, dataset, tabla, principal, rol)."""
+    return hashlib.sha1(_key_text(record, GRANT_KEY_FIELDS).encode("utf-8")).hexdigest()
+
+
+def index_grants(records: Iterable[Dict]) -> Dict[str, Dict]:
+    """{huella: registro} de un snapshot (grants repetidos cuentan una vez)."""
+    return {grant_fingerprint(record): record for record in records}
+
+
+def covers_dataset(datasets: Set[Tuple[str, Optional[str]]], project_id: str, dataset_id: Optional[str]) -> bool:
+    """Indica si el conjunto de pares (proyecto, dataset) incluye el par (dataset None = proyecto completo)."""
+    return (project_id, dataset_id) in datasets or (project_id, None) in datasets
+
+
+def exclude_datasets(records: Iterable[Dict], datasets: Set[Tuple[str, Optional[str]]]) -> List[Dict]:
+    """
+    Quita los registros de los pares (proyecto, dataset) indicados; dataset None
+    excluye el proyecto completo.
+    """
+    if not datasets:
+        return list(records)
+    return [
+        record for record in records
+        if not covers_dataset(datasets, record.get("source_project_id"), record.get("dataset_id"))
+    ]
+
+
+def select_datasets(records: Iterable[Dict], datasets: Set[Tuple[str, Optional[str]]]) -> List[Dict]:
+    """Solo los registros de los pares (proyecto, dataset) indicados (inverso de exclude_datasets)."""
+    return [
+        record for record in records
+        if covers_dataset(datasets, record.get("source_project_id"), record.get("dataset_id"))
+    ]
+
+
+def diff_snapshots(
+    previous: Iterable[Dict],
+    current: Iterable[Dict]
+) -> List[Tuple[str, Optional[Dict], Optional[Dict]]]:
+    """
+    Compara dos snapshots de grants.
+
+    Args:
+        previous: Registros del snapshot anterior
+        current: Registros del snapshot actual
+
+    Retorna:
+        Lista de (change_type, registro anterior o None, registro actual o None),
+        con change_type ADDED, REMOVED o MODIFIED
+    """
+    previous_index = index_grants(previous)
+    current_index = index_grants(current)
+
+    removed = defaultdict(list)
+    for fingerprint, record in previous_index.items():
+        if fingerprint not in current_index:
+            removed[_key_text(record, IDENTITY_FIELDS)].append(record)
+    added = defaultdict(list)
+    for fingerprint, record in current_index.items():
+        if fingerprint not in previous_index:
+            added[_key_text(record, IDENTITY_FIELDS)].append(record)
+
+    changes = []
+    for identity in sorted(set(removed) | set(added)):
+        before = sorted(removed.get(identity, []), key=lambda r: r.get("role") or "")
+        after = sorted(added.get(identity, []), key=lambda r: r.get("role") or "")
+        pairs = min(len(before), len(after))
+        changes.extend(("MODIFIED", old, new) for old, new in zip(before[:pairs], after[:pairs]))
+        changes.extend(("REMOVED", old, None) for old in before[pairs:])
+        changes.extend(("ADDED", None, new) for new in after[pairs:])
+    return changes
+
+
+def _grant_value(record: Optional[Dict]) -> Optional[Dict]:
+    return None if record is None else {field: record.get(field) for field in GRANT_VALUE_FIELDS}
+
+
+def build_history_records(
+    changes: List[Tuple[str, Optional[Dict], Optional[Dict]]],
+    snapshot_timestamp: datetime
+) -> List[Dict]:
+    """
+    Registros para iam_access_history (esquema del snapshot + change_type y valores).
+
+    Los campos del grant salen del registro actual (o del anterior si fue
+    REMOVED); la fecha y el timestamp son los del snapshot actual.
+    """
+    history = []
+    for change_type, previous, current in changes:
+        record = dict(current if current is not None else previous)
+        record.update({
+            "snapshot_date": snapshot_timestamp.date(),
+            "snapshot_timestamp": snapshot_timestamp,
+            "change_type": change_type,
+            "previous_value": _grant_value(previous),
+            "new_value": _grant_value(current),
+        })
+        history.append(record)
+    return history
@@ -0,0 +1,335 @@
+"""
+Motor columnar de la matriz de sincronización (sin dependencias de Streamlit).
+
+La matriz es un DataFrame con:
+    - Índice (filas) = nombres de compañías ('Compañía'), ordenadas por company_id
+    - Columnas = MultiIndex (campo, endpoint), un bloque tipado por campo:
+        max_sync         datetime64[ns, UTC]
+        actual_rows      Int64
+        last_rows        Int64
+        actual_duration  float64
+        last_duration    float64
+        actual_status    string
+
+Cada campo se obtiene como una sub-matriz compañía × endpoint con matrix[campo].
+"""
+
+import numpy as np
+import pandas as pd
+
+# Zona horaria de visualización (Ciudad de México)
+DISPLAY_TZ = 'America/Mexico_City'
+
+# Campos de cada celda y su dtype en la matriz columnar
+CELL_FIELDS = [
+    'max_sync',
+    'actual_rows',
+    'last_rows',
+    'actual_duration',
+    'last_duration',
+    'actual_status',
+]
+
+FIELD_DTYPES = {
+    'max_sync': 'datetime64[ns, UTC]',
+    'actual_rows': 'Int64',
+    'last_rows': 'Int64',
+    'actual_duration': 'float64',
+    'last_duration': 'float64',
+    'actual_status': 'string',
+}
+
+# dtypes compactos para la descarga del snapshot (ver bq_fetch.fetch_dataframe)
+SNAPSHOT_DTYPES = {
+    'categories': ['company_id', 'endpoint_name', 'actual_status'],
+    'int32_columns': ['actual_rows', 'last_rows'],
+}
+
+
+def normalize_company_id(ids):
+    """
+    Normalización robusta de IDs: string, sin '.0' final y sin espacios.
+    """
+    return ids.astype(str).str.replace(r'\.0$', '', regex=True).str.strip()
+
+
+def normalize_endpoint(endpoints):
+    """Normaliza endpoint_name (lowercase + strip)."""
+    return endpoints.astype(str).str.lower().str.strip()
+
+
+def _typed_block(block, field):
+    """Convierte una sub-matriz compañía × endpoint al dtype del campo."""
+    if field == 'max_sync':
+        return block.apply(lambda col: pd.to_datetime(col, utc=True)).astype(FIELD_DTYPES[field])
+    if field in ('actual_rows', 'last_rows'):
+        return block.apply(pd.to_numeric, errors='coerce').round().astype(FIELD_DTYPES[field])
+    if field in ('actual_duration', 'last_duration'):
+        return block.apply(pd.to_numeric, errors='coerce').astype(FIELD_DTYPES[field])
+    return block.astype(FIELD_DTYPES[field])
+
+
+def assemble_matrix(blocks, index, columns):
+    """
+    Une bloques {campo: DataFrame compañía × endpoint} en la matriz columnar.
+    Los campos faltantes se completan con nulos del dtype correspondiente.
+    """
+    typed = {}
+    for field in CELL_FIELDS:
+        block = blocks.get(field)
+        if block is None:
+            block = pd.DataFrame(index=index, columns=columns)
+        block = block.reindex(index=index, columns=columns)
+        typed[field] = _typed_block(block, field)
+    matrix = pd.concat(typed, axis=1)
+    matrix.columns.names = [None, None]
+    matrix.index.name = 'Compañía'
+    return matrix
+
+
+def pivot_snapshot(snapshot_df, companies_df, tables_list):
+    """
+    Pivotea el snapshot (una fila por company_id × endpoint_name) a la matriz columnar.
+
+    - Solo se incluyen filas cuyo company_id coincide con una compañía activa
+    - Columnas = unión de endpoints del snapshot + endpoints de metadata (lowercase)
+    - Si hay filas duplicadas para una celda, gana la última
+
+    Args:
+        snapshot_df: DataFrame del snapshot (company_id, endpoint_name y CELL_FIELDS)
+        companies_df: DataFrame con company_id y company_name
+        tables_list: Lista de endpoints de metadata
+
+    Retorna:
+        DataFrame columnar (ver docstring del módulo); vacío si ninguna compañía coincide
+    """
+    id_to_name = dict(zip(normalize_company_id(companies_df['company_id']), companies_df['company_name']))
+    id_order = dict(zip(normalize_company_id(companies_df['company_id']), companies_df['company_id']))
+
+    rows = snapshot_df[['company_id', 'endpoint_name'] + CELL_FIELDS].copy()
+    rows['id_clean'] = normalize_company_id(rows['company_id'])
+    rows['ep_key'] = normalize_endpoint(rows['endpoint_name'])
+    rows = rows[rows['id_clean'].isin(id_to_name.keys()) & (rows['ep_key'] != '')]
+    rows = rows.drop_duplicates(subset=['id_clean', 'ep_key'], keep='last')
+
+    metadata_eps = {e.lower().strip() for e in tables_list}
+    all_cols = sorted(metadata_eps | set(rows['ep_key']))
+
+    # Compañías presentes en el snapshot, ordenadas por company_id
+    ids = sorted(rows['id_clean'].unique(), key=lambda company_id: id_order[company_id])
+
+    blocks = {
+        field: rows.pivot(index='id_clean', columns='ep_key', values=field)
+        for field in CELL_FIELDS
+    }
+    matrix = assemble_matrix(blocks, pd.Index(ids), all_cols)
+    matrix.index = pd.Index([id_to_name[company_id] for company_id in ids], name='Compañía')
+    return matrix
+
+
+def matrix_from_live(matrix_df):
+    """
+    Convierte la matriz LIVE (compañía × tabla con timestamps) a la matriz columnar.
+    Solo max_sync tiene datos; el resto de campos queda nulo.
+    """
+    return assemble_matrix({'max_sync': matrix_df}, matrix_df.index, matrix_df.columns)
+
+
+def endpoints(matrix):
+    """Lista de endpoints (columnas de segundo nivel) de la matriz columnar."""
+    return list(matrix['max_sync'].columns)
+
+
+# ========== FORMATO VECTORIZADO ==========
+
+# Tablas de lookup para componer fechas sin strftime por elemento:
+# 'MM-DD ' indexado por mes*32 + día y 'HH:MM' indexado por minuto del día
+_MONTH_DAY = np.array(
+    [f'{month:02d}-{day:02d} ' for month in range(13) for day in range(32)],
+    dtype=object
+)
+_HOUR_MINUTE = np.array([f'{minute // 60:02d}:{minute % 60:02d}' for minute in range(1440)], dtype=object)
+
+
+def _flatten(matrix, field):
+    """Aplana un bloque (compañía × endpoint) a una Serie 1-D en orden por columna."""
+    block = matrix[field]
+    return pd.concat([block.iloc[:, i] for i in range(block.shape[1])], ignore_index=True)
+
+
+def _flatten_numeric(matrix, field):
+    """Aplana un bloque numérico a un array float64 (nulos = NaN) en orden por columna."""
+    return matrix[field].to_numpy(dtype='float64', na_value=np.nan).ravel(order='F')
+
+
+def _fmt_datetime(local):
+    """Formatea una Serie datetime como '%m-%d %H:%M' componiendo sus componentes."""
+    def _part(values):
+        return values.fillna(0).to_numpy(dtype='int64')
+    month_day = _part(local.dt.month) * 32 + _part(local.dt.day)
+    minute_of_day = _part(local.dt.hour) * 60 + _part(local.dt.minute)
+    return _MONTH_DAY[month_day] + _HOUR_MINUTE[minute_of_day]
+
+
+def _upper_codes(values):
+    """Versión en mayúsculas de un array de strings (nulos = ''), resolviendo cada valor distinto una vez."""
+    codes, uniques = pd.factorize(values)
+    upper = np.array([str(value).upper() for value in uniques] + [''], dtype=object)
+    return upper[codes]
+
+
+def _fmt_float(values, mask):
+    """Formatea floats con 1 decimal solo donde `mask`; el resto queda como cadena vacía."""
+    out = np.full(len(values), '', dtype=object)
+    if mask.any():
+        # Mismo redondeo y notación que f"{v:.1f}" (np.round(...).astype(str) difiere en medios y usa e-notación)
+        out[mask] = np.char.mod('%.1f', values[mask]).astype(object)
+    return out
+
+
+def _fmt_int(values, mask):
+    """Formatea enteros (array float64) solo donde `mask`; el resto queda como cadena vacía."""
+    out = np.full(len(values), '', dtype=object)
+    if mask.any():
+        out[mask] = values[mask].astype('int64').astype(str)
+    return out
+
+
+def format_matrix(matrix, show_rows=True, show_duration=True, show_delta=True, now=None):
+    """
+    Formatea toda la matriz columnar de una vez (operaciones de columna NumPy/pandas).
+
+    Cada celda:
+      Línea 1: 🟢 04-16 14:30   (icono + fecha en CDMX)
+      Línea 2: Δ:+150 | τ:+2s  (métricas, solo si hay datos reales)
+      ❌ si no hay max_sync
+
+    Icono: SUCCESS → 🟢, FAILED → 🔴; sin estatus según antigüedad
+    (≥2 días 🔴, ≥1 día 🟡, si no 🟢).
+
+    Args:
+        matrix: Matriz columnar (ver docstring del módulo)
+        show_rows: Mostrar filas (Δ o R)
+        show_duration: Mostrar duración (τ)
+        show_delta: Mostrar diferencias contra la ejecución anterior
+        now: Timestamp de referencia para la antigüedad (default: ahora)
+
+    Retorna:
+        DataFrame de strings compañía × endpoint
+    """
+    eps = endpoints(matrix)
+    n_companies = len(matrix.index)
+    if not eps or n_companies == 0:
+        return pd.DataFrame(index=matrix.index, columns=eps, dtype=object)
+
+    if now is None:
+        now = pd.Timestamp.now(tz='UTC')
+
+    max_sync = _flatten(matrix, 'max_sync')
+    has_sync = max_sync.notna().to_numpy()
+
+    # Línea 1: Icono + Fecha (CDMX)
+    date_str = _fmt_datetime(max_sync.dt.tz_convert(DISPLAY_TZ))
+    status = _upper_codes(matrix['actual_status'].to_numpy(dtype=object, na_value=None).ravel(order='F'))
+    age_days = ((now - max_sync) // pd.Timedelta(days=1)).fillna(0).to_numpy()
+    icon = np.select(
+        [status == 'SUCCESS', status == 'FAILED', age_days >= 2, age_days >= 1],
+        ['🟢', '🔴', '🔴', '🟡'],
+        default='🟢'
+    ).astype(object)
+    line1 = icon + ' ' + date_str
+
+    # Línea 2: métricas (solo si hay datos reales)
+    n_cells = len(max_sync)
+    rows_part = np.full(n_cells, '', dtype=object)
+    duration_part = np.full(n_cells, '', dtype=object)
+
+    if show_rows:
+        actual_rows = _flatten_numeric(matrix, 'actual_rows')
+        last_rows = _flatten_numeric(matrix, 'last_rows')
+        has_actual = ~np.isnan(actual_rows)
+        has_delta = has_actual & ~np.isnan(last_rows) if show_delta else np.zeros(n_cells, dtype=bool)
+        delta = actual_rows - last_rows
+        sign = np.where(delta >= 0, '+', '').astype(object)
+        delta_str = 'Δ:' + sign + _fmt_int(delta, has_delta)
+        plain_str = 'R:' + _fmt_int(actual_rows, has_actual & ~has_delta)
+        rows_part = np.where(has_delta, delta_str, np.where(has_actual, plain_str, ''))
+
+    if show_duration:
+        actual_duration = _flatten_numeric(matrix, 'actual_duration')
+        last_duration = _flatten_numeric(matrix, 'last_duration')
+        has_actual = ~np.isnan(actual_duration)
+        has_delta = has_actual & ~np.isnan(last_duration) if show_delta else np.zeros(n_cells, dtype=bool)
+        delta = last_duration - actual_duration
+        prefix = np.where(delta < 0, '⚠️', 'τ:').astype(object)
+        sign = np.where(delta >= 0, '+', '').astype(object)
+        delta_str = prefix + sign + _fmt_float(delta, has_delta) + 's'
+        plain_str = 'τ:' + _fmt_float(actual_duration, has_actual & ~has_delta) + 's'
+        duration_part = np.where(has_delta, delta_str, np.where(has_actual, plain_str, ''))
+
+    has_rows_part = rows_part != ''
+    has_duration_part = duration_part != ''
+    line2 = np.where(
+        has_rows_part & has_duration_part,
+        rows_part + ' | ' + duration_part,
+        rows_part + duration_part
+    )
+    cells = np.where(line2 != '', line1 + '\n' + line2, line1)
+    cells = np.where(has_sync, cells, '❌')
+
+    return pd.DataFrame(
+        cells.reshape(len(eps), n_companies).T,
+        index=matrix.index,
+        columns=eps
+    )
+
+
+# ========== ESTADÍSTICAS ==========
+
+# Histograma de antigüedad de max_sync: (etiqueta, límite superior en horas)
+STALENESS_BUCKETS = [
+    ('<6h', 6),
+    ('6–24h', 24),
+    ('1–2d', 48),
+    ('>2d', np.inf),
+]
+
+
+def matrix_stats(matrix, total_cells=None, now=None):
+    """
+    Estadísticas de la matriz en una sola pasada vectorizada sobre el bloque max_sync.
+
+    Args:
+        matrix: Matriz columnar (ver docstring del módulo)
+        total_cells: Total de celdas esperadas (default: tamaño del bloque max_sync)
+        now: Timestamp de referencia para la antigüedad (default: ahora)
+
+    Retorna:
+        dict con:
+            - total: celdas esperadas
+            - synced: celdas con max_sync
+            - missing: total - synced
+            - recent_24h: celdas sincronizadas hace menos de 24h
+            - staleness: {etiqueta: celdas} según STALENESS_BUCKETS
+    """
+    if now is None:
+        now = pd.Timestamp.now(tz='UTC')
+
+    # datetime64[ns] en UTC (NaT para celdas sin sincronizar), sin pasar por objetos
+    values = matrix['max_sync'].to_numpy(dtype='datetime64[ns]').ravel()
+    synced_mask = ~np.isnat(values)
+    age_hours = (now.tz_convert('UTC').tz_localize(None).to_datetime64() - values[synced_mask]) / np.timedelta64(1, 'h')
+
+    limits = [limit for _, limit in STALENESS_BUCKETS]
+    counts = np.bincount(np.searchsorted(limits, age_hours, side='right'), minlength=len(limits))
+
+    synced = int(synced_mask.sum())
+    total = int(values.size if total_cells is None else total_cells)
+    staleness = {label: int(count) for (label, _), count in zip(STALENESS_BUCKETS, counts)}
+    return {
+        'total': total,
+        'synced': synced,
+        'missing': total - synced,
+        'recent_24h': staleness['<6h'] + staleness['6–24h'],
+        'staleness': staleness,
+    }
@@ -0,0 +1,150 @@
+"""
+Extracción masiva de permisos IAM desde INFORMATION_SCHEMA.OBJECT_PRIVILEGES.
+
+Alternativa a leer `access_entries` con `client.get_dataset()` dataset por
+dataset: una sola query por proyecto/región trae los grants de datasets y
+también los de tablas y vistas (que get_dataset no expone), normalizados al
+mismo formato que sync_iam_access.parse_access_entries más el recurso:
+
+    {'dataset_id', 'table_id' (None = dataset), 'object_type',
+     'principal_email', 'principal_type', 'role', 'access_type', 'special_group'}
+
+BigQuery exige filtrar la vista por `object_name`, así que la query recibe
+los nombres de los datasets y de sus tablas (del inventario de table_inventory).
+La vista reporta roles predefinidos (roles/bigquery.dataViewer) y get_dataset
+roles legacy (READER); ambos backends pasan por normalize_role, que usa el
+vocabulario legacy de los snapshots existentes.
+
+Backend (`IAM_ACCESS_BACKEND`):
+- dataset_api: get_dataset por dataset (default)
+- object_privileges: esta query por proyecto
+"""
+
+import logging
+import os
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from google.cloud import bigquery
+
+from table_inventory import DEFAULT_INVENTORY_REGION
+
+ACCESS_BACKENDS = ("dataset_api", "object_privileges")
+DEFAULT_ACCESS_BACKEND = os.environ.get("IAM_ACCESS_BACKEND", "dataset_api")
+
+OBJECT_PRIVILEGES_QUERY = """
+SELECT
+  object_schema,
+  object_name,
+  object_type,
+  privilege_type,
+  grantee
+FROM `{project_id}.{region}.INFORMATION_SCHEMA.OBJECT_PRIVILEGES`
+WHERE object_name IN UNNEST(@object_names)
+"""
+
+# Prefijo del grantee → tipo de principal
+GRANTEE_TYPES = {
+    "user": "USER",
+    "serviceAccount": "SERVICE_ACCOUNT",
+    "group": "GROUP",
+}
+
+# Rol predefinido → rol legacy de access_entries (vocabulario común de los snapshots)
+LEGACY_ROLES = {
+    "roles/bigquery.dataViewer": "READER",
+    "roles/bigquery.dataEditor": "WRITER",
+    "roles/bigquery.dataOwner": "OWNER",
+}
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_role(role: Optional[str]) -> Optional[str]:
+    """Rol en el vocabulario común: los predefinidos con equivalente legacy se traducen, el resto queda igual."""
+    return LEGACY_ROLES.get(role, role)
+
+
+def parse_grantee(grantee: str) -> Dict:
+    """
+    Separa un grantee de OBJECT_PRIVILEGES ('user:x@y.com', 'specialGroup:projectOwners', ...).
+
+    Retorna:
+        {'principal_email', 'principal_type', 'special_group'}; los grupos especiales,
+        dominios y demás se reportan como SPECIAL con el grantee en special_group
+    """
+    prefix, _, member = grantee.partition(":")
+    if prefix in GRANTEE_TYPES:
+        return {"principal_email": member, "principal_type": GRANTEE_TYPES[prefix], "special_group": None}
+    special_group = member if prefix == "specialGroup" else grantee
+    return {"principal_email": None, "principal_type": "SPECIAL", "special_group": special_group}
+
+
+def fetch_object_privileges(
+    client: bigquery.Client,
+    project_id: str,
+    object_names: List[str],
+    region: str = DEFAULT_INVENTORY_REGION
+) -> List[Dict]:
+    """
+    Lee los grants de datasets y tablas de un proyecto en una query (propaga los errores).
+
+    Args:
+        client: Cliente de BigQuery
+        project_id: ID del proyecto
+        object_names: Nombres de datasets y tablas a incluir (filtro obligatorio de la vista)
+        region: Calificador de región de INFORMATION_SCHEMA
+
+    Retorna:
+        Lista de grants normalizados (ver docstring del módulo)
+    """
+    if not object_names:
+        return []
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ArrayQueryParameter("object_names", "STRING", sorted(set(object_names))),
+    ])
+    query = OBJECT_PRIVILEGES_QUERY.format(project_id=project_id, region=region)
+
+    privileges = []
+    for row in client.query(query, job_config=job_config).result():
+        if row.object_type == "SCHEMA":
+            dataset_id, table_id = row.object_schema or row.object_name, None
+        else:
+            dataset_id, table_id = row.object_schema, row.object_name
+        privileges.append({
+            "dataset_id": dataset_id,
+            "table_id": table_id,
+            "object_type": row.object_type,
+            "role": normalize_role(row.privilege_type),
+            "access_type": None,
+            **parse_grantee(row.grantee),
+        })
+    return privileges
+
+
+def load_object_privileges(
+    client: bigquery.Client,
+    project_id: str,
+    object_names: List[str],
+    region: str = DEFAULT_INVENTORY_REGION
+) -> Optional[List[Dict]]:
+    """
+    Como fetch_object_privileges, pero retorna None si la query falla (el llamador
+    recurre a get_dataset por dataset).
+    """
+    try:
+        privileges = fetch_object_privileges(client, project_id, object_names, region)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo leer OBJECT_PRIVILEGES de {project_id}.{region}: {str(e)}")
+        return None
+    tables = sum(1 for privilege in privileges if privilege["table_id"])
+    logger.info(f"🔑 OBJECT_PRIVILEGES {project_id}: {len(privileges)} grants ({tables} de tablas) en 1 query")
+    return privileges
+
+
+def group_by_dataset(privileges: List[Dict]) -> Dict[str, List[Dict]]:
+    """Agrupa los grants por dataset (los de tablas quedan con su dataset)."""
+    grouped = defaultdict(list)
+    for privilege in privileges:
+        grouped[privilege["dataset_id"]].append(privilege)
+    return dict(grouped)
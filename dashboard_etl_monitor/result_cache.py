@@ -0,0 +1,286 @@
+"""
+Caché persistente de resultados de queries (DataFrames), compartido entre
+reinicios y réplicas del dashboard.
+
+Backends:
+- "parquet" (default): un archivo Parquet por clave bajo RESULT_CACHE_DIR.
+  TTL por antigüedad del archivo y desalojo LRU cuando el directorio supera
+  RESULT_CACHE_MAX_BYTES. Montar el directorio en un volumen compartido
+  (ej. Cloud Storage FUSE) para que todas las réplicas arranquen "tibias".
+- "redis": cualquier cliente con la interfaz get/set(ex=)/delete de Redis
+  (redis-py, o un sustituto local en pruebas). El TTL lo aplica Redis con
+  `ex`; el desalojo por tamaño se delega a su maxmemory-policy.
+
+Las claves se derivan del texto de la query, sus parámetros y el ambiente.
+Los DataFrames devueltos llevan df.attrs['cached_at'] (UTC) con el momento
+en que se descargaron de BigQuery.
+
+Los fallos del caché no interrumpen la carga: se registran con logger.warning
+y quedan en get_cache_errors() para mostrarlos en el modo debug del dashboard.
+"""
+
+import collections
+import hashlib
+import io
+import json
+import logging
+import os
+import struct
+import threading
+import time
+
+import pandas as pd
+
+RESULT_CACHE_BACKEND = os.environ.get("RESULT_CACHE_BACKEND", "parquet")
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", "/tmp/etl_monitor_cache")
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+RESULT_CACHE_REDIS_URL = os.environ.get("RESULT_CACHE_REDIS_URL", "")
+
+# Prefijo de claves en Redis (varios dashboards pueden compartir la misma instancia)
+REDIS_KEY_PREFIX = "etl_monitor:result_cache:"
+
+# Cabecera de los valores en Redis: epoch (float64) de escritura
+_REDIS_HEADER = struct.Struct(">d")
+
+# Últimos fallos del caché que se conservan para el modo debug
+MAX_RECENT_ERRORS = 50
+
+logger = logging.getLogger(__name__)
+
+_recent_errors = collections.deque(maxlen=MAX_RECENT_ERRORS)
+
+
+def _report_error(operation, key, error):
+    """Registra un fallo del caché (log + lista de errores recientes)."""
+    message = f"{type(error).__name__} - {str(error)}"
+    logger.warning(f"⚠️ Caché de resultados: {operation} de {key[:12]} falló: {message}")
+    _recent_errors.append({
+        'at': pd.Timestamp.now(tz='UTC'),
+        'operation': operation,
+        'key': key,
+        'error': message,
+    })
+
+
+def get_cache_errors():
+    """
+    Retorna:
+        DataFrame con los últimos fallos del caché (at, operation, key, error)
+    """
+    return pd.DataFrame(list(_recent_errors), columns=['at', 'operation', 'key', 'error'])
+
+
+def cache_key(query, environment, params=None):
+    """
+    Clave estable de una query: sha256 del SQL normalizado + parámetros + ambiente.
+
+    Args:
+        query: Texto SQL (los espacios en blanco no afectan la clave)
+        environment: Ambiente actual (dev/qua/pro)
+        params: Valores de los parámetros de la query (serializables a JSON)
+    """
+    payload = json.dumps(
+        {
+            'query': " ".join(query.split()),
+            'environment': environment,
+            'params': params,
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _with_cached_at(df, written_at):
+    """Marca el DataFrame con el momento (epoch) en que se guardó."""
+    df.attrs['cached_at'] = pd.Timestamp(written_at, unit='s', tz='UTC')
+    return df
+
+
+def _to_parquet_bytes(df):
+    """Serializa un DataFrame a Parquet en memoria (conserva categorías y dtypes nullable)."""
+    buffer = io.BytesIO()
+    # Los attrs (cached_at) no se persisten: el momento de escritura lo da el backend
+    df = df.copy(deep=False)
+    df.attrs = {}
+    df.to_parquet(buffer, index=True)
+    return buffer.getvalue()
+
+
+class ParquetCacheBackend:
+    """
+    Caché en archivos Parquet locales con TTL y desalojo LRU por tamaño total.
+    """
+
+    def __init__(self, cache_dir=RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_MAX_BYTES):
+        """
+        Args:
+            cache_dir: Directorio de los archivos (se crea si no existe)
+            max_bytes: Tamaño máximo del directorio; al superarlo se borran los menos usados
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.parquet")
+
+    def get(self, key, ttl):
+        """
+        Retorna:
+            DataFrame cacheado, o None si no existe o tiene más de `ttl` segundos
+        """
+        path = self._path(key)
+        try:
+            written_at = os.path.getmtime(path)
+        except OSError:
+            return None
+        if time.time() - written_at > ttl:
+            self.delete(key)
+            return None
+        try:
+            df = pd.read_parquet(path)
+        except Exception as e:
+            # Archivo truncado o de otra versión: se trata como miss
+            _report_error("lectura", key, e)
+            self.delete(key)
+            return None
+        # atime marca el uso para el desalojo LRU (mtime sigue siendo la fecha de escritura)
+        os.utime(path, (time.time(), written_at))
+        return _with_cached_at(df, written_at)
+
+    def set(self, key, df, ttl):
+        """Guarda el DataFrame (escritura atómica) y desaloja si se supera max_bytes."""
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(_to_parquet_bytes(df))
+        os.replace(temp_path, path)
+        self._evict()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        """Borra todas las entradas."""
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".parquet"):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+
+    def _evict(self):
+        """Borra las entradas menos usadas recientemente hasta quedar bajo max_bytes."""
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith(".parquet"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except OSError:
+                    continue
+                entries.append((max(stat.st_atime, stat.st_mtime), stat.st_size, name))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                    total -= size
+                except OSError:
+                    pass
+
+
+class RedisCacheBackend:
+    """
+    Caché sobre un cliente con interfaz Redis (get, set con ex=, delete, scan_iter).
+    """
+
+    def __init__(self, client, max_entry_bytes=RESULT_CACHE_MAX_BYTES, key_prefix=REDIS_KEY_PREFIX):
+        """
+        Args:
+            client: Cliente Redis (redis.Redis o un sustituto compatible)
+            max_entry_bytes: Resultados más grandes no se cachean
+            key_prefix: Prefijo de las claves
+        """
+        self.client = client
+        self.max_entry_bytes = max_entry_bytes
+        self.key_prefix = key_prefix
+
+    def get(self, key, ttl):
+        payload = self.client.get(self.key_prefix + key)
+        if payload is None:
+            return None
+        try:
+            (written_at,) = _REDIS_HEADER.unpack_from(payload)
+            df = pd.read_parquet(io.BytesIO(payload[_REDIS_HEADER.size:]))
+            return _with_cached_at(df, written_at)
+        except Exception as e:
+            _report_error("lectura", key, e)
+            self.delete(key)
+            return None
+
+    def set(self, key, df, ttl):
+        payload = _REDIS_HEADER.pack(time.time()) + _to_parquet_bytes(df)
+        if len(payload) > self.max_entry_bytes:
+            return
+        self.client.set(self.key_prefix + key, payload, ex=int(ttl))
+
+    def delete(self, key):
+        self.client.delete(self.key_prefix + key)
+
+    def clear(self):
+        for redis_key in self.client.scan_iter(match=f"{self.key_prefix}*"):
+            self.client.delete(redis_key)
+
+
+def create_cache_backend(backend=RESULT_CACHE_BACKEND):
+    """
+    Crea el backend configurado por variables de entorno.
+
+    Retorna:
+        ParquetCacheBackend o RedisCacheBackend
+    """
+    if backend == "redis":
+        import redis  # Dependencia opcional, solo con RESULT_CACHE_BACKEND=redis
+        return RedisCacheBackend(redis.Redis.from_url(RESULT_CACHE_REDIS_URL))
+    return ParquetCacheBackend()
+
+
+def cached_query(backend, key, ttl, loader, refresh=False):
+    """
+    Retorna el DataFrame cacheado bajo `key` o lo calcula con `loader()` y lo guarda.
+
+    Un fallo del caché nunca bloquea la carga: se registra (ver get_cache_errors)
+    como miss y se consulta BigQuery normalmente.
+
+    Args:
+        backend: Backend de caché (ParquetCacheBackend / RedisCacheBackend)
+        key: Clave (ver cache_key)
+        ttl: Vigencia en segundos
+        loader: Función sin argumentos que ejecuta la query y retorna un DataFrame
+        refresh: Ignorar la entrada existente y volver a ejecutar la query
+    """
+    df = None
+    if not refresh:
+        try:
+            df = backend.get(key, ttl)
+        except Exception as e:
+            _report_error("lectura", key, e)
+            df = None
+    if df is not None:
+        return df
+
+    df = _with_cached_at(loader(), time.time())
+    try:
+        backend.set(key, df, ttl)
+    except Exception as e:
+        _report_error("escritura", key, e)
+    return df
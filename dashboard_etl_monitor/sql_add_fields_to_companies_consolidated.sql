@@ -6,7 +6,10 @@
 
 ALTER TABLE `pph-central.settings.companies_consolidated`
 ADD COLUMN IF NOT EXISTS last_etl_synced TIMESTAMP,
-ADD COLUMN IF NOT EXISTS row_count INTEGER;
+ADD COLUMN IF NOT EXISTS row_count INTEGER,
+-- Metadata de __TABLES__ (solo la escribe el sync con --freshness-mode metadata)
+ADD COLUMN IF NOT EXISTS bronze_last_modified TIMESTAMP,
+ADD COLUMN IF NOT EXISTS bronze_row_count INTEGER;
 
 -- ============================================================
 -- QUERY 2: Actualizar last_etl_synced y row_count usando MERGE
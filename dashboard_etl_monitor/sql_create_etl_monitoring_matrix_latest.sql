@@ -0,0 +1,60 @@
+-- ============================================================
+-- FUNCIÓN DE TABLA: Última fotografía por compañía × endpoint
+-- ============================================================
+-- El dashboard (modo SNAPSHOT) ya no descarga todo el historial de
+-- etl_monitoring_snapshot: consulta esta función, que devuelve una sola
+-- fila por company_id × endpoint_name (la de updated_at más reciente),
+-- con IDs y endpoints ya normalizados.
+--
+-- El parámetro `since` se aplica ANTES de la ventana, por lo que
+-- BigQuery solo lee las particiones de updated_at necesarias. El
+-- dashboard pasa el inicio de la última partición (cada corrida de
+-- update_etl_monitoring_snapshot.py cae completa en una partición).
+-- El dashboard filtra además por las compañías del ambiente actual,
+-- así que el resultado transferido es del tamaño de la matriz mostrada.
+--
+-- Tabla: pph-central.management.etl_monitoring_matrix_latest
+--
+-- Uso:
+--   SELECT *
+--   FROM `pph-central.management.etl_monitoring_matrix_latest`(
+--     TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL 30 DAY))
+--   WHERE company_id IN UNNEST(['1', '2'])
+
+CREATE OR REPLACE TABLE FUNCTION `pph-central.management.etl_monitoring_matrix_latest`(since TIMESTAMP)
+AS
+SELECT
+  REGEXP_REPLACE(TRIM(CAST(company_id AS STRING)), r'\.0$', '') AS company_id,
+  LOWER(TRIM(endpoint_name)) AS endpoint_name,
+  max_sync,
+  actual_rows,
+  actual_duration,
+  actual_status,
+  last_rows,
+  last_duration,
+  last_status,
+  updated_at
+FROM `pph-central.management.etl_monitoring_snapshot`
+WHERE updated_at >= since
+  AND endpoint_name IS NOT NULL
+QUALIFY ROW_NUMBER() OVER (
+  PARTITION BY REGEXP_REPLACE(TRIM(CAST(company_id AS STRING)), r'\.0$', ''), LOWER(TRIM(endpoint_name))
+  ORDER BY updated_at DESC
+) = 1;
+
+-- ============================================================
+-- OPCIONAL: Particionar y clusterizar el snapshot
+-- ============================================================
+-- Para que el filtro `updated_at >= since` pode particiones, la tabla
+-- debe estar particionada por DATE(updated_at). update_etl_monitoring_snapshot.py
+-- la crea así si no existe; si ya existe sin partición, recrearla una
+-- sola vez (en una ventana sin escrituras):
+--
+-- CREATE TABLE `pph-central.management.etl_monitoring_snapshot_new`
+-- PARTITION BY DATE(updated_at)
+-- CLUSTER BY company_id, endpoint_name
+-- AS SELECT * FROM `pph-central.management.etl_monitoring_snapshot`;
+--
+-- Luego renombrar las tablas:
+-- ALTER TABLE `pph-central.management.etl_monitoring_snapshot` RENAME TO etl_monitoring_snapshot_old;
+-- ALTER TABLE `pph-central.management.etl_monitoring_snapshot_new` RENAME TO etl_monitoring_snapshot;
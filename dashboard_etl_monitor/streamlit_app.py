@@ -9,11 +9,44 @@ import pandas as pd
 from datetime import datetime
 from google.cloud import bigquery
 from google.api_core.exceptions import NotFound
+import logging
 import os
 import concurrent.futures
+import time
 import pytz
 from datetime import timedelta
 
+from bronze_freshness import (
+    fetch_project_freshness,
+    FRESHNESS_MODES,
+    DEFAULT_FRESHNESS_MODE,
+)
+from adaptive_concurrency import AdaptiveConcurrencyLimiter
+from etl_snapshot import get_latest_partition_start
+from cost_planner import (
+    plan_refresh,
+    format_bytes,
+    ESTIMATE_METHODS,
+    DEFAULT_ESTIMATE_METHOD,
+    LIVE_MAX_BYTES_PER_JOB,
+    LIVE_MAX_BYTES_PER_REFRESH,
+)
+from bq_client_pool import BigQueryClientPool
+from bq_fetch import fetch_dataframe, get_fetch_stats
+from result_cache import cache_key, cached_query, create_cache_backend, get_cache_errors
+from background_refresher import BackgroundRefresher, format_age
+from matrix_pipeline import (
+    format_matrix,
+    matrix_from_live,
+    matrix_stats,
+    normalize_company_id,
+    normalize_endpoint,
+    pivot_snapshot,
+    SNAPSHOT_DTYPES,
+)
+
+logger = logging.getLogger(__name__)
+
 # ========== CONFIGURACIÓN ==========
 st.set_page_config(
     page_title="ETL Monitor - ServiceTitan",
@@ -27,6 +60,28 @@ METADATA_PROJECT = "pph-central"
 METADATA_DATASET = "management"
 METADATA_TABLE = "metadata_consolidated_tables"
 
+# Snapshot del ETL: tabla histórica y función de tabla con la última fila por compañía × endpoint
+# (la escribe update_etl_monitoring_snapshot.py; SNAPSHOT_LOOKBACK_DAYS solo aplica si no se
+# puede leer su última partición)
+SNAPSHOT_TABLE = "etl_monitoring_snapshot"
+SNAPSHOT_LATEST_FUNCTION = "etl_monitoring_matrix_latest"
+SNAPSHOT_LOOKBACK_DAYS = int(os.environ.get("SNAPSHOT_LOOKBACK_DAYS", "30"))
+
+# Vigencia (segundos) de los resultados en el caché persistente
+COMPANIES_CACHE_TTL = 300
+METADATA_CACHE_TTL = 3600  # La metadata cambia poco
+SNAPSHOT_CACHE_TTL = 900
+
+# Techo de concurrencia de la carga LIVE (el pool HTTP de BigQuery se dimensiona igual);
+# la concurrencia efectiva la ajusta el limitador adaptativo (AIMD)
+LIVE_MAX_WORKERS = int(os.environ.get("LIVE_MAX_WORKERS", "32"))
+LIVE_INITIAL_WINDOW = 8
+LIVE_PER_PROJECT_LIMIT = 2
+
+# Renderizado progresivo de la carga LIVE: refrescar la tabla parcial cada N proyectos o cada X ms
+PROGRESSIVE_EVERY_N = 5
+PROGRESSIVE_INTERVAL_MS = 500
+
 # ========== CONFIGURACIÓN DE AMBIENTES ==========
 
 # Mapeo de ambientes a project_ids
@@ -47,6 +102,7 @@ ENVIRONMENT_CONFIG = {
 
 # ========== FUNCIONES AUXILIARES ==========
 
+@st.cache_resource  # El ambiente no cambia durante la vida del proceso
 def detect_environment():
     """
     Detecta el ambiente actual (dev, qua, pro).
@@ -143,9 +199,29 @@ def get_current_environment():
     """
     return detect_environment()
 
+@st.cache_resource
+def get_client_pool():
+    """
+    Pool de clientes BigQuery compartido por todas las sesiones del proceso.
+    Credenciales y conexiones HTTP se reutilizan entre proyectos e hilos.
+    """
+    return BigQueryClientPool(pool_size=LIVE_MAX_WORKERS)
+
+@st.cache_resource
+def get_concurrency_limiter():
+    """
+    Limitador AIMD de la carga LIVE, compartido por el proceso: la ventana
+    aprendida se conserva entre recargas y sesiones.
+    """
+    return AdaptiveConcurrencyLimiter(
+        initial_window=LIVE_INITIAL_WINDOW,
+        max_window=LIVE_MAX_WORKERS,
+        per_project_limit=LIVE_PER_PROJECT_LIMIT
+    )
+
 def get_bigquery_client(project_id):
     """
-    Crea un cliente BigQuery.
+    Obtiene el cliente BigQuery (compartido) de un proyecto.
     La cuenta de servicio se configura a nivel de Cloud Run, no aquí.
     
     Args:
@@ -154,48 +230,131 @@ def get_bigquery_client(project_id):
     Retorna:
         Cliente BigQuery
     """
-    return bigquery.Client(project=project_id)
+    return get_client_pool().get_client(project_id)
 
-def to_cdmx(ts):
+@st.cache_resource
+def get_result_cache():
     """
-    Convierte un timestamp (aware o naive) a la zona horaria de Ciudad de México (America/Mexico_City).
+    Caché persistente de resultados (Parquet en disco o Redis, ver result_cache.py),
+    compartido entre sesiones, reinicios y réplicas.
     """
-    if ts is None or pd.isna(ts):
-        return None
-    
-    # Asegurar que sea aware (si es naive, asumir UTC)
-    if ts.tzinfo is None:
-        ts = pytz.utc.localize(ts)
+    return create_cache_backend()
+
+def get_query_context():
+    """
+    Objetos del proceso que usan los loaders (pool de clientes, ambiente, caché).
+
+    Se resuelve en el hilo del script y se pasa a los loaders: el hilo del
+    refresco en segundo plano no tiene contexto de Streamlit y no puede llamar
+    a los accesores st.cache_resource.
+
+    Retorna:
+        dict: {'client_pool', 'environment', 'project_id', 'result_cache'}
+    """
+    return {
+        'client_pool': get_client_pool(),
+        'environment': get_current_environment(),
+        'project_id': get_bigquery_project_id(),
+        'result_cache': get_result_cache(),
+    }
+
+def fetch_query(context, client, query, job_config=None, label="query", ttl=None, cache_params=None, refresh=False,
+                **dtype_options):
+    """
+    Ejecuta una query con la capa de descarga compartida (Storage Read API / REST).
+    El cliente de la Storage Read API se reutiliza desde el pool del proceso.
+
+    Con `ttl` (segundos) el resultado pasa por el caché persistente; la clave
+    se deriva del SQL, `cache_params` y el ambiente de `context`. `refresh` fuerza
+    la consulta a BigQuery y reemplaza la entrada.
+
+    Args:
+        context: Ver get_query_context (resuelto en el hilo del script)
+    """
+    def _load():
+        return fetch_dataframe(
+            client,
+            query,
+            job_config=job_config,
+            label=label,
+            bqstorage_client=context['client_pool'].get_bqstorage_client(),
+            **dtype_options
+        )
     
-    # Convertir a Ciudad de México
-    cdmx = pytz.timezone('America/Mexico_City')
-    return ts.astimezone(cdmx)
+    if ttl is None:
+        return _load()
+    key = cache_key(query, context['environment'], cache_params)
+    return cached_query(context['result_cache'], key, ttl, _load, refresh=refresh)
+
+@st.cache_resource
+def get_data_refresher():
+    """
+    Refresco en segundo plano (stale-while-revalidate) de compañías, metadata y
+    snapshot: un solo hilo por proceso, compartido por todas las sesiones.
+    """
+    return BackgroundRefresher()
+
+def render_data_age_badge():
+    """
+    Indicador de antigüedad de los datos servidos (compañías, metadata, snapshot).
+    """
+    parts = []
+    for dataset in sorted(get_data_refresher().status(), key=lambda item: item['label']):
+        icon = "⚠️" if dataset['error'] else "🕒"
+        parts.append(f"{icon} {dataset['label']}: hace {format_age(dataset['age_seconds'])}")
+    if parts:
+        st.caption(" · ".join(parts))
+
+def to_utc(ts):
+    """
+    Normaliza un timestamp (aware o naive) a pd.Timestamp en UTC (naive se asume UTC).
+    """
+    ts = pd.Timestamp(ts)
+    return ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
 
 # ========== PASO 1: OBTENER COMPAÑÍAS ==========
 
-@st.cache_data(ttl=300)  # Cache por 5 minutos
+def load_companies(context, refresh=False):
+    """
+    Consulta las compañías activas (lanza la excepción si falla).
+    
+    Args:
+        context: Ver get_query_context
+        refresh: Ignorar el caché persistente
+    """
+    PROJECT_ID = context['project_id']
+    client = context['client_pool'].get_client(PROJECT_ID)
+    
+    query = f"""
+        SELECT 
+            company_id,
+            company_name,
+            company_project_id
+        FROM `{PROJECT_ID}.settings.companies`
+        WHERE company_fivetran_status = TRUE
+        ORDER BY company_id
+    """
+    
+    return fetch_query(
+        context, client, query, label="get_companies", ttl=COMPANIES_CACHE_TTL, refresh=refresh,
+        categories=['company_name', 'company_project_id'], int32_columns=['company_id']
+    )
+
 def get_companies():
     """
-    Obtiene todas las compañías activas desde BigQuery.
+    Obtiene todas las compañías activas (último valor bueno, refrescado en segundo plano).
     
     Retorna:
         DataFrame con columns: company_id, company_name, company_project_id
     """
+    context = get_query_context()
     try:
-        PROJECT_ID = get_bigquery_project_id()
-        client = get_bigquery_client(PROJECT_ID)
-        
-        query = f"""
-            SELECT 
-                company_id,
-                company_name,
-                company_project_id
-            FROM `{PROJECT_ID}.settings.companies`
-            WHERE company_fivetran_status = TRUE
-            ORDER BY company_id
-        """
-        
-        df = client.query(query).to_dataframe()
+        df, _ = get_data_refresher().get(
+            f"companies:{context['environment']}",
+            lambda refresh: load_companies(context, refresh=refresh),
+            COMPANIES_CACHE_TTL,
+            label="Compañías"
+        )
         return df
         
     except Exception as e:
@@ -204,7 +363,27 @@ def get_companies():
 
 # ========== PASO 2: OBTENER TABLAS ==========
 
-@st.cache_data(ttl=3600)  # Cache por 1 hora (metadata cambia poco)
+def load_tables_from_metadata(context, refresh=False):
+    """
+    Consulta los endpoint.name activos desde metadata (lanza la excepción si falla).
+    
+    Args:
+        context: Ver get_query_context
+        refresh: Ignorar el caché persistente
+    """
+    client = context['client_pool'].get_client(METADATA_PROJECT)
+    
+    query = f"""
+        SELECT 
+            endpoint.name AS endpoint_name
+        FROM `{METADATA_PROJECT}.{METADATA_DATASET}.{METADATA_TABLE}`
+        WHERE endpoint.name IS NOT NULL
+          AND active = TRUE
+        ORDER BY endpoint.name
+    """
+    
+    return fetch_query(context, client, query, label="get_tables_from_metadata", ttl=METADATA_CACHE_TTL, refresh=refresh)
+
 def get_tables_from_metadata():
     """
     Obtiene la lista de endpoint.name activos desde metadata.
@@ -213,37 +392,30 @@ def get_tables_from_metadata():
     Retorna:
         list: [endpoint_name, ...] ordenados alfabéticamente
     """
+    context = get_query_context()
     try:
-        client = get_bigquery_client(METADATA_PROJECT)
-        
-        query = f"""
-            SELECT 
-                endpoint.name AS endpoint_name
-            FROM `{METADATA_PROJECT}.{METADATA_DATASET}.{METADATA_TABLE}`
-            WHERE endpoint.name IS NOT NULL
-              AND active = TRUE
-            ORDER BY endpoint.name
-        """
-        
-        df = client.query(query).to_dataframe()
+        df, _ = get_data_refresher().get(
+            "metadata_tables",
+            lambda refresh: load_tables_from_metadata(context, refresh=refresh),
+            METADATA_CACHE_TTL,
+            label="Metadata"
+        )
         return sorted(df['endpoint_name'].tolist())
         
     except Exception as e:
         st.error(f"❌ Error obteniendo endpoints desde metadata: {str(e)}")
         return []
 
-@st.cache_data(ttl=900)  # Cache por 15 minutos para la carga rápida
-def get_snapshot_matrix(debug_mode=False):
+def build_snapshot_matrix_query(source, filter_endpoints=False):
     """
-    Obtiene la última fotografía completa desde la tabla de snapshot.
+    Query de la última fotografía por compañía × endpoint (solo las columnas de la matriz).
+
+    Args:
+        source: FROM de la query (función de tabla o subquery con la misma forma)
+        filter_endpoints: Filtrar además por @endpoints
     """
-    try:
-        # CORREGIDO: Usar METADATA_PROJECT (pph-central), igual que get_tables_from_metadata
-        # Antes usaba get_bigquery_project_id() que devuelve el proyecto del ambiente (ej: platform-partners-des)
-        # y si ese proyecto no tiene permisos sobre pph-central, falla silenciosamente.
-        client = get_bigquery_client(METADATA_PROJECT)
-        
-        query = f"""
+    endpoint_filter = "AND endpoint_name IN UNNEST(@endpoints)" if filter_endpoints else ""
+    return f"""
             SELECT 
                 company_id,
                 endpoint_name,
@@ -253,183 +425,324 @@ def get_snapshot_matrix(debug_mode=False):
                 actual_status,
                 last_rows,
                 last_duration,
-                last_status,
                 updated_at
-            FROM `{METADATA_PROJECT}.{METADATA_DATASET}.etl_monitoring_snapshot`
+            FROM {source}
+            WHERE company_id IN UNNEST(@company_ids)
+              {endpoint_filter}
         """
-        
-        df = client.query(query).to_dataframe()
+
+def load_snapshot_matrix(context, company_ids, endpoint_names=None, refresh=False):
+    """
+    Consulta la última fotografía (una fila por compañía × endpoint) en el servidor
+    (lanza la excepción si falla).
+
+    Consulta la función de tabla etl_monitoring_matrix_latest, que deduplica en
+    BigQuery y solo lee la última partición diaria del snapshot (cada corrida del
+    writer cae completa en una partición). Si la tabla no está particionada se usa
+    la ventana de SNAPSHOT_LOOKBACK_DAYS. Si la función aún no existe, usa la query
+    equivalente sobre la tabla de snapshot.
+
+    Args:
+        context: Ver get_query_context
+        company_ids: IDs de las compañías del ambiente actual
+        endpoint_names: Endpoints a incluir (None = todos)
+        refresh: Ignorar el caché persistente
+
+    Retorna:
+        DataFrame con company_id, endpoint_name (normalizados) y los campos de la matriz;
+        attrs['partition_error'] trae el error de la lectura de la última partición (o None)
+    """
+    # CORREGIDO: Usar METADATA_PROJECT (pph-central), igual que get_tables_from_metadata
+    # Antes usaba get_bigquery_project_id() que devuelve el proyecto del ambiente (ej: platform-partners-des)
+    # y si ese proyecto no tiene permisos sobre pph-central, falla silenciosamente.
+    client = context['client_pool'].get_client(METADATA_PROJECT)
+    
+    # Inicio de la última partición (metadata); la clave del caché cambia solo cuando aparece una nueva
+    snapshot_ref = f"{METADATA_PROJECT}.{METADATA_DATASET}.{SNAPSHOT_TABLE}"
+    partition_error = None
+    try:
+        since = get_latest_partition_start(client, snapshot_ref)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo leer la última partición de {snapshot_ref}: {str(e)}")
+        partition_error = f"{type(e).__name__} - {str(e)}"
+        since = None
+    if since is None:
+        # Tabla sin particionar: inicio del día para que la clave no cambie en cada rerun
+        since = pd.Timestamp.now(tz='UTC').floor('D') - pd.Timedelta(days=SNAPSHOT_LOOKBACK_DAYS)
+    filter_endpoints = endpoint_names is not None
+    cache_params = {
+        'since': since.isoformat(),
+        'company_ids': sorted(normalize_company_id(pd.Series(list(company_ids)))),
+        'endpoints': sorted({e.lower().strip() for e in endpoint_names}) if filter_endpoints else None,
+    }
+    params = [
+        bigquery.ScalarQueryParameter("since", "TIMESTAMP", since.to_pydatetime()),
+        bigquery.ArrayQueryParameter("company_ids", "STRING", cache_params['company_ids']),
+    ]
+    if filter_endpoints:
+        params.append(bigquery.ArrayQueryParameter("endpoints", "STRING", cache_params['endpoints']))
+    job_config = bigquery.QueryJobConfig(query_parameters=params)
+    
+    query = build_snapshot_matrix_query(
+        f"`{METADATA_PROJECT}.{METADATA_DATASET}.{SNAPSHOT_LATEST_FUNCTION}`(@since)",
+        filter_endpoints
+    )
+    try:
+        df = fetch_query(
+            context, client, query, job_config=job_config, label="get_snapshot_matrix",
+            ttl=SNAPSHOT_CACHE_TTL, cache_params=cache_params, refresh=refresh, **SNAPSHOT_DTYPES
+        )
+    except NotFound:
+        # Función de tabla no creada (ver sql_create_etl_monitoring_matrix_latest.sql)
+        query = build_snapshot_matrix_query(f"""(
+            SELECT * REPLACE (
+                REGEXP_REPLACE(TRIM(CAST(company_id AS STRING)), r'\\.0$', '') AS company_id,
+                LOWER(TRIM(endpoint_name)) AS endpoint_name
+            )
+            FROM `{METADATA_PROJECT}.{METADATA_DATASET}.{SNAPSHOT_TABLE}`
+            WHERE updated_at >= @since
+              AND endpoint_name IS NOT NULL
+            QUALIFY ROW_NUMBER() OVER (
+                PARTITION BY REGEXP_REPLACE(TRIM(CAST(company_id AS STRING)), r'\\.0$', ''), LOWER(TRIM(endpoint_name))
+                ORDER BY updated_at DESC
+            ) = 1
+        )""", filter_endpoints)
+        df = fetch_query(
+            context, client, query, job_config=job_config, label="get_snapshot_matrix",
+            ttl=SNAPSHOT_CACHE_TTL, cache_params=cache_params, refresh=refresh, **SNAPSHOT_DTYPES
+        )
+    df.attrs['partition_error'] = partition_error
+    return df
+
+def get_snapshot_matrix(company_ids, endpoint_names=None, debug_mode=False):
+    """
+    Obtiene la última fotografía (último valor bueno, refrescado en segundo plano).
+
+    Args:
+        company_ids: IDs de las compañías del ambiente actual
+        endpoint_names: Endpoints a incluir (None = todos)
+        debug_mode: Si es True, muestra errores y la query ejecutada
+
+    Retorna:
+        DataFrame con company_id, endpoint_name (normalizados) y los campos de la matriz
+    """
+    company_ids = list(company_ids)
+    endpoint_names = list(endpoint_names) if endpoint_names is not None else None
+    context = get_query_context()
+    key = "snapshot:" + cache_key(SNAPSHOT_LATEST_FUNCTION, context['environment'], [company_ids, endpoint_names])
+    try:
+        df, _ = get_data_refresher().get(
+            key,
+            lambda refresh: load_snapshot_matrix(context, company_ids, endpoint_names, refresh=refresh),
+            SNAPSHOT_CACHE_TTL,
+            label="Snapshot"
+        )
+        if debug_mode and df.attrs.get('partition_error'):
+            st.warning(
+                f"🔍 No se pudo leer la última partición del snapshot; se usa la ventana de "
+                f"{SNAPSHOT_LOOKBACK_DAYS} días: {df.attrs['partition_error']}"
+            )
         return df
         
     except Exception as e:
         if debug_mode:
             st.error(f"🔍 Error en BigQuery (Snapshot): {type(e).__name__} - {str(e)}")
             # Mostrar la query para verificar el path de la tabla
-            st.code(query, language="sql")
+            st.code(build_snapshot_matrix_query(
+                f"`{METADATA_PROJECT}.{METADATA_DATASET}.{SNAPSHOT_LATEST_FUNCTION}`(@since)",
+                endpoint_names is not None
+            ), language="sql")
         return pd.DataFrame()
 
-# ========== PASO 3: OBTENER MAX(_etl_synced) POR TABLA ==========
+# ========== PASO 3: CONSTRUIR MATRIZ ==========
 
-def get_last_sync_timestamp(project_id, table_name, debug_mode=False):
+def group_cells_by_project(companies_df, cells):
     """
-    Obtiene el MAX(_etl_synced) de una tabla Bronze en un proyecto específico.
-    Usa exactamente la misma query que funciona en BigQuery Studio.
+    Agrupa celdas (company_name, table_name) por company_project_id.
+    Varias compañías pueden compartir el mismo company_project_id.
     
-    Args:
-        project_id: ID del proyecto de BigQuery (ej: "company-project-123")
-        table_name: Nombre de la tabla en dataset 'bronze' (ej: "business_unit")
-        debug_mode: Si es True, captura y retorna información de errores
-        
     Retorna:
-        datetime con el último timestamp de sincronización, o None si no existe
-        Si debug_mode=True y hay error, retorna (None, error_info)
+        dict: {project_id: [(company_name, table_name), ...]}
     """
-    error_info = None
-    try:
-        # Validar parámetros
-        if not project_id or not table_name:
-            if debug_mode:
-                error_info = f"Parámetros inválidos: project_id={project_id}, table_name={table_name}"
-                return None, error_info
-            return None
-        
-        # Crear cliente BigQuery con la cuenta de servicio correcta
-        client = get_bigquery_client(project_id)
-        
-        # Query exacta que funciona en BigQuery Studio
-        # Formato: `project_id.dataset.table_name`
-        table_ref = f"{project_id}.bronze.{table_name}"
-        query = f"""
-            SELECT MAX(_etl_synced) as max_sync
-            FROM `{table_ref}`
-            WHERE _etl_synced IS NOT NULL
-        """
-        
-        # Ejecutar query con configuración explícita
-        job_config = bigquery.QueryJobConfig()
-        job_config.use_legacy_sql = False
-        
-        query_job = client.query(query, job_config=job_config)
-        
-        # Esperar a que termine y obtener resultado
-        result = query_job.result().to_dataframe()
-        
-        # Verificar resultado
-        if result.empty:
-            if debug_mode:
-                error_info = f"Query ejecutada pero resultado vacío: {table_ref}"
-                return None, error_info
-            return None
-        
-        max_sync_value = result.iloc[0]['max_sync']
-        
-        # Si es None o NaN, retornar None
-        if max_sync_value is None or pd.isna(max_sync_value):
-            if debug_mode:
-                error_info = f"Query ejecutada pero max_sync es NULL: {table_ref}"
-                return None, error_info
-            return None
-        
-        # Convertir a datetime y retornar
-        return pd.to_datetime(max_sync_value)
-        
-    except NotFound as e:
-        # Tabla no existe
-        if debug_mode:
-            error_info = f"Tabla no encontrada: {project_id}.bronze.{table_name} - {str(e)}"
-            return None, error_info
-        return None
-    except Exception as e:
-        # Cualquier otro error (permisos, campo no existe, etc.)
-        if debug_mode:
-            error_info = f"Error en {project_id}.bronze.{table_name}: {type(e).__name__} - {str(e)}"
-            return None, error_info
-        return None
+    company_project_map = dict(zip(companies_df['company_name'], companies_df['company_project_id']))
+    project_cells = {}
+    for company_name, table_name in cells:
+        project_id = company_project_map.get(company_name)
+        project_cells.setdefault(project_id, []).append((company_name, table_name))
+    return project_cells
 
-# ========== PASO 4: CONSTRUIR MATRIZ ==========
+def plan_live_refresh(project_cells, freshness_mode, cost_method=DEFAULT_ESTIMATE_METHOD):
+    """
+    Estima el costo de consultar las celdas y elige el modo efectivo según el presupuesto
+    (ver cost_planner). Las estimaciones no pasan por el limitador adaptativo para no
+    sesgar su latencia base con queries de metadata.
+    """
+    project_tables = {
+        project_id: [table_name for _, table_name in project_cell_list]
+        for project_id, project_cell_list in project_cells.items()
+    }
+    return plan_refresh(
+        get_client_pool().get_client,
+        project_tables,
+        freshness_mode,
+        method=cost_method,
+        max_workers=LIVE_INITIAL_WINDOW
+    )
 
-def build_sync_matrix(companies_df, tables_list, debug_mode=False):
+def render_cost_plan(plan, debug_mode=False):
     """
-    Construye la matriz de sincronización: Compañías (filas) vs Tablas (columnas).
+    Muestra la estimación de bytes/slots del refresco y avisa si el presupuesto degradó el modo.
+    """
+    budget = format_bytes(plan.max_bytes_per_refresh) if plan.max_bytes_per_refresh else "sin tope"
+    st.caption(
+        f"💰 Estimación ({plan.method}): {format_bytes(plan.total_bytes())} · "
+        f"~{plan.slot_seconds():.0f} slot-s · modo {plan.effective_mode} · presupuesto {budget}"
+    )
+    if plan.degraded:
+        st.warning(
+            f"⚠️ El modo {plan.requested_mode} se estima en {format_bytes(plan.total_bytes(plan.requested_mode))} "
+            f"y excede el presupuesto por refresco ({budget}): se usa {plan.effective_mode}"
+        )
+    over_job = plan.over_job_budget()
+    if over_job:
+        st.warning(
+            f"⚠️ {len(over_job)} proyecto(s) con queries sobre el tope por job "
+            f"({format_bytes(plan.max_bytes_per_job)}); las tablas que lo superen mostrarán ❌"
+        )
+    if debug_mode and plan.errors:
+        with st.expander("🔍 Debug - Proyectos sin estimación", expanded=False):
+            for project_id, error in plan.errors.items():
+                st.text(f"{project_id}: {error}")
+
+def get_cell_store():
+    """
+    Almacén de celdas LIVE de la sesión: {(company_name, table_name): {'max_sync', 'fetched_at', 'error'}}.
+    Guarda cuándo se consultó cada celda para el refresco incremental.
+    """
+    if 'live_cell_store' not in st.session_state:
+        st.session_state['live_cell_store'] = {}
+    return st.session_state['live_cell_store']
+
+def fetch_sync_cells(companies_df, cells, debug_mode=False, freshness_mode=DEFAULT_FRESHNESS_MODE,
+                     on_batch=None, batch_every=PROGRESSIVE_EVERY_N, batch_interval_ms=PROGRESSIVE_INTERVAL_MS,
+                     cost_method=DEFAULT_ESTIMATE_METHOD):
+    """
+    Consulta la frescura de un conjunto de celdas compañía × tabla.
+    
+    Para cada proyecto de compañía:
+    - modo "metadata": usa last_modified_time de {project}.bronze.__TABLES__ (el mismo
+      resultado que leyó la estimación de costo) y solo verifica con MAX(_etl_synced)
+      las celdas sospechosas
+    - modo "scan": consulta MAX(_etl_synced) de sus tablas con UNION ALL por bloques
+    - Reparte el timestamp resultante a cada celda compañía-tabla
+      (ver bronze_freshness.fetch_project_freshness)
     
-    Para cada combinación compañía-tabla:
-    - Consulta MAX(_etl_synced) en {company_project_id}.bronze.{table_name}
-    - Almacena el timestamp resultante
+    Antes de ejecutar se estima el costo (cost_planner): cada query de escaneo lleva
+    maximum_bytes_billed y, si el total excede el presupuesto por refresco, se usa
+    un modo más barato.
+    
+    Cada celda consultada se registra en el almacén de celdas con su fetched_at.
     
     Args:
         companies_df: DataFrame con compañías (debe tener company_project_id)
-        tables_list: Lista de nombres de tablas de Bronze
+        cells: Lista de tuplas (company_name, table_name) a consultar
         debug_mode: Si es True, muestra información detallada de errores
+        freshness_mode: "metadata" (rápido, por defecto) o "scan" (preciso)
+        on_batch: Callback opcional on_batch(results_by_cell) con los resultados parciales,
+                  llamado cada `batch_every` proyectos o cada `batch_interval_ms` ms
+        cost_method: Método de estimación de costo ("metadata" o "dry_run")
         
     Retorna:
-        DataFrame con:
-            - Índices (filas) = nombres de compañías
-            - Columnas = nombres de tablas
-            - Valores = timestamps de MAX(_etl_synced) o None
+        dict: {(company_name, table_name): timestamp o None}
     """
-    # Estructura inicializada
-    matrix_data = {company['company_name']: {} for _, company in companies_df.iterrows()}
+    results_by_cell = {}
     error_log = []  # Para registrar errores si debug_mode está activo
     sql_log = []  # Para registrar las queries SQL ejecutadas
+    cell_store = get_cell_store()
     
-    # Crear mapeo de company_name a company_id para ordenar después
-    company_id_map = dict(zip(companies_df['company_name'], companies_df['company_id']))
+    # Agrupar celdas por proyecto: una tarea por proyecto (no por celda)
+    project_cells = group_cells_by_project(companies_df, cells)
+    
+    if not project_cells:
+        return results_by_cell
+    
+    # Estimar costo y aplicar el presupuesto (modo efectivo + tope por job)
+    with st.spinner("💰 Estimando costo..."):
+        plan = plan_live_refresh(project_cells, freshness_mode, cost_method)
+    render_cost_plan(plan, debug_mode=debug_mode)
     
-    # Preparar lista de tareas
-    tasks = []
-    for _, company in companies_df.iterrows():
-        company_name = company['company_name']
-        project_id = company['company_project_id']
-        for table_name in tables_list:
-            tasks.append({
-                'company_name': company_name,
-                'project_id': project_id,
-                'table_name': table_name
-            })
-            
     # Barra de progreso
     progress_bar = st.progress(0)
     status_text = st.empty()
-    total_cells = len(tasks)
-    current_cell = 0
+    total_projects = len(project_cells)
+    current_project = 0
+    
+    # Resolver pool y limitador en el hilo principal (los hilos del executor no tienen contexto de Streamlit)
+    client_pool = get_client_pool()
+    limiter = get_concurrency_limiter()
     
-    # Función auxiliar para el hilo
-    def _fetch_task(task):
-        res = get_last_sync_timestamp(task['project_id'], task['table_name'], debug_mode=debug_mode)
-        return task, res
+    # Control del renderizado parcial
+    pending_batch = 0
+    last_batch_at = time.monotonic()
+    
+    # Función auxiliar para el hilo: metadata y/o UNION ALL por bloque de tablas del proyecto
+    # La ventana adaptativa decide cuántas tareas corren a la vez; los errores de cuota se reintentan
+    def _fetch_project(project_id):
+        project_tables = sorted({table_name for _, table_name in project_cells[project_id]})
+        client = client_pool.get_client(project_id)
+        try:
+            results, queries = limiter.run(
+                project_id,
+                lambda: fetch_project_freshness(client, project_id, project_tables,
+                                                **plan.fetch_options(project_id))
+            )
+        except Exception as e:
+            # Cuota agotada tras los reintentos (o error inesperado): aplica a todas las celdas del proyecto
+            error_msg = f"Error en {project_id}: {type(e).__name__} - {str(e)}"
+            results = {table_name: (None, error_msg) for table_name in project_tables}
+            queries = []
+        return project_id, results, queries
         
-    # Procesamiento en paralelo
-    with concurrent.futures.ThreadPoolExecutor(max_workers=15) as executor:
-        futures = {executor.submit(_fetch_task, task): task for task in tasks}
+    # Procesamiento en paralelo (por proyecto); el executor se dimensiona al techo de la ventana
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(LIVE_MAX_WORKERS, total_projects)) as executor:
+        futures = [executor.submit(_fetch_project, project_id) for project_id in project_cells]
         
         for future in concurrent.futures.as_completed(futures):
-            task, result = future.result()
-            company_name = task['company_name']
-            table_name = task['table_name']
-            project_id = task['project_id']
+            project_id, results, queries = future.result()
+            company_names = sorted({company_name for company_name, _ in project_cells[project_id]})
+            fetched_at = datetime.now(pytz.utc)
             
-            # Si debug_mode, reconstruimos el log
+            # Si debug_mode, registramos las queries generadas para el proyecto
             if debug_mode:
-                table_ref = f"{project_id}.bronze.{table_name}"
-                sql_query = f"SELECT MAX(_etl_synced) as max_sync FROM `{table_ref}` WHERE _etl_synced IS NOT NULL"
-                sql_log.append(f"**{company_name} - {table_name}**\n```sql\n{sql_query}\n```\n")
+                for sql_query in queries:
+                    sql_log.append(f"**{', '.join(company_names)} ({project_id})**\n```sql\n{sql_query}\n```\n")
             
-            # Manejar resultado (puede ser tuple si debug_mode está activo)
-            if isinstance(result, tuple):
-                last_sync, error_msg = result
-                if error_msg:
+            # Repartir cada fila del resultado a su celda (compañía × tabla)
+            for company_name, table_name in project_cells[project_id]:
+                last_sync, error_msg = results.get(table_name, (None, None))
+                if debug_mode and error_msg:
                     error_log.append(f"{company_name} - {table_name}: {error_msg}")
-            else:
-                last_sync = result
-            
-            # Guardamos el resultado en la matriz
-            matrix_data[company_name][table_name] = last_sync
+                results_by_cell[(company_name, table_name)] = last_sync
+                cell_store[(company_name, table_name)] = {
+                    'max_sync': last_sync,
+                    'fetched_at': fetched_at,
+                    'error': error_msg
+                }
             
             # Actualizar progreso
-            current_cell += 1
-            progress = current_cell / total_cells
+            current_project += 1
+            progress = current_project / total_projects
             progress_bar.progress(progress)
-            status_text.text(f"Procesando en paralelo: {company_name} - {table_name} ({current_cell}/{total_cells})")
+            status_text.text(f"Procesando en paralelo: {', '.join(company_names)} ({current_project}/{total_projects} proyectos)")
+            
+            # Entregar resultados parciales cada N proyectos o cada X ms
+            if on_batch is not None:
+                pending_batch += 1
+                elapsed_ms = (time.monotonic() - last_batch_at) * 1000
+                if pending_batch >= batch_every or elapsed_ms >= batch_interval_ms:
+                    on_batch(results_by_cell)
+                    pending_batch = 0
+                    last_batch_at = time.monotonic()
     
     
     progress_bar.empty()
@@ -437,6 +750,18 @@ def build_sync_matrix(companies_df, tables_list, debug_mode=False):
     
     # Mostrar SQL y errores si debug_mode está activo
     if debug_mode:
+        limiter_stats = limiter.stats()
+        with st.expander("⚙️ Debug - Concurrencia adaptativa", expanded=False):
+            col_window, col_retries, col_throttled = st.columns(3)
+            col_window.metric("Ventana actual", f"{limiter_stats['window']}/{LIVE_MAX_WORKERS}",
+                              help=f"Pico: {limiter_stats['peak_window']} · Máx. por proyecto: {LIVE_PER_PROJECT_LIMIT}")
+            col_retries.metric("Reintentos (cuota)", limiter_stats['retries'])
+            col_throttled.metric("Errores de cuota", limiter_stats['throttled'],
+                                 help=f"Agotaron reintentos: {limiter_stats['exhausted']}")
+            if limiter_stats['baseline_latency'] is not None:
+                st.caption(f"Latencia base por proyecto: {limiter_stats['baseline_latency']:.2f}s · "
+                           f"{limiter_stats['completed']} tareas completadas")
+        
         with st.expander("🔍 Debug - Queries SQL Ejecutadas", expanded=True):
             if sql_log:
                 for sql_entry in sql_log:
@@ -450,6 +775,76 @@ def build_sync_matrix(companies_df, tables_list, debug_mode=False):
                 for error in error_log:
                     st.text(error)
     
+    return results_by_cell
+
+def build_sync_matrix(companies_df, tables_list, debug_mode=False, freshness_mode=DEFAULT_FRESHNESS_MODE,
+                      progressive=False, cost_method=DEFAULT_ESTIMATE_METHOD):
+    """
+    Construye la matriz de sincronización: Compañías (filas) vs Tablas (columnas).
+    
+    Consulta todas las celdas compañía × tabla con fetch_sync_cells.
+    
+    Args:
+        companies_df: DataFrame con compañías (debe tener company_project_id)
+        tables_list: Lista de nombres de tablas de Bronze
+        debug_mode: Si es True, muestra información detallada de errores
+        freshness_mode: "metadata" (rápido, por defecto) o "scan" (preciso)
+        progressive: Si es True, muestra una tabla parcial que se actualiza por lotes
+                     mientras llegan los resultados (⏳ = celda pendiente)
+        cost_method: Método de estimación de costo ("metadata" o "dry_run")
+        
+    Retorna:
+        DataFrame con:
+            - Índices (filas) = nombres de compañías
+            - Columnas = nombres de tablas
+            - Valores = timestamps de MAX(_etl_synced) o None
+    """
+    # Estructura inicializada
+    matrix_data = {company_name: {} for company_name in companies_df['company_name']}
+    
+    # Crear mapeo de company_name a company_id para ordenar después
+    company_id_map = dict(zip(companies_df['company_name'], companies_df['company_id']))
+    
+    cells = [(company_name, table_name) for company_name in matrix_data for table_name in tables_list]
+    
+    # Renderizado progresivo: tabla parcial en un placeholder
+    partial_placeholder = st.empty() if progressive else None
+    
+    def _render_partial(results_by_cell):
+        company_names = sorted(matrix_data, key=lambda name: company_id_map.get(name))
+        index = pd.Index(company_names, name='Compañía')
+        pending = pd.DataFrame(
+            {
+                table_name: [(company_name, table_name) not in results_by_cell for company_name in company_names]
+                for table_name in tables_list
+            },
+            index=index
+        )
+        timestamps = pd.DataFrame(
+            {
+                table_name: [results_by_cell.get((company_name, table_name)) for company_name in company_names]
+                for table_name in tables_list
+            },
+            index=index
+        )
+        partial = format_matrix(matrix_from_live(timestamps)).mask(pending, "⏳")
+        partial_placeholder.table(partial)
+    
+    results_by_cell = fetch_sync_cells(
+        companies_df,
+        cells,
+        debug_mode=debug_mode,
+        freshness_mode=freshness_mode,
+        on_batch=_render_partial if progressive else None,
+        cost_method=cost_method
+    )
+    
+    if partial_placeholder is not None:
+        partial_placeholder.empty()
+    
+    for (company_name, table_name), last_sync in results_by_cell.items():
+        matrix_data[company_name][table_name] = last_sync
+    
     # Convertir a DataFrame
     # matrix_data es un dict: {company: {table: timestamp}}
     # Al crear DataFrame(matrix_data) obtenemos:
@@ -472,54 +867,117 @@ def build_sync_matrix(companies_df, tables_list, debug_mode=False):
     
     return matrix_df
 
-# ========== FORMATO PARA VISUALIZACIÓN ==========
+# ========== REFRESCO INCREMENTAL ==========
 
-def format_cell_data(data, show_rows=True, show_duration=True, show_delta=True):
+def seed_cell_store_from_snapshot(snapshot_df, companies_df, tables_list):
     """
-    Formatea la celda:
-      Línea 1: 🟢 04-16 14:30   (icono + fecha en CDMX)
-      Línea 2: Δ:+150 | τ:+2s  (métricas, solo si hay datos reales)
+    Registra en el almacén de celdas las celdas que vienen del snapshot, con
+    fetched_at = updated_at de su fila (el momento en que el writer las consultó).
+    
+    Así el refresco incremental no trata como "nunca consultadas" las celdas
+    del snapshot que aún están dentro de max_age_minutes. Una celda ya
+    consultada en LIVE después de ese updated_at no se pisa.
+    
+    Args:
+        snapshot_df: DataFrame del snapshot (company_id, endpoint_name, max_sync, updated_at)
+        companies_df: DataFrame con company_id y company_name
+        tables_list: Lista de endpoints de metadata (para recuperar el nombre real de la tabla)
     """
-    if not isinstance(data, dict) or data.get('max_sync') is None or pd.isna(data.get('max_sync')):
-        return "❌"
+    if 'updated_at' not in snapshot_df.columns:
+        return
+    cell_store = get_cell_store()
+    id_to_name = dict(zip(normalize_company_id(companies_df['company_id']), companies_df['company_name']))
+    table_name_map = {t.lower().strip(): t for t in tables_list}
     
-    # Línea 1: Icono + Fecha
-    ts = to_cdmx(data['max_sync'])
-    sts = data.get('actual_status')
-    status = str(sts).upper() if not pd.isna(sts) else ''
+    rows = pd.DataFrame({
+        'company_name': normalize_company_id(snapshot_df['company_id']).map(id_to_name),
+        'endpoint': normalize_endpoint(snapshot_df['endpoint_name']),
+        'max_sync': snapshot_df['max_sync'],
+        'updated_at': pd.to_datetime(snapshot_df['updated_at'], utc=True),
+    }).dropna(subset=['company_name', 'updated_at'])
     
-    if status == 'SUCCESS':
-        icon = "🟢"
-    elif status == 'FAILED':
-        icon = "🔴"
-    else:
-        diff = datetime.now(ts.tzinfo) - ts
-        icon = "🔴" if diff.days >= 2 else ("🟡" if diff.days >= 1 else "🟢")
+    for company_name, endpoint, max_sync, updated_at in rows.itertuples(index=False):
+        key = (company_name, table_name_map.get(endpoint, endpoint))
+        stored = cell_store.get(key)
+        if stored is None or stored['fetched_at'] < updated_at:
+            cell_store[key] = {
+                'max_sync': None if pd.isna(max_sync) else max_sync,
+                'fetched_at': updated_at,
+                'error': None
+            }
+
+def select_stale_cells(processed_matrix, tables_list, max_age_minutes):
+    """
+    Selecciona las celdas de la matriz que deben volver a consultarse.
     
-    line1 = f"{icon} {ts.strftime('%m-%d %H:%M')}"
+    Una celda se re-consulta si:
+    - No tiene max_sync (se muestra ❌)
+    - Su actual_status del snapshot es FAILED
+    - Nunca se consultó (en LIVE o vía snapshot) o su fetched_at supera max_age_minutes
     
-    # Línea 2: métricas (solo si hay datos reales, excluyendo Null, NaN, pd.NA)
-    parts = []
+    Args:
+        processed_matrix: Matriz columnar actual (ver matrix_pipeline)
+        tables_list: Lista de endpoints de metadata (para recuperar el nombre real de la tabla)
+        max_age_minutes: Antigüedad máxima de una celda antes de re-consultarla
+        
+    Retorna:
+        Lista de tuplas (company_name, column, table_name)
+    """
+    cell_store = get_cell_store()
+    now = datetime.now(pytz.utc)
+    max_age = timedelta(minutes=max_age_minutes)
+    # Las columnas del snapshot están normalizadas en minúsculas
+    table_name_map = {t.lower().strip(): t for t in tables_list}
+    max_sync_matrix = processed_matrix['max_sync']
+    status_matrix = processed_matrix['actual_status']
     
-    act_r = data.get('actual_rows')
-    lst_r = data.get('last_rows')
-    if show_rows and not pd.isna(act_r):
-        if show_delta and not pd.isna(lst_r):
-            d = int(act_r) - int(lst_r)
-            parts.append(f"Δ:{'+' if d >= 0 else ''}{d}")
-        else:
-            parts.append(f"R:{int(act_r)}")
-    
-    act_d = data.get('actual_duration')
-    lst_d = data.get('last_duration')
-    if show_duration and not pd.isna(act_d):
-        if show_delta and not pd.isna(lst_d):
-            d = float(lst_d) - float(act_d)
-            parts.append(f"{'⚠️' if d < 0 else 'τ:'}{'+' if d >= 0 else ''}{d:.1f}s")
-        else:
-            parts.append(f"τ:{float(act_d):.1f}s")
+    stale = []
+    for column in max_sync_matrix.columns:
+        table_name = table_name_map.get(column, column)
+        missing = max_sync_matrix[column].isna()
+        failed = status_matrix[column].str.upper().eq('FAILED').fillna(False)
+        for company_name, is_missing, is_failed in zip(max_sync_matrix.index, missing, failed):
+            stored = cell_store.get((company_name, table_name))
+            if is_missing or is_failed or stored is None or now - stored['fetched_at'] > max_age:
+                stale.append((company_name, column, table_name))
+    return stale
+
+def refresh_matrix_incremental(processed_matrix, companies_df, tables_list, max_age_minutes,
+                               debug_mode=False, freshness_mode=DEFAULT_FRESHNESS_MODE,
+                               cost_method=DEFAULT_ESTIMATE_METHOD):
+    """
+    Re-consulta solo las celdas obsoletas, fallidas o sin dato y las fusiona en la matriz.
+    
+    Una celda re-consultada solo se reemplaza si el nuevo max_sync es más reciente;
+    en ese caso se limpia actual_status (el estatus del snapshot ya no aplica).
+    
+    Retorna:
+        tuple (processed_matrix actualizada, cantidad de celdas re-consultadas)
+    """
+    stale = select_stale_cells(processed_matrix, tables_list, max_age_minutes)
+    if not stale:
+        return processed_matrix, 0
+    
+    results_by_cell = fetch_sync_cells(
+        companies_df,
+        [(company_name, table_name) for company_name, _, table_name in stale],
+        debug_mode=debug_mode,
+        freshness_mode=freshness_mode,
+        cost_method=cost_method
+    )
+    
+    merged = processed_matrix.copy()
+    for company_name, column, table_name in stale:
+        new_sync = results_by_cell.get((company_name, table_name))
+        if new_sync is None or pd.isna(new_sync):
+            continue
+        new_sync = to_utc(new_sync)
+        old_sync = merged.at[company_name, ('max_sync', column)]
+        if pd.isna(old_sync) or new_sync > to_utc(old_sync):
+            merged.at[company_name, ('max_sync', column)] = new_sync
+            merged.at[company_name, ('actual_status', column)] = pd.NA
     
-    return f"{line1}\n{' | '.join(parts)}" if parts else line1
+    return merged, len(stale)
 
 # ========== INTERFAZ STREAMLIT ==========
 
@@ -588,25 +1046,65 @@ with st.sidebar:
     show_duration = st.checkbox("Mostrar Duración (τ)", value=True)
     show_delta = st.checkbox("Mostrar Diferenciales", value=True, help="Muestra la resta contra la ejecución anterior")
     
+    # Modo de frescura para la carga LIVE
+    freshness_mode = st.selectbox(
+        "Modo de frescura (LIVE)",
+        FRESHNESS_MODES,
+        index=FRESHNESS_MODES.index(DEFAULT_FRESHNESS_MODE),
+        help="metadata: una query a __TABLES__ por proyecto (last_modified_time) y escaneo solo de celdas sospechosas. "
+             "scan: MAX(_etl_synced) escaneando todas las tablas."
+    )
+    
+    # Estimación de costo y presupuesto de la carga LIVE
+    cost_method = st.selectbox(
+        "Estimación de costo (LIVE)",
+        ESTIMATE_METHODS,
+        index=ESTIMATE_METHODS.index(DEFAULT_ESTIMATE_METHOD),
+        help="metadata: bytes ≈ row_count × 8 desde __TABLES__. dry_run: dry run de cada query (exacto, más lento)."
+    )
+    st.caption(
+        f"💰 Tope por job: {format_bytes(LIVE_MAX_BYTES_PER_JOB) if LIVE_MAX_BYTES_PER_JOB else 'sin tope'} · "
+        f"por refresco: {format_bytes(LIVE_MAX_BYTES_PER_REFRESH) if LIVE_MAX_BYTES_PER_REFRESH else 'sin tope'}"
+    )
+    
+    # Renderizado progresivo de la carga LIVE
+    progressive_render = st.checkbox(
+        "Renderizado progresivo (LIVE)",
+        value=True,
+        help="Muestra la matriz parcial mientras llegan los resultados (⏳ = pendiente)"
+    )
+    
     # Modo debug
     debug_mode = st.checkbox("🔍 Modo Debug", value=False, help="Muestra información detallada de errores cuando aparecen ❌")
     
     if st.button("🔄 Actualizar Datos (LIVE)", type="primary"):
-        # Al presionar, forzamos limpieza pero el recálculo será paralelo
-        st.cache_data.clear()
+        # LIVE consulta Bronze directamente; compañías, metadata y snapshot
+        # siguen en el caché persistente hasta que venza su TTL
         st.session_state['data_source'] = 'live'
         st.rerun()
     
+    # Refresco incremental: solo celdas obsoletas, ❌ o FAILED (no limpia caches)
+    max_age_minutes = st.number_input(
+        "Antigüedad máx. de celda (min)",
+        min_value=1,
+        value=30,
+        help="En el refresco incremental se re-consultan las celdas consultadas hace más de este tiempo"
+    )
+    if st.button("⚡ Actualizar Incremental", help="Re-consulta solo celdas obsoletas, con ❌ o con estatus FAILED"):
+        st.session_state['data_source'] = 'incremental'
+        st.session_state['incremental_pending'] = True
+        st.rerun()
+    
     st.markdown("---")
     
     # DIAGNÓSTICO DIRECTO - Para depurar el problema de X
     with st.expander("🩺 Diagnóstico Snapshot", expanded=False):
         if st.button("🔎 Ver datos crudos del Snapshot"):
             try:
-                diag_client = bigquery.Client(project=METADATA_PROJECT)
+                diag_client = get_bigquery_client(METADATA_PROJECT)
                 diag_query = f"""
                     SELECT company_id, endpoint_name, max_sync, actual_status
-                    FROM `{METADATA_PROJECT}.{METADATA_DATASET}.etl_monitoring_snapshot`
+                    FROM `{METADATA_PROJECT}.{METADATA_DATASET}.{SNAPSHOT_TABLE}`
                     LIMIT 20
                 """
                 diag_df = diag_client.query(diag_query).to_dataframe()
@@ -643,6 +1141,13 @@ with st.sidebar:
     else:
         st.caption(f"✅ {len(tables_list)} endpoints encontrados en metadata")
     
+    # Estimación sin ejecutar: bytes/slots que costaría la carga LIVE completa
+    if st.button("💰 Estimar costo LIVE", help="Estima los bytes a escanear sin ejecutar la carga"):
+        all_cells = [(company_name, table_name) for company_name in companies_df['company_name'] for table_name in tables_list]
+        with st.spinner("💰 Estimando costo..."):
+            live_plan = plan_live_refresh(group_cells_by_project(companies_df, all_cells), freshness_mode, cost_method)
+        render_cost_plan(live_plan, debug_mode=debug_mode)
+    
 # ========== PROCESAMIENTO E INTERFAZ ==========
 
 # 1. Decidir origen de datos
@@ -651,99 +1156,76 @@ if 'data_source' not in st.session_state:
 
 # 2. Cargar datos base
 with st.spinner("Cargando matriz..."):
-    if st.session_state['data_source'] == 'live':
-        matrix_df = build_sync_matrix(companies_df, tables_list, debug_mode=debug_mode)
-        # Convertir a formato dict para el formateador
-        processed_matrix = matrix_df.applymap(lambda x: {'max_sync': x})
+    # En modo incremental se parte de la última matriz mostrada (si existe)
+    base_matrix = st.session_state.get('processed_matrix') if st.session_state['data_source'] == 'incremental' else None
+    
+    if base_matrix is not None:
+        processed_matrix = base_matrix
+    elif st.session_state['data_source'] == 'live':
+        matrix_df = build_sync_matrix(companies_df, tables_list, debug_mode=debug_mode, freshness_mode=freshness_mode, progressive=progressive_render, cost_method=cost_method)
+        # Convertir a la matriz columnar (solo max_sync)
+        processed_matrix = matrix_from_live(matrix_df)
     else:
-        snapshot_df = get_snapshot_matrix(debug_mode=debug_mode)
+        snapshot_df = get_snapshot_matrix(companies_df['company_id'], debug_mode=debug_mode)
         
         # Validar si el snapshot tiene datos
         if snapshot_df.empty:
             st.warning("⚠️ No se encontraron registros en la tabla de snapshot. Realizando carga LIVE...")
-            matrix_df = build_sync_matrix(companies_df, tables_list, debug_mode=debug_mode)
-            processed_matrix = matrix_df.applymap(lambda x: {'max_sync': x})
+            matrix_df = build_sync_matrix(companies_df, tables_list, debug_mode=debug_mode, freshness_mode=freshness_mode, progressive=progressive_render, cost_method=cost_method)
+            processed_matrix = matrix_from_live(matrix_df)
         else:
             # NORMALIZACIÓN ROBUSTA DE IDs (Convertir a String y quitar .0 si existe)
-            snapshot_df['id_clean'] = snapshot_df['company_id'].astype(str).str.replace(r'\.0$', '', regex=True).str.strip()
-            companies_df['id_clean'] = companies_df['company_id'].astype(str).str.replace(r'\.0$', '', regex=True).str.strip()
-            
-            # Crear mapeo
-            id_to_name = dict(zip(companies_df['id_clean'], companies_df['company_name']))
-            
-            # Mapear compañías
-            snapshot_df['Compañía'] = snapshot_df['id_clean'].map(id_to_name)
+            snapshot_ids = normalize_company_id(snapshot_df['company_id'])
+            catalog_ids = normalize_company_id(companies_df['company_id'])
             
             # Contar coincidencias
-            mapped_rows = snapshot_df[snapshot_df['Compañía'].notna()].copy()
+            mapped_mask = snapshot_ids.isin(set(catalog_ids))
+            mapped_count = int(mapped_mask.sum())
             
-            if len(mapped_rows) == 0:
+            if mapped_count == 0:
                 st.error("❌ Error de Mapeo Crítico: Ningún ID del Snapshot coincide con las compañías activas.")
                 if debug_mode:
-                    st.write("IDs en Snapshot (Clean):", snapshot_df['id_clean'].unique())
-                    st.write("IDs en Catálogo (Clean):", companies_df['id_clean'].unique())
+                    st.write("IDs en Snapshot (Clean):", snapshot_ids.unique())
+                    st.write("IDs en Catálogo (Clean):", catalog_ids.unique())
                 
                 st.info("💡 Cambiando automáticamente a modo LIVE para obtener datos frescos...")
-                matrix_df = build_sync_matrix(companies_df, tables_list, debug_mode=debug_mode)
-                processed_matrix = matrix_df.applymap(lambda x: {'max_sync': x})
+                matrix_df = build_sync_matrix(companies_df, tables_list, debug_mode=debug_mode, freshness_mode=freshness_mode, progressive=progressive_render, cost_method=cost_method)
+                processed_matrix = matrix_from_live(matrix_df)
             else:
                 if debug_mode:
-                    st.success(f"✅ Snapshot vinculado: {len(mapped_rows)} registros coinciden con compañías.")
+                    st.success(f"✅ Snapshot vinculado: {mapped_count} registros coinciden con compañías.")
                     with st.expander("📦 Vista previa datos Snapshot vinculados", expanded=False):
-                        st.write(mapped_rows.head(20))
-                
-                # Normalizar endpoint_name del snapshot (lowercase + strip)
-                # El snapshot guarda directamente el endpoint.name del proceso ETL
-                mapped_rows['ep_key'] = (
-                    mapped_rows['endpoint_name']
-                    .astype(str)
-                    .str.lower()
-                    .str.strip()
-                )
-                
-                # Generar matriz usando endpoint_name directamente como columna
-                pivoted = {}
-                for _, row in mapped_rows.iterrows():
-                    comp = row['Compañía']
-                    ep = row['ep_key']
-                    if not ep: continue
-                    if comp not in pivoted: pivoted[comp] = {}
-                    pivoted[comp][ep] = {
-                        'max_sync': row['max_sync'],
-                        'actual_rows': row['actual_rows'],
-                        'last_rows': row['last_rows'],
-                        'actual_duration': row['actual_duration'],
-                        'last_duration': row['last_duration'],
-                        'actual_status': row['actual_status']
-                    }
-                
-                processed_matrix = pd.DataFrame(pivoted).T
+                        st.write(snapshot_df[mapped_mask].head(20))
                 
+                # Pivot columnar company_id × endpoint_name (endpoint normalizado a lowercase)
                 # Columnas: unión de endpoints del snapshot + endpoints de metadata
-                # Ambos ya normalizados (lowercase)
-                metadata_eps = sorted([e.lower().strip() for e in tables_list])
-                snapshot_eps = sorted(processed_matrix.columns.tolist())
-                all_cols = sorted(set(metadata_eps) | set(snapshot_eps))
-                
-                for col in all_cols:
-                    if col not in processed_matrix.columns:
-                        processed_matrix[col] = None
-                
-                processed_matrix = processed_matrix[all_cols]
-                
-                # Ordenar filas por company_id
-                company_id_map = dict(zip(companies_df['company_name'], companies_df['company_id']))
-                processed_matrix['_sort'] = processed_matrix.index.map(company_id_map)
-                processed_matrix = processed_matrix.sort_values('_sort').drop('_sort', axis=1)
+                processed_matrix = pivot_snapshot(snapshot_df, companies_df, tables_list)
+                # Las celdas del snapshot cuentan como consultadas en su updated_at
+                seed_cell_store_from_snapshot(snapshot_df, companies_df, tables_list)
+
+    # 3. Refresco incremental: re-consultar solo las celdas necesarias y fusionarlas
+    if st.session_state['data_source'] == 'incremental' and st.session_state.pop('incremental_pending', False):
+        processed_matrix, refreshed_cells = refresh_matrix_incremental(
+            processed_matrix,
+            companies_df,
+            tables_list,
+            max_age_minutes,
+            debug_mode=debug_mode,
+            freshness_mode=freshness_mode,
+            cost_method=cost_method
+        )
+        total_matrix_cells = processed_matrix['max_sync'].size
+        st.caption(f"⚡ Refresco incremental: {refreshed_cells}/{total_matrix_cells} celdas re-consultadas")
+
+st.session_state['processed_matrix'] = processed_matrix
 
 # Mostrar matriz
 st.markdown(f"**📊 Matriz: Compañías vs Tablas Bronze (Origen: {st.session_state['data_source'].upper()})**")
 st.caption("Icono representa el estatus de la última corrida. Δ = Diferencia de filas. τ = Efectividad de tiempo (Positivo es mejor).")
+render_data_age_badge()
 
-# Crear versión formateada para visualización
-display_df = processed_matrix.copy()
-for col in display_df.columns:
-    display_df[col] = display_df[col].apply(lambda x: format_cell_data(x, show_rows, show_duration, show_delta))
+# Crear versión formateada para visualización (formato vectorizado de toda la matriz)
+display_df = format_matrix(processed_matrix, show_rows, show_duration, show_delta)
 
 # Mostrar la matriz usando st.table() con CSS personalizado para evitar scroll
 st.table(display_df)
@@ -752,40 +1234,26 @@ st.table(display_df)
 st.markdown("**📈 Estadísticas**")
 col1, col2, col3 = st.columns(3)
 
-# Función auxiliar para contar celdas válidas (que tienen max_sync)
-def is_synced(cell):
-    return cell is not None and isinstance(cell, dict) and cell.get('max_sync') is not None and not pd.isna(cell.get('max_sync'))
+# Una sola pasada vectorizada sobre el bloque max_sync
+stats = matrix_stats(processed_matrix, total_cells=len(tables_list) * len(companies_df))
 
 with col1:
-    total_cells = len(tables_list) * len(companies_df)
-    # Contar celdas que tienen data
-    synced_cells = 0
-    for col in processed_matrix.columns:
-        synced_cells += processed_matrix[col].apply(is_synced).sum()
-    st.metric("Tablas Sincronizadas", f"{synced_cells}/{total_cells}")
+    st.metric("Tablas Sincronizadas", f"{stats['synced']}/{stats['total']}")
 
 with col2:
-    recent_syncs = 0
-    now = datetime.now(pytz.utc) # Comparar en UTC
-    for col in processed_matrix.columns:
-        for val in processed_matrix[col]:
-            if is_synced(val):
-                try:
-                    ts = val['max_sync']
-                    if isinstance(ts, pd.Timestamp):
-                        ts = ts.to_pydatetime()
-                    
-                    # Asegurar que ts sea aware
-                    if ts.tzinfo is None:
-                        ts = pytz.utc.localize(ts)
-                    
-                    time_diff = now - ts
-                    if time_diff.days <= 1:
-                        recent_syncs += 1
-                except:
-                    pass
-    st.metric("Sincronizadas últimas 24h", recent_syncs)
+    st.metric("Sincronizadas últimas 24h", stats['recent_24h'])
 
 with col3:
-    missing_cells = total_cells - synced_cells
-    st.metric("Tablas Faltantes", missing_cells)
+    st.metric("Tablas Faltantes", stats['missing'])
+
+# Histograma de antigüedad de las celdas sincronizadas
+st.caption("⏱️ Antigüedad: " + " · ".join(f"{label}: {count}" for label, count in stats['staleness'].items()))
+
+# Descargas de BigQuery (filas, bytes y ruta Storage/REST por query)
+if debug_mode:
+    with st.expander("📦 Descargas BigQuery", expanded=False):
+        st.dataframe(get_fetch_stats().summary(), use_container_width=True)
+    cache_errors = get_cache_errors()
+    if not cache_errors.empty:
+        with st.expander(f"⚠️ Errores del caché de resultados ({len(cache_errors)})", expanded=False):
+            st.dataframe(cache_errors, use_container_width=True)
@@ -8,13 +8,22 @@ Función: Captura información de accesos en BigQuery y la almacena en una tabla
 import os
 import argparse
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Set, Tuple
 from collections import defaultdict
 
 from google.cloud import bigquery
 from google.api_core.exceptions import NotFound, PermissionDenied
 import logging
 
+from bq_client_pool import get_client
+from iam_crawler import DatasetCrawler, DEFAULT_CRAWL_MAX_WORKERS, DEFAULT_CRAWL_PER_PROJECT
+from table_inventory import load_table_inventory, dataset_table_count
+from object_privileges import (
+    ACCESS_BACKENDS, DEFAULT_ACCESS_BACKEND, load_object_privileges, group_by_dataset, normalize_role
+)
+from bq_load_writer import load_records
+from iam_diff import diff_snapshots, build_history_records, covers_dataset, exclude_datasets, select_datasets
+
 # ========== CONFIGURACIÓN LOGGING ==========
 logging.basicConfig(
     level=logging.INFO,
@@ -43,6 +52,10 @@ AUDIT_PROJECT = "pph-central"
 AUDIT_DATASET = "management"
 AUDIT_TABLE_IAM_SNAPSHOT = "iam_access_snapshot"
 AUDIT_TABLE_IAM_HISTORY = "iam_access_history"
+AUDIT_TABLE_IAM_CRAWL_STATUS = "iam_crawl_status"
+
+# Días hacia atrás para buscar el snapshot anterior al comparar
+DEFAULT_DIFF_LOOKBACK_DAYS = int(os.environ.get("IAM_DIFF_LOOKBACK_DAYS", "7"))
 
 
 # ========== ESQUEMA DE TABLAS ==========
@@ -52,6 +65,7 @@ SCHEMA_SNAPSHOT = [
     bigquery.SchemaField("environment", "STRING", mode="REQUIRED"),
     bigquery.SchemaField("source_project_id", "STRING", mode="REQUIRED"),
     bigquery.SchemaField("dataset_id", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("table_id", "STRING", mode="NULLABLE"),  # NULL = grant a nivel dataset
     bigquery.SchemaField("principal_email", "STRING", mode="REQUIRED"),
     bigquery.SchemaField("principal_type", "STRING", mode="REQUIRED"),  # USER, SERVICE_ACCOUNT, GROUP
     bigquery.SchemaField("role", "STRING", mode="NULLABLE"),
@@ -67,12 +81,31 @@ SCHEMA_HISTORY = SCHEMA_SNAPSHOT + [
     bigquery.SchemaField("new_value", "JSON", mode="NULLABLE"),
 ]
 
+# Datasets cuyos permisos no se pudieron leer en cada snapshot (una fila por dataset fallido)
+SCHEMA_CRAWL_STATUS = [
+    bigquery.SchemaField("snapshot_date", "DATE", mode="REQUIRED"),
+    bigquery.SchemaField("snapshot_timestamp", "TIMESTAMP", mode="REQUIRED"),
+    bigquery.SchemaField("environment", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("source_project_id", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("dataset_id", "STRING", mode="NULLABLE"),  # NULL = falló el proyecto completo
+]
+
 
 # ========== FUNCIONES AUXILIARES ==========
 
 def get_bigquery_client(project_id: str) -> bigquery.Client:
-    """Obtiene cliente de BigQuery para un proyecto específico."""
-    return bigquery.Client(project=project_id)
+    """Obtiene el cliente BigQuery compartido (pool del proceso) de un proyecto."""
+    return get_client(project_id)
+
+
+def add_missing_columns(client: bigquery.Client, table: bigquery.Table, schema: List[bigquery.SchemaField]) -> None:
+    """Agrega a una tabla existente las columnas NULLABLE del esquema que le falten (ej. table_id)."""
+    existing = {field.name for field in table.schema}
+    missing = [field for field in schema if field.name not in existing and field.mode != "REQUIRED"]
+    if missing:
+        table.schema = list(table.schema) + missing
+        client.update_table(table, ["schema"])
+        logger.info(f"Columnas agregadas a {table.table_id}: {', '.join(field.name for field in missing)}")
 
 
 def ensure_audit_tables(client: bigquery.Client) -> bool:
@@ -93,7 +126,7 @@ def ensure_audit_tables(client: bigquery.Client) -> bool:
     # Crear tabla de snapshots
     table_id = f"{AUDIT_PROJECT}.{AUDIT_DATASET}.{AUDIT_TABLE_IAM_SNAPSHOT}"
     try:
-        client.get_table(table_id)
+        add_missing_columns(client, client.get_table(table_id), SCHEMA_SNAPSHOT)
         logger.info(f"Tabla {AUDIT_TABLE_IAM_SNAPSHOT} ya existe")
     except NotFound:
         table = bigquery.Table(table_id, schema=SCHEMA_SNAPSHOT)
@@ -107,7 +140,7 @@ def ensure_audit_tables(client: bigquery.Client) -> bool:
     # Crear tabla de histórico
     table_id_history = f"{AUDIT_PROJECT}.{AUDIT_DATASET}.{AUDIT_TABLE_IAM_HISTORY}"
     try:
-        client.get_table(table_id_history)
+        add_missing_columns(client, client.get_table(table_id_history), SCHEMA_HISTORY)
         logger.info(f"Tabla {AUDIT_TABLE_IAM_HISTORY} ya existe")
     except NotFound:
         table = bigquery.Table(table_id_history, schema=SCHEMA_HISTORY)
@@ -118,122 +151,169 @@ def ensure_audit_tables(client: bigquery.Client) -> bool:
         client.create_table(table)
         logger.info(f"Tabla {AUDIT_TABLE_IAM_HISTORY} creada")
     
+    # Crear tabla de estado del crawl (datasets no leídos por snapshot)
+    table_id_status = f"{AUDIT_PROJECT}.{AUDIT_DATASET}.{AUDIT_TABLE_IAM_CRAWL_STATUS}"
+    try:
+        add_missing_columns(client, client.get_table(table_id_status), SCHEMA_CRAWL_STATUS)
+        logger.info(f"Tabla {AUDIT_TABLE_IAM_CRAWL_STATUS} ya existe")
+    except NotFound:
+        table = bigquery.Table(table_id_status, schema=SCHEMA_CRAWL_STATUS)
+        table.time_partitioning = bigquery.TimePartitioning(
+            type_=bigquery.TimePartitioningType.DAY,
+            field="snapshot_date"
+        )
+        client.create_table(table)
+        logger.info(f"Tabla {AUDIT_TABLE_IAM_CRAWL_STATUS} creada")
+    
     return True
 
 
-def get_dataset_access_entries(
-    project_id: str,
-    dataset_id: str
-) -> List[Dict]:
-    """
-    Obtiene las entradas de acceso de un dataset.
-    
-    Args:
-        project_id: ID del proyecto
-        dataset_id: ID del dataset
-        
-    Returns:
-        Lista de diccionarios con información de acceso
-    """
-    try:
-        client = get_bigquery_client(project_id)
-        dataset = client.get_dataset(f"{project_id}.{dataset_id}")
-        
-        access_entries = []
-        for entry in dataset.access_entries or []:
-            access_info = {
-                "principal_email": entry.user_by_email,
-                "principal_type": "USER" if entry.user_by_email else
-                                "GROUP" if entry.group_by_email else
-                                "SPECIAL",
-                "role": entry.role,
-                "access_type": None,
-                "special_group": entry.special_group,
-            }
-            access_entries.append(access_info)
-        
-        return access_entries
-    except PermissionDenied:
-        logger.warning(f"Permisos insuficientes para leer {project_id}.{dataset_id}")
-        return []
-    except Exception as e:
-        logger.error(f"Error leyendo acceso de {project_id}.{dataset_id}: {str(e)}")
-        return []
+def parse_access_entries(dataset: bigquery.Dataset) -> List[Dict]:
+    """Convierte los access entries de un dataset en diccionarios de acceso."""
+    access_entries = []
+    for entry in dataset.access_entries or []:
+        access_info = {
+            "principal_email": entry.user_by_email,
+            "principal_type": "USER" if entry.user_by_email else
+                            "GROUP" if entry.group_by_email else
+                            "SPECIAL",
+            "role": normalize_role(entry.role),
+            "access_type": None,
+            "special_group": entry.special_group,
+        }
+        access_entries.append(access_info)
+    return access_entries
 
 
-def get_dataset_table_count(project_id: str, dataset_id: str) -> int:
-    """Obtiene el número de tablas en un dataset."""
-    try:
-        client = get_bigquery_client(project_id)
-        table_count = 0
-        for _ in client.list_tables(dataset_id):
-            table_count += 1
-        return table_count
-    except Exception as e:
-        logger.warning(f"Error contando tablas en {project_id}.{dataset_id}: {str(e)}")
-        return 0
+def fetch_access_entries(client: bigquery.Client, project_id: str, dataset_id: str) -> List[Dict]:
+    """Lee los access entries de un dataset (una llamada a la API; propaga los errores)."""
+    return parse_access_entries(client.get_dataset(f"{project_id}.{dataset_id}"))
 
 
-def capture_iam_snapshot(
+def count_dataset_tables(client: bigquery.Client, project_id: str, dataset_id: str) -> int:
+    """Cuenta las tablas de un dataset recorriendo list_tables (propaga los errores)."""
+    return sum(1 for _ in client.list_tables(f"{project_id}.{dataset_id}"))
+
+
+def build_snapshot_records(
     environment: str,
     project_id: str,
+    dataset_id: str,
+    access_entries: List[Dict],
+    table_count: int,
     snapshot_timestamp: datetime
 ) -> List[Dict]:
+    """Registros del snapshot de un dataset (uno por principal o grupo especial, y por tabla en grants de tabla)."""
+    records = []
+    for entry in access_entries:
+        if entry["principal_email"] or entry["special_group"]:
+            records.append({
+                "snapshot_date": snapshot_timestamp.date(),
+                "snapshot_timestamp": snapshot_timestamp,
+                "environment": environment,
+                "source_project_id": project_id,
+                "dataset_id": dataset_id,
+                "table_id": entry.get("table_id"),
+                "principal_email": entry["principal_email"] or entry["special_group"],
+                "principal_type": entry["principal_type"],
+                "role": entry["role"],
+                "access_type": entry["access_type"],
+                "special_group": entry["special_group"],
+                "table_count": table_count,
+                "last_modified": snapshot_timestamp,
+            })
+    return records
+
+
+def capture_iam_snapshot(
+    environment: str,
+    project_id: str,
+    snapshot_timestamp: datetime,
+    max_workers: int = DEFAULT_CRAWL_MAX_WORKERS,
+    per_project_limit: int = DEFAULT_CRAWL_PER_PROJECT,
+    access_backend: str = DEFAULT_ACCESS_BACKEND
+) -> Tuple[List[Dict], Set[Tuple[str, Optional[str]]]]:
     """
     Captura un snapshot de IAM para todos los datasets del proyecto.
     
+    Los access entries de todos los datasets se leen en paralelo con un solo
+    cliente del proyecto (ver iam_crawler.DatasetCrawler), reintentando errores
+    transitorios. El conteo de tablas sale de una query a INFORMATION_SCHEMA
+    por proyecto (ver table_inventory); solo los datasets fuera de la región
+    del inventario se cuentan con list_tables.
+    
+    Con access_backend='object_privileges' los grants (de datasets y tablas)
+    salen de una sola query a INFORMATION_SCHEMA.OBJECT_PRIVILEGES; si falla,
+    se leen con get_dataset como en 'dataset_api'. Igual que el conteo de
+    tablas, los datasets fuera del inventario o sin filas en la vista (ej.
+    fuera de BQ_INVENTORY_REGION) se leen con get_dataset.
+    
     Args:
         environment: Ambiente (dev, qua, pro)
         project_id: ID del proyecto
         snapshot_timestamp: Timestamp del snapshot
+        max_workers: Llamadas simultáneas a la API en total
+        per_project_limit: Llamadas simultáneas contra el proyecto
+        access_backend: 'dataset_api' (get_dataset por dataset) u 'object_privileges'
         
     Returns:
-        Lista de registros para insertar en BigQuery
+        Tupla (registros para insertar en BigQuery, pares (proyecto, dataset) cuyos
+        permisos no se pudieron leer; (proyecto, None) si falló el proyecto completo)
     """
     records = []
+    failed = set()
     
     try:
-        client = get_bigquery_client(project_id)
+        crawler = DatasetCrawler(max_workers=max_workers, per_project_limit=per_project_limit,
+                                 get_client=get_bigquery_client)
+        datasets = crawler.list_dataset_ids(project_id)
+        logger.info(f"Procesando {len(datasets)} datasets en {project_id}")
         
-        # Listar todos los datasets
-        datasets = []
-        for dataset in client.list_datasets():
-            datasets.append(dataset.dataset_id)
+        inventory = load_table_inventory(get_bigquery_client(project_id), project_id)
         
-        logger.info(f"Procesando {len(datasets)} datasets en {project_id}")
+        def table_count(client, project_id, dataset_id):
+            count = dataset_table_count(inventory, dataset_id)
+            return count_dataset_tables(client, project_id, dataset_id) if count is None else count
         
-        for dataset_id in datasets:
-            # Obtener entradas de acceso
-            access_entries = get_dataset_access_entries(project_id, dataset_id)
-            
-            # Contar tablas
-            table_count = get_dataset_table_count(project_id, dataset_id)
-            
-            # Crear registros
-            for entry in access_entries:
-                if entry["principal_email"] or entry["special_group"]:
-                    record = {
-                        "snapshot_date": snapshot_timestamp.date(),
-                        "snapshot_timestamp": snapshot_timestamp,
-                        "environment": environment,
-                        "source_project_id": project_id,
-                        "dataset_id": dataset_id,
-                        "principal_email": entry["principal_email"] or entry["special_group"],
-                        "principal_type": entry["principal_type"],
-                        "role": entry["role"],
-                        "access_type": entry["access_type"],
-                        "special_group": entry["special_group"],
-                        "table_count": table_count,
-                        "last_modified": snapshot_timestamp,
-                    }
-                    records.append(record)
+        privileges = None
+        if access_backend == "object_privileges":
+            object_names = datasets + [table for dataset in inventory.values() for table in dataset["tables"]]
+            privileges = load_object_privileges(get_bigquery_client(project_id), project_id, object_names)
+            if privileges is not None:
+                privileges = group_by_dataset(privileges)
+        
+        def access_entries(client, project_id, dataset_id):
+            if privileges is not None and dataset_id in inventory and dataset_id in privileges:
+                return privileges[dataset_id]
+            return fetch_access_entries(client, project_id, dataset_id)
+        
+        tasks = {"table_count": table_count, "access_entries": access_entries}
+        crawled = crawler.crawl(project_id, tasks, dataset_ids=datasets)
+        
+        for dataset in crawled:
+            dataset_id = dataset["dataset_id"]
+            if "access_entries" in dataset["errors"]:
+                failed.add((project_id, dataset_id))
+            for name, error in dataset["errors"].items():
+                if isinstance(error, PermissionDenied):
+                    logger.warning(f"Permisos insuficientes para leer {project_id}.{dataset_id} ({name})")
+                elif name == "table_count":
+                    logger.warning(f"Error contando tablas en {project_id}.{dataset_id}: {str(error)}")
+                else:
+                    logger.error(f"Error leyendo acceso de {project_id}.{dataset_id}: {str(error)}")
+            records.extend(build_snapshot_records(
+                environment, project_id, dataset_id,
+                dataset.get("access_entries") or [], dataset["table_count"] or 0, snapshot_timestamp
+            ))
         
         logger.info(f"Capturados {len(records)} registros de IAM para {project_id}")
-        return records
+        if failed:
+            logger.warning(f"⚠️ {len(failed)} datasets de {project_id} sin permisos leídos: se excluyen del diff")
+        return records, failed
     
     except Exception as e:
         logger.error(f"Error capturando snapshot de {project_id}: {str(e)}")
-        return []
+        return [], {(project_id, None)}
 
 
 def insert_snapshot_records(
@@ -241,7 +321,10 @@ def insert_snapshot_records(
     records: List[Dict]
 ) -> bool:
     """
-    Inserta registros en la tabla de snapshots.
+    Inserta registros en la tabla de snapshots con load jobs por lotes (ver bq_load_writer).
+    
+    Los job_id se derivan del ambiente y del snapshot_timestamp, así que reintentar
+    (o re-ejecutar con el mismo --snapshot-timestamp) no duplica filas.
     
     Args:
         client: Cliente de BigQuery
@@ -256,11 +339,19 @@ def insert_snapshot_records(
     
     try:
         table_id = f"{AUDIT_PROJECT}.{AUDIT_DATASET}.{AUDIT_TABLE_IAM_SNAPSHOT}"
-        errors = client.insert_rows_json(table_id, records)
         
-        if errors:
-            logger.error(f"Errores insertando registros: {errors}")
-            return False
+        # Un grupo (y un prefijo de job_id) por ambiente y snapshot, en orden estable
+        groups = defaultdict(list)
+        for record in records:
+            groups[(record["environment"], record["snapshot_timestamp"])].append(record)
+        
+        for (environment, snapshot_timestamp), group in groups.items():
+            group.sort(key=lambda r: (r["source_project_id"], r["dataset_id"], r.get("table_id") or "",
+                                      r["principal_email"], r["role"] or ""))
+            load_records(
+                client, table_id, group, SCHEMA_SNAPSHOT,
+                job_id_prefix=f"iam_snapshot_{environment}_{snapshot_timestamp:%Y%m%dT%H%M%S%f}"
+            )
         
         logger.info(f"Insertados {len(records)} registros en {table_id}")
         return True
@@ -269,78 +360,253 @@ def insert_snapshot_records(
         return False
 
 
+def insert_crawl_failures(
+    client: bigquery.Client,
+    environment: str,
+    snapshot_timestamp: datetime,
+    failed: Set[Tuple[str, Optional[str]]]
+) -> bool:
+    """
+    Registra en iam_crawl_status los datasets que no se pudieron leer en un snapshot.
+    
+    Las comparaciones siguientes los usan para no tomar su ausencia en el snapshot
+    como grants eliminados (ni, al recuperarse, como grants nuevos).
+    
+    Args:
+        client: Cliente de BigQuery
+        environment: Ambiente del snapshot
+        snapshot_timestamp: Timestamp del snapshot
+        failed: Pares (proyecto, dataset) no leídos (ver capture_iam_snapshot)
+        
+    Returns:
+        True si se registraron correctamente (o no había fallos)
+    """
+    if not failed:
+        return True
+    
+    records = [
+        {
+            "snapshot_date": snapshot_timestamp.date(),
+            "snapshot_timestamp": snapshot_timestamp,
+            "environment": environment,
+            "source_project_id": project_id,
+            "dataset_id": dataset_id,
+        }
+        for project_id, dataset_id in sorted(failed, key=lambda pair: (pair[0], pair[1] or ""))
+    ]
+    try:
+        load_records(
+            client, f"{AUDIT_PROJECT}.{AUDIT_DATASET}.{AUDIT_TABLE_IAM_CRAWL_STATUS}", records, SCHEMA_CRAWL_STATUS,
+            job_id_prefix=f"iam_crawl_status_{environment}_{snapshot_timestamp:%Y%m%dT%H%M%S%f}"
+        )
+        logger.info(f"Registrados {len(records)} datasets no leídos en {AUDIT_TABLE_IAM_CRAWL_STATUS}")
+        return True
+    except Exception as e:
+        logger.error(f"Error registrando datasets no leídos: {str(e)}")
+        return False
+
+
+def read_crawl_failures(
+    client: bigquery.Client,
+    environment: str,
+    snapshot_timestamp: datetime
+) -> Set[Tuple[str, Optional[str]]]:
+    """Pares (proyecto, dataset) no leídos en un snapshot (lee solo la partición de su fecha)."""
+    query = f"""
+        SELECT source_project_id, dataset_id
+        FROM `{AUDIT_PROJECT}.{AUDIT_DATASET}.{AUDIT_TABLE_IAM_CRAWL_STATUS}`
+        WHERE environment = @environment
+        AND snapshot_date = @snapshot_date
+        AND snapshot_timestamp = @snapshot_timestamp
+    """
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ScalarQueryParameter("environment", "STRING", environment),
+        bigquery.ScalarQueryParameter("snapshot_date", "DATE", snapshot_timestamp.date()),
+        bigquery.ScalarQueryParameter("snapshot_timestamp", "TIMESTAMP", snapshot_timestamp),
+    ])
+    return {(row.source_project_id, row.dataset_id) for row in client.query(query, job_config=job_config).result()}
+
+
+def get_snapshot_timestamp(
+    client: bigquery.Client,
+    environment: str,
+    before: Optional[datetime] = None,
+    lookback_days: int = DEFAULT_DIFF_LOOKBACK_DAYS
+) -> Optional[datetime]:
+    """
+    Timestamp del último snapshot de un ambiente (anterior a `before` si se indica).
+    
+    Solo lee las particiones de los últimos `lookback_days` días.
+    
+    Returns:
+        datetime o None si no hay snapshots en la ventana
+    """
+    reference = before or datetime.now()
+    since_date = (reference - timedelta(days=lookback_days)).date()
+    params = [
+        bigquery.ScalarQueryParameter("environment", "STRING", environment),
+        bigquery.ScalarQueryParameter("since_date", "DATE", since_date),
+    ]
+    condition = ""
+    if before is not None:
+        condition = "AND snapshot_timestamp < @before"
+        params.append(bigquery.ScalarQueryParameter("before", "TIMESTAMP", before))
+    
+    query = f"""
+        SELECT MAX(snapshot_timestamp) AS snapshot_timestamp
+        FROM `{AUDIT_PROJECT}.{AUDIT_DATASET}.{AUDIT_TABLE_IAM_SNAPSHOT}`
+        WHERE environment = @environment
+        AND snapshot_date >= @since_date
+        {condition}
+    """
+    rows = list(client.query(query, job_config=bigquery.QueryJobConfig(query_parameters=params)).result())
+    return rows[0].snapshot_timestamp if rows else None
+
+
+def read_snapshot(
+    client: bigquery.Client,
+    environment: str,
+    snapshot_timestamp: datetime
+) -> List[Dict]:
+    """Registros de un snapshot (lee solo la partición de su fecha)."""
+    query = f"""
+        SELECT *
+        FROM `{AUDIT_PROJECT}.{AUDIT_DATASET}.{AUDIT_TABLE_IAM_SNAPSHOT}`
+        WHERE environment = @environment
+        AND snapshot_date = @snapshot_date
+        AND snapshot_timestamp = @snapshot_timestamp
+    """
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ScalarQueryParameter("environment", "STRING", environment),
+        bigquery.ScalarQueryParameter("snapshot_date", "DATE", snapshot_timestamp.date()),
+        bigquery.ScalarQueryParameter("snapshot_timestamp", "TIMESTAMP", snapshot_timestamp),
+    ])
+    return [dict(row.items()) for row in client.query(query, job_config=job_config).result()]
+
+
+def read_last_read_grants(
+    client: bigquery.Client,
+    environment: str,
+    datasets: Set[Tuple[str, Optional[str]]],
+    before: datetime,
+    lookback_days: int = DEFAULT_DIFF_LOOKBACK_DAYS
+) -> Tuple[List[Dict], Set[Tuple[str, Optional[str]]]]:
+    """
+    Grants de cada dataset en el último snapshot anterior a `before` donde sí se leyó.
+    
+    Recorre los snapshots hacia atrás (hasta `lookback_days` días antes de `before`)
+    saltando aquellos donde el dataset figura en iam_crawl_status.
+    
+    Returns:
+        Tupla (registros de los datasets encontrados, pares sin snapshot leído en la ventana)
+    """
+    records = []
+    pending = set(datasets)
+    earliest = before - timedelta(days=lookback_days)
+    timestamp = before
+    while pending:
+        timestamp = get_snapshot_timestamp(client, environment, before=timestamp, lookback_days=lookback_days)
+        if timestamp is None or timestamp < earliest:
+            break
+        failures = read_crawl_failures(client, environment, timestamp)
+        found = {(project_id, dataset_id) for project_id, dataset_id in pending
+                 if not covers_dataset(failures, project_id, dataset_id)}
+        if found:
+            records.extend(select_datasets(read_snapshot(client, environment, timestamp), found))
+            pending -= found
+    return records, pending
+
+
 def compare_snapshots_and_record_changes(
     client: bigquery.Client,
-    environment: str
+    environment: str,
+    current_records: Optional[List[Dict]] = None,
+    snapshot_timestamp: Optional[datetime] = None,
+    lookback_days: int = DEFAULT_DIFF_LOOKBACK_DAYS,
+    failed_datasets: Optional[Set[Tuple[str, Optional[str]]]] = None
 ) -> bool:
     """
-    Compara snapshots consecutivos y registra cambios.
+    Compara el snapshot actual con el anterior y registra los cambios en iam_access_history.
+    
+    El diff se hace en memoria por huella de cada grant (ver iam_diff): O(n) y sin
+    self-join sobre la tabla de snapshots. Solo se escriben los cambios, con un load
+    job de ID determinista (re-ejecutar no duplica el histórico). Los datasets cuya
+    lectura falló en el snapshot actual se excluyen de ambos snapshots, para no
+    registrar como REMOVED grants que siguen vigentes. Los que fallaron en el
+    anterior (según iam_crawl_status) se comparan contra el último snapshot donde
+    se leyeron, para no registrar como ADDED grants que ya existían; si no hay
+    ninguno en la ventana, también se excluyen.
     
     Args:
         client: Cliente de BigQuery
         environment: Ambiente a procesar
+        current_records: Registros del snapshot actual (default: se lee el último de la tabla)
+        snapshot_timestamp: Timestamp del snapshot actual (requerido con current_records)
+        lookback_days: Días hacia atrás para buscar el snapshot anterior
+        failed_datasets: Pares (proyecto, dataset) no leídos en el snapshot actual
+                         (ver capture_iam_snapshot; default: se leen de iam_crawl_status)
         
     Returns:
         True si se procesaron correctamente
     """
     try:
-        # Consulta para detectar cambios
-        query = f"""
-        WITH latest_two AS (
-            SELECT
-                snapshot_date,
-                source_project_id,
-                dataset_id,
-                principal_email,
-                principal_type,
-                role,
-                custom_table_num,
-                ROW_NUMBER() OVER (
-                    PARTITION BY source_project_id, dataset_id, principal_email 
-                    ORDER BY snapshot_timestamp DESC
-                ) as rn
-            FROM `{AUDIT_PROJECT}.{AUDIT_DATASET}.{AUDIT_TABLE_IAM_SNAPSHOT}`
-            WHERE environment = '{environment}'
-            AND snapshot_date >= DATE_SUB(CURRENT_DATE(), INTERVAL 2 DAY)
-        ),
-        previous AS (
-            SELECT * FROM latest_two WHERE rn = 2
-        ),
-        current AS (
-            SELECT * FROM latest_two WHERE rn = 1
-        )
-        SELECT
-            CURRENT_TIMESTAMP() as snapshot_timestamp,
-            c.environment,
-            COALESCE(c.source_project_id, p.source_project_id) as source_project_id,
-            COALESCE(c.dataset_id, p.dataset_id) as dataset_id,
-            COALESCE(c.principal_email, p.principal_email) as principal_email,
-            CASE
-                WHEN p.principal_email IS NULL THEN 'ADDED'
-                WHEN c.principal_email IS NULL THEN 'REMOVED'
-                ELSE 'MODIFIED'
-            END as change_type,
-            TO_JSON_STRING(p) as previous_value,
-            TO_JSON_STRING(c) as new_value
-        FROM current c
-        FULL OUTER JOIN previous p
-            ON c.source_project_id = p.source_project_id
-            AND c.dataset_id = p.dataset_id
-            AND c.principal_email = p.principal_email
-        WHERE c.principal_email IS NULL OR p.principal_email IS NULL 
-            OR c.role != p.role
-        """
+        if current_records is None:
+            snapshot_timestamp = get_snapshot_timestamp(client, environment, lookback_days=lookback_days)
+            if snapshot_timestamp is None:
+                logger.info(f"Sin snapshots de {environment} para comparar")
+                return True
+            current_records = read_snapshot(client, environment, snapshot_timestamp)
+        if failed_datasets is None:
+            failed_datasets = read_crawl_failures(client, environment, snapshot_timestamp)
+        
+        previous_timestamp = get_snapshot_timestamp(client, environment, before=snapshot_timestamp,
+                                                     lookback_days=lookback_days)
+        if previous_timestamp is None:
+            logger.info(f"Sin snapshot anterior de {environment}: nada que comparar")
+            return True
+        previous_records = read_snapshot(client, environment, previous_timestamp)
+        
+        # Datasets no leídos en el anterior: se comparan contra el último snapshot donde sí se leyeron
+        previous_failed = {
+            (project_id, dataset_id)
+            for project_id, dataset_id in read_crawl_failures(client, environment, previous_timestamp)
+            if not covers_dataset(failed_datasets, project_id, dataset_id)
+        }
+        if previous_failed:
+            last_read, unresolved = read_last_read_grants(
+                client, environment, previous_failed, previous_timestamp, lookback_days
+            )
+            logger.info(
+                f"{len(previous_failed) - len(unresolved)} datasets no leídos en el snapshot anterior "
+                f"se comparan contra su última lectura; {len(unresolved)} sin lectura en la ventana"
+            )
+            previous_records = exclude_datasets(previous_records, previous_failed) + last_read
+            failed_datasets = set(failed_datasets) | unresolved
         
-        # Ejecutar consulta y obtener cambios
-        query_job = client.query(query)
-        changes = list(query_job)
+        if failed_datasets:
+            logger.info(f"Excluyendo del diff {len(failed_datasets)} datasets no leídos")
+            previous_records = exclude_datasets(previous_records, failed_datasets)
+            current_records = exclude_datasets(current_records, failed_datasets)
         
-        if changes:
-            logger.info(f"Encontrados {len(changes)} cambios en IAM")
-            # Aquí podrías insertar los cambios en la tabla de history
-        else:
+        changes = diff_snapshots(previous_records, current_records)
+        if not changes:
             logger.info("Sin cambios detectados")
+            return True
         
+        counts = defaultdict(int)
+        for change_type, _, _ in changes:
+            counts[change_type] += 1
+        logger.info(
+            f"Encontrados {len(changes)} cambios en IAM ({previous_timestamp} → {snapshot_timestamp}): "
+            f"{counts['ADDED']} ADDED, {counts['REMOVED']} REMOVED, {counts['MODIFIED']} MODIFIED"
+        )
+        
+        history = build_history_records(changes, snapshot_timestamp)
+        load_records(
+            client, f"{AUDIT_PROJECT}.{AUDIT_DATASET}.{AUDIT_TABLE_IAM_HISTORY}", history, SCHEMA_HISTORY,
+            job_id_prefix=f"iam_history_{environment}_{snapshot_timestamp:%Y%m%dT%H%M%S%f}"
+        )
+        logger.info(f"Registrados {len(history)} cambios en {AUDIT_TABLE_IAM_HISTORY}")
         return True
     except Exception as e:
         logger.error(f"Error comparando snapshots: {str(e)}")
@@ -373,6 +639,37 @@ def main():
         help="Compara con snapshot anterior y detecta cambios"
     )
     
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=DEFAULT_CRAWL_MAX_WORKERS,
+        help="Llamadas simultáneas a la API al recorrer datasets (default: env IAM_CRAWL_MAX_WORKERS o 16)"
+    )
+    
+    parser.add_argument(
+        "--per-project-concurrency",
+        type=int,
+        default=DEFAULT_CRAWL_PER_PROJECT,
+        help="Llamadas simultáneas por proyecto (default: env IAM_CRAWL_PER_PROJECT o 8)"
+    )
+    
+    parser.add_argument(
+        "--access-backend",
+        choices=ACCESS_BACKENDS,
+        default=DEFAULT_ACCESS_BACKEND,
+        help="Origen de los permisos: dataset_api (get_dataset por dataset) u object_privileges "
+             "(una query a INFORMATION_SCHEMA.OBJECT_PRIVILEGES por proyecto, incluye grants de tablas) "
+             "(default: env IAM_ACCESS_BACKEND o dataset_api)"
+    )
+    
+    parser.add_argument(
+        "--snapshot-timestamp",
+        type=datetime.fromisoformat,
+        default=None,
+        help="Timestamp del snapshot en ISO 8601 (default: ahora). Re-ejecutar con el mismo valor "
+             "reutiliza los load jobs ya escritos en lugar de duplicar filas"
+    )
+    
     args = parser.parse_args()
     
     # Obtener environments a procesar
@@ -392,7 +689,9 @@ def main():
     
     # Procesar cada ambiente
     all_records = []
-    snapshot_timestamp = datetime.now()
+    records_by_env = {}
+    failed_by_env = {}
+    snapshot_timestamp = args.snapshot_timestamp or datetime.now()
     
     for env in environments:
         try:
@@ -402,7 +701,16 @@ def main():
             logger.info(f"\n=== Procesando {env} ({project_id}) ===")
             
             # Capturar snapshot
-            records = capture_iam_snapshot(env, project_id, snapshot_timestamp)
+            records, failed = capture_iam_snapshot(
+                env, project_id, snapshot_timestamp,
+                max_workers=args.max_workers, per_project_limit=args.per_project_concurrency,
+                access_backend=args.access_backend
+            )
+            records_by_env[env] = records
+            failed_by_env[env] = failed
+            
+            if failed and not args.dry_run:
+                insert_crawl_failures(audit_client, env, snapshot_timestamp, failed)
             
             if records:
                 all_records.extend(records)
@@ -424,7 +732,13 @@ def main():
     if args.compare and not args.dry_run:
         for env in environments:
             logger.info(f"\nComparando snapshots de {env}")
-            compare_snapshots_and_record_changes(audit_client, env)
+            if (ENVIRONMENT_CONFIG[env]["project_id"], None) in failed_by_env.get(env, set()):
+                logger.warning(f"⚠️ Snapshot de {env} no capturado: se omite la comparación")
+                continue
+            compare_snapshots_and_record_changes(
+                audit_client, env, records_by_env.get(env), snapshot_timestamp,
+                failed_datasets=failed_by_env.get(env)
+            )
     
     logger.info(f"\n=== Sincronización completada ===")
     logger.info(f"Total de registros capturados: {len(all_records)}")
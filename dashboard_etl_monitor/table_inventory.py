@@ -0,0 +1,144 @@
+"""
+Inventario de tablas por proyecto desde INFORMATION_SCHEMA.
+
+En lugar de paginar `client.list_tables()` dataset por dataset, una sola query
+por proyecto contra las vistas de la región (`SCHEMATA`, `TABLES` y
+`TABLE_STORAGE`) trae todas las tablas de todos los datasets con sus filas y
+bytes lógicos. El agregado por dataset (conteo, vistas, tamaño) se arma en
+memoria a partir de esa única query, así el mismo resultado sirve también para
+listar los nombres de tablas.
+
+Solo cubre los datasets de la región consultada (`BQ_INVENTORY_REGION`); los
+datasets de otras regiones no aparecen y el llamador debe recurrir a
+list_tables para ellos. Si `TABLE_STORAGE` no está disponible (permisos), el
+inventario se arma sin tamaños.
+
+Uso:
+    inventory = fetch_table_inventory(client, "platform-partners-des")
+    inventory["bronze"]["table_count"]  # → 42
+"""
+
+import logging
+import os
+from typing import Dict, Optional
+
+from google.api_core.exceptions import BadRequest, Forbidden, NotFound
+from google.cloud import bigquery
+
+# Región de los datasets (calificador de INFORMATION_SCHEMA)
+DEFAULT_INVENTORY_REGION = os.environ.get("BQ_INVENTORY_REGION", "region-us")
+
+INVENTORY_QUERY = """
+SELECT
+  s.schema_name AS dataset_id,
+  t.table_name,
+  t.table_type,
+  st.total_rows,
+  st.total_logical_bytes
+FROM `{project_id}.{region}.INFORMATION_SCHEMA.SCHEMATA` s
+LEFT JOIN `{project_id}.{region}.INFORMATION_SCHEMA.TABLES` t
+  ON t.table_schema = s.schema_name
+LEFT JOIN `{project_id}.{region}.INFORMATION_SCHEMA.TABLE_STORAGE` st
+  ON st.table_schema = t.table_schema AND st.table_name = t.table_name AND NOT st.deleted
+"""
+
+INVENTORY_QUERY_NO_STORAGE = """
+SELECT
+  s.schema_name AS dataset_id,
+  t.table_name,
+  t.table_type,
+  NULL AS total_rows,
+  NULL AS total_logical_bytes
+FROM `{project_id}.{region}.INFORMATION_SCHEMA.SCHEMATA` s
+LEFT JOIN `{project_id}.{region}.INFORMATION_SCHEMA.TABLES` t
+  ON t.table_schema = s.schema_name
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def _new_dataset_entry() -> Dict:
+    return {
+        "table_count": 0,
+        "view_count": 0,
+        "tables": [],
+        "total_rows": None,
+        "total_logical_bytes": None,
+    }
+
+
+def fetch_table_inventory(
+    client: bigquery.Client,
+    project_id: str,
+    region: str = DEFAULT_INVENTORY_REGION
+) -> Dict[str, Dict]:
+    """
+    Lee el inventario de tablas de todos los datasets de un proyecto en una query.
+
+    Args:
+        client: Cliente de BigQuery
+        project_id: ID del proyecto a inventariar
+        region: Calificador de región de INFORMATION_SCHEMA (ej. 'region-us')
+
+    Retorna:
+        {dataset_id: {
+            'table_count': int (tablas de todo tipo, como list_tables),
+            'view_count': int,
+            'tables': [table_id, ...] ordenadas,
+            'total_rows': int o None (sin TABLE_STORAGE),
+            'total_logical_bytes': int o None (sin TABLE_STORAGE)
+        }}
+        Los datasets vacíos de la región aparecen con table_count 0. Propaga los
+        errores de la query sin TABLE_STORAGE.
+    """
+    try:
+        rows = client.query(INVENTORY_QUERY.format(project_id=project_id, region=region)).result()
+        with_storage = True
+    except (Forbidden, BadRequest, NotFound) as e:
+        logger.warning(f"⚠️ TABLE_STORAGE no disponible en {project_id} ({type(e).__name__}), inventario sin tamaños")
+        rows = client.query(INVENTORY_QUERY_NO_STORAGE.format(project_id=project_id, region=region)).result()
+        with_storage = False
+
+    inventory = {}
+    for row in rows:
+        dataset = inventory.setdefault(row.dataset_id, _new_dataset_entry())
+        if row.table_name is None:
+            continue
+        dataset["table_count"] += 1
+        dataset["tables"].append(row.table_name)
+        if row.table_type == "VIEW":
+            dataset["view_count"] += 1
+        if with_storage:
+            dataset["total_rows"] = (dataset["total_rows"] or 0) + (row.total_rows or 0)
+            dataset["total_logical_bytes"] = (dataset["total_logical_bytes"] or 0) + (row.total_logical_bytes or 0)
+
+    for dataset in inventory.values():
+        dataset["tables"].sort()
+        if with_storage and dataset["total_rows"] is None:
+            dataset["total_rows"] = dataset["total_logical_bytes"] = 0
+    return inventory
+
+
+def load_table_inventory(
+    client: bigquery.Client,
+    project_id: str,
+    region: str = DEFAULT_INVENTORY_REGION
+) -> Dict[str, Dict]:
+    """
+    Como fetch_table_inventory, pero retorna {} si la query falla (el llamador
+    recurre a list_tables para los datasets que no estén en el inventario).
+    """
+    try:
+        inventory = fetch_table_inventory(client, project_id, region)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo leer el inventario de tablas de {project_id}.{region}: {str(e)}")
+        return {}
+    tables = sum(dataset["table_count"] for dataset in inventory.values())
+    logger.info(f"📚 Inventario {project_id}: {len(inventory)} datasets, {tables} tablas (1 query)")
+    return inventory
+
+
+def dataset_table_count(inventory: Dict[str, Dict], dataset_id: str) -> Optional[int]:
+    """Conteo de tablas de un dataset según el inventario (None si no está)."""
+    dataset = inventory.get(dataset_id)
+    return None if dataset is None else dataset["table_count"]
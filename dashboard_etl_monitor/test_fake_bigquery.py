@@ -0,0 +1,175 @@
+"""
+Pruebas de extremo a extremo sobre el BigQuery simulado (fake_bigquery.py).
+
+Cubren los consumidores principales del fake: la matriz LIVE del
+dashboard (build_sync_matrix, vía streamlit AppTest), el planificador de
+costo, el sync de companies_consolidated y el snapshot/diff del monitor IAM.
+
+Ejecutar desde dashboard_etl_monitor/:
+    python -m pytest -q test_fake_bigquery.py
+"""
+
+import os
+import re
+from datetime import datetime
+
+import pytest
+from google.api_core.exceptions import BadRequest, PermissionDenied
+from google.cloud import bigquery
+
+import bq_client_pool
+import fake_bigquery
+import result_cache
+from fake_bigquery import FakeBigQueryBackend, build_fleet_fixture
+
+COMPANIES = 3
+TABLES = 4
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit_app.py")
+
+
+@pytest.fixture
+def backend():
+    return FakeBigQueryBackend.from_fixture(build_fleet_fixture(companies=COMPANIES, tables=TABLES, seed=1))
+
+
+@pytest.fixture
+def pool(backend):
+    return bq_client_pool.BigQueryClientPool(fake_backend=backend)
+
+
+def test_build_sync_matrix_live(backend, monkeypatch, tmp_path):
+    from streamlit.testing.v1 import AppTest
+
+    monkeypatch.setenv("ENVIRONMENT", "qua")
+    monkeypatch.setattr(bq_client_pool, "BQ_BACKEND", "fake")
+    monkeypatch.setattr(fake_bigquery, "_env_backend", backend)
+    monkeypatch.setattr(result_cache, "create_cache_backend",
+                        lambda: result_cache.ParquetCacheBackend(cache_dir=str(tmp_path)))
+
+    app = AppTest.from_file(APP_PATH, default_timeout=120).run()
+    live_button = next(button for button in app.button if "LIVE" in button.label)
+    live_button.click().run()
+
+    assert not app.exception
+    matrix = app.session_state["processed_matrix"]["max_sync"]
+    assert len(matrix) == COMPANIES
+    assert matrix.notna().any(axis=None)
+
+
+def test_cost_plan_dry_run_and_scan(backend, pool):
+    from bronze_freshness import fetch_project_freshness
+    from cost_planner import plan_refresh
+
+    project_id = "company-1000"
+    backend.add_table(f"{project_id}.bronze.no_sync", [bigquery.SchemaField("id", "INT64")], rows=[{"id": 1}])
+    tables = ["table_00", "table_01", "no_sync"]
+
+    # Una tabla sin _etl_synced no invalida la estimación del proyecto
+    plan = plan_refresh(pool.get_client, {project_id: tables}, "scan", method="dry_run")
+    assert not plan.errors
+    assert plan.total_bytes("scan") > 0
+
+    # El escaneo usa las tablas de __TABLES__ del plan: no vuelve a listar bronze
+    backend.fail_on = {re.compile(r"INFORMATION_SCHEMA\.TABLES"): BadRequest}
+    results, _ = fetch_project_freshness(pool.get_client(project_id), project_id, tables,
+                                         **plan.fetch_options(project_id))
+    assert results["table_00"][0] is not None and results["table_01"][0] is not None
+    assert results["no_sync"][1]
+
+
+@pytest.mark.parametrize("runner", ["threads", "async"])
+def test_consolidated_sync(pool, monkeypatch, runner):
+    import update_companies_consolidated_sync as sync
+
+    monkeypatch.setattr(sync, "get_client_pool", lambda pool_size=None: pool)
+    sync.main(["--runner", runner, "--freshness-mode", "scan"])
+
+    client = pool.get_client(sync.CENTRAL_PROJECT)
+    row = next(iter(client.query(f"""
+        SELECT COUNT(*) AS total, COUNT(last_etl_synced) AS synced
+        FROM `{sync.CENTRAL_PROJECT}.{sync.CENTRAL_DATASET}.{sync.CONSOLIDATED_TABLE}`
+    """).result()))
+    assert row.total > 0
+    assert row.synced > 0
+
+
+@pytest.mark.parametrize("access_backend", ["dataset_api", "object_privileges"])
+def test_iam_snapshot_and_diff(backend, pool, monkeypatch, access_backend):
+    import sync_iam_access as iam
+
+    monkeypatch.setattr(iam, "get_bigquery_client", pool.get_client)
+    client = pool.get_client(iam.AUDIT_PROJECT)
+    assert iam.ensure_audit_tables(client)
+    project_id = "company-1000"
+
+    first = datetime(2026, 10, 16, 3, 0)
+    records, failed = iam.capture_iam_snapshot("qua", project_id, first, access_backend=access_backend)
+    assert records and not failed
+    assert {record["role"] for record in records} <= {"OWNER", "WRITER", "READER"}
+    assert iam.insert_snapshot_records(client, records)
+
+    # Un grant nuevo se registra como ADDED
+    dataset = backend._datasets[f"{project_id}.bronze"]
+    dataset.access_entries = list(dataset.access_entries) + [
+        bigquery.AccessEntry("READER", "userByEmail", "new@fake.com")
+    ]
+    second = datetime(2026, 10, 17, 3, 0)
+    records, failed = iam.capture_iam_snapshot("qua", project_id, second, access_backend=access_backend)
+    assert iam.insert_snapshot_records(client, records)
+    assert iam.compare_snapshots_and_record_changes(client, "qua", records, second, failed_datasets=failed)
+
+    # Un dataset que no se pudo leer no genera REMOVED
+    backend.fail_on = {re.compile(rf"get_dataset:{project_id}\.bronze"): PermissionDenied}
+    monkeypatch.setattr(iam, "load_object_privileges", lambda *args, **kwargs: None)
+    third = datetime(2026, 10, 18, 3, 0)
+    records, failed = iam.capture_iam_snapshot("qua", project_id, third, access_backend=access_backend)
+    assert failed == {(project_id, "bronze")}
+    iam.insert_snapshot_records(client, records)
+    assert iam.compare_snapshots_and_record_changes(client, "qua", records, third, failed_datasets=failed)
+
+    history = [dict(row.items()) for row in client.query(f"""
+        SELECT change_type, principal_email
+        FROM `{iam.AUDIT_PROJECT}.{iam.AUDIT_DATASET}.{iam.AUDIT_TABLE_IAM_HISTORY}`
+    """).result()]
+    assert history == [{"change_type": "ADDED", "principal_email": "new@fake.com"}]
+
+
+def test_iam_dataset_recovers_after_failed_snapshot(backend, pool, monkeypatch):
+    import sync_iam_access as iam
+
+    monkeypatch.setattr(iam, "get_bigquery_client", pool.get_client)
+    client = pool.get_client(iam.AUDIT_PROJECT)
+    assert iam.ensure_audit_tables(client)
+    project_id = "company-1000"
+    backend.add_dataset(f"{project_id}.silver", access=[
+        {"role": "READER", "entity_type": "userByEmail", "entity_id": "analyst@fake.com"},
+    ])
+
+    def run(snapshot_timestamp):
+        records, failed = iam.capture_iam_snapshot("qua", project_id, snapshot_timestamp, access_backend="dataset_api")
+        assert iam.insert_snapshot_records(client, records)
+        assert iam.insert_crawl_failures(client, "qua", snapshot_timestamp, failed)
+        assert iam.compare_snapshots_and_record_changes(client, "qua", records, snapshot_timestamp,
+                                                        failed_datasets=failed)
+        return failed
+
+    assert not run(datetime(2026, 10, 16, 3, 0))
+
+    # Run N: silver no se puede leer (y mientras tanto gana un grant)
+    backend.fail_on = {re.compile(rf"get_dataset:{project_id}\.silver"): PermissionDenied}
+    dataset = backend._datasets[f"{project_id}.silver"]
+    dataset.access_entries = list(dataset.access_entries) + [
+        bigquery.AccessEntry("READER", "userByEmail", "new@fake.com")
+    ]
+    assert run(datetime(2026, 10, 17, 3, 0)) == {(project_id, "silver")}
+
+    # Run N+1: silver se recupera y se compara contra su última lectura (run N-1)
+    backend.fail_on = {}
+    assert not run(datetime(2026, 10, 18, 3, 0))
+
+    history = [dict(row.items()) for row in client.query(f"""
+        SELECT change_type, dataset_id, principal_email
+        FROM `{iam.AUDIT_PROJECT}.{iam.AUDIT_DATASET}.{iam.AUDIT_TABLE_IAM_HISTORY}`
+    """).result()]
+    assert history == [{"change_type": "ADDED", "dataset_id": "silver", "principal_email": "new@fake.com"}]
@@ -6,7 +6,12 @@ Este script:
 2. Obtiene combinaciones company_id + table_name desde companies_consolidated (solo para las 11 tablas)
 3. Para cada combinación, obtiene el company_project_id
 4. Calcula MAX(_etl_synced) y COUNT(*) desde {company_project_id}.bronze.{table_name}
-5. Actualiza companies_consolidated con esos valores
+   - Modo "metadata" (por defecto): una query a {company_project_id}.bronze.__TABLES__
+     por proyecto (last_modified_time, row_count); solo las tablas sospechosas
+     se escanean con MAX(_etl_synced)/COUNT(*)
+   - Modo "scan": escaneo de cada tabla
+5. Actualiza companies_consolidated con esos valores en un solo paso
+   (load job a una tabla staging + un único MERGE)
 
 Ejecutar como Scheduled Query o Cloud Function:
 - Horarios: 7am, 1pm, 7pm, 1am (1 hora después del ETL)
@@ -14,17 +19,66 @@ Ejecutar como Scheduled Query o Cloud Function:
 
 from google.cloud import bigquery
 from datetime import datetime
+import pandas as pd
+import argparse
+import asyncio
+import concurrent.futures
 import logging
+import math
+import os
+import threading
+import time
+
+from bronze_freshness import (
+    fetch_project_metadata,
+    is_suspicious,
+    FRESHNESS_MODES,
+)
+from bq_async_runner import AsyncQueryRunner
+from bq_client_pool import get_client_pool
+from bq_fetch import fetch_dataframe, get_fetch_stats
 
 # Configuración
 CENTRAL_PROJECT = "pph-central"
 CENTRAL_DATASET = "settings"
 CONSOLIDATED_TABLE = "companies_consolidated"
+STAGING_TABLE = "companies_consolidated_sync_staging"  # Se sobrescribe en cada ejecución
+
+# Concurrencia (sobrescribible con --max-workers / --per-project-concurrency)
+DEFAULT_MAX_WORKERS = int(os.environ.get("SYNC_MAX_WORKERS", "16"))
+DEFAULT_PER_PROJECT_CONCURRENCY = int(os.environ.get("SYNC_PER_PROJECT_CONCURRENCY", "4"))
+
+# Ejecutor de la fase de escaneo: "threads" (un hilo por query) o "async" (jobs asíncronos con polling por lotes)
+SYNC_RUNNERS = ["threads", "async"]
+DEFAULT_SYNC_RUNNER = os.environ.get("SYNC_RUNNER", "threads")
+DEFAULT_MAX_IN_FLIGHT = int(os.environ.get("SYNC_MAX_IN_FLIGHT", "200"))
+
+# Modo de frescura del job: "scan" escribe MAX(_etl_synced)/COUNT(*) en last_etl_synced/row_count;
+# "metadata" escribe __TABLES__ en columnas propias (METADATA_COLUMNS) y solo re-escanea las sospechosas
+DEFAULT_SYNC_FRESHNESS_MODE = os.environ.get("FRESHNESS_MODE", "scan")
 COMPANIES_TABLE = "companies"  # Se buscará en cada project_id
 METADATA_PROJECT = "pph-central"
 METADATA_DATASET = "management"
 METADATA_TABLE = "metadata_consolidated_tables"
 
+# Esquema de la tabla staging para el MERGE set-based
+SCHEMA_STAGING = [
+    bigquery.SchemaField("company_id", "INT64", mode="REQUIRED"),
+    bigquery.SchemaField("table_name", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("max_sync", "TIMESTAMP", mode="NULLABLE"),
+    bigquery.SchemaField("row_count", "INT64", mode="NULLABLE"),
+    bigquery.SchemaField("scanned", "BOOL", mode="NULLABLE"),
+    bigquery.SchemaField("bronze_last_modified", "TIMESTAMP", mode="NULLABLE"),
+    bigquery.SchemaField("bronze_row_count", "INT64", mode="NULLABLE"),
+]
+
+# Columnas de companies_consolidated que escribe el modo metadata (last_modified_time y
+# row_count de __TABLES__); last_etl_synced/row_count conservan siempre el valor del escaneo
+METADATA_COLUMNS = [
+    bigquery.SchemaField("bronze_last_modified", "TIMESTAMP", mode="NULLABLE"),
+    bigquery.SchemaField("bronze_row_count", "INT64", mode="NULLABLE"),
+]
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -49,7 +103,10 @@ def get_bronze_tables(client):
     """
     
     try:
-        df = client.query(query).to_dataframe()
+        df = fetch_dataframe(
+            client, query, label="get_bronze_tables",
+            bqstorage_client=get_client_pool().get_bqstorage_client()
+        )
         tables = df['table_name'].tolist()
         logger.info(f"📋 Encontradas {len(tables)} tablas de Bronze en metadata")
         return tables[:11] if len(tables) > 11 else tables
@@ -91,7 +148,11 @@ def get_all_combinations(client, bronze_tables):
     """
     
     try:
-        df_combinations = client.query(query_combinations).to_dataframe()
+        df_combinations = fetch_dataframe(
+            client, query_combinations, label="get_all_combinations",
+            categories=['table_name'], int32_columns=['company_id'],
+            bqstorage_client=get_client_pool().get_bqstorage_client()
+        )
         if df_combinations.empty:
             logger.warning("⚠️ No se encontraron combinaciones en companies_consolidated")
             return []
@@ -123,7 +184,11 @@ def get_all_combinations(client, bronze_tables):
             """
             
             try:
-                df_companies = client.query(query_companies).to_dataframe()
+                df_companies = fetch_dataframe(
+                    client, query_companies, label="get_all_combinations.companies",
+                    categories=['company_project_id'], int32_columns=['company_id'],
+                    bqstorage_client=get_client_pool().get_bqstorage_client()
+                )
                 for _, row in df_companies.iterrows():
                     if row['company_id'] not in company_project_map:
                         company_project_map[row['company_id']] = row['company_project_id']
@@ -157,6 +222,39 @@ def get_all_combinations(client, bronze_tables):
         return []
 
 
+def build_sync_data_query(table_ref):
+    """Query de MAX(_etl_synced) y COUNT(*) de una tabla bronze."""
+    return f"""
+        SELECT 
+            MAX(_etl_synced) as max_sync,
+            COUNT(*) as row_count
+        FROM `{table_ref}`
+        WHERE _etl_synced IS NOT NULL
+    """
+
+
+def parse_sync_data(result):
+    """Convierte el resultado de build_sync_data_query al dict de get_sync_data."""
+    if result.empty or result.iloc[0]['max_sync'] is None:
+        return {'max_sync': None, 'row_count': 0}
+    
+    return {
+        'max_sync': result.iloc[0]['max_sync'],
+        'row_count': int(result.iloc[0]['row_count'])
+    }
+
+
+def sync_data_error(table_ref, e):
+    """Registra el error de una tabla y retorna el valor vacío de get_sync_data."""
+    # Si la tabla no existe, solo loguear y retornar None (no es un error crítico)
+    error_msg = str(e)
+    if "not found" in error_msg.lower() or "notfound" in error_msg.lower():
+        logger.debug(f"ℹ️  Tabla {table_ref} no existe en Bronze (puede ser normal)")
+    else:
+        logger.warning(f"⚠️ Error obteniendo sync data para {table_ref}: {error_msg}")
+    return {'max_sync': None, 'row_count': 0}
+
+
 def get_sync_data(client, company_project_id, table_name):
     """
     Obtiene MAX(_etl_synced) y COUNT(*) desde una tabla bronze específica.
@@ -174,87 +272,408 @@ def get_sync_data(client, company_project_id, table_name):
     """
     table_ref = f"{company_project_id}.bronze.{table_name}"
     
-    query = f"""
-        SELECT 
-            MAX(_etl_synced) as max_sync,
-            COUNT(*) as row_count
-        FROM `{table_ref}`
-        WHERE _etl_synced IS NOT NULL
+    try:
+        result = client.query(build_sync_data_query(table_ref)).to_dataframe()
+        return parse_sync_data(result)
+    except Exception as e:
+        return sync_data_error(table_ref, e)
+
+
+async def get_sync_data_async(runner, billing_project, company_project_id, table_name):
     """
+    Igual que get_sync_data, pero como job asíncrono de AsyncQueryRunner (sin hilo bloqueado).
+    
+    Args:
+        runner: AsyncQueryRunner
+        billing_project: Proyecto donde se crean los jobs
+        company_project_id: ID del proyecto de la compañía (clave del límite por proyecto)
+        table_name: Nombre de la tabla en bronze
+    """
+    table_ref = f"{company_project_id}.bronze.{table_name}"
     
     try:
-        result = client.query(query).to_dataframe()
-        if result.empty or result.iloc[0]['max_sync'] is None:
-            return {'max_sync': None, 'row_count': 0}
+        result = await runner.query(billing_project, build_sync_data_query(table_ref), limit_key=company_project_id)
+        return parse_sync_data(result)
+    except Exception as e:
+        return sync_data_error(table_ref, e)
+
+
+def scan_sync_data_async(client, combinations, max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+                         per_project_limit=DEFAULT_PER_PROJECT_CONCURRENCY):
+    """
+    Escanea varias combinaciones con jobs asíncronos (hasta max_in_flight en vuelo).
+    
+    Retorna:
+        dict: {(company_id, table_name): {'max_sync': ..., 'row_count': int}}
+    """
+    async def _main():
+        runner = AsyncQueryRunner(
+            lambda _project_id: client,
+            max_in_flight=max_in_flight,
+            per_project_limit=per_project_limit
+        )
+        try:
+            results = await asyncio.gather(*(
+                get_sync_data_async(runner, client.project, combo['company_project_id'], combo['table_name'])
+                for combo in combinations
+            ))
+        finally:
+            runner.close()
+        logger.info(
+            f"📊 Escaneo async: {runner.stats['submitted']} jobs, {runner.stats['poll_rounds']} rondas de polling "
+            f"({runner.stats['poll_calls']} llamadas)"
+        )
+        return results
+    
+    started = time.perf_counter()
+    results = asyncio.run(_main())
+    elapsed = time.perf_counter() - started
+    logger.info(f"📊 Escaneo: {len(combinations)} tablas en {elapsed:.1f}s ({len(combinations) / elapsed if elapsed > 0 else 0:.1f}/s)")
+    return {
+        (combo['company_id'], combo['table_name']): result
+        for combo, result in zip(combinations, results)
+    }
+
+
+def get_project_sync_metadata(client, company_project_id):
+    """
+    Obtiene last_modified_time y row_count de todas las tablas bronze de un proyecto
+    con una sola query de metadata (sin escanear datos).
+    
+    Args:
+        client: Cliente BigQuery
+        company_project_id: ID del proyecto de la compañía
         
-        return {
-            'max_sync': result.iloc[0]['max_sync'],
-            'row_count': int(result.iloc[0]['row_count'])
-        }
+    Retorna:
+        dict: {table_name: {'last_modified_time': Timestamp, 'row_count': int}} o None si falla
+    """
+    try:
+        return fetch_project_metadata(client, company_project_id)
     except Exception as e:
-        # Si la tabla no existe, solo loguear y retornar None (no es un error crítico)
-        error_msg = str(e)
-        if "not found" in error_msg.lower() or "notfound" in error_msg.lower():
-            logger.debug(f"ℹ️  Tabla {table_ref} no existe en Bronze (puede ser normal)")
-        else:
-            logger.warning(f"⚠️ Error obteniendo sync data para {table_ref}: {error_msg}")
-        return {'max_sync': None, 'row_count': 0}
+        logger.warning(f"⚠️ Error obteniendo metadata de {company_project_id}.bronze: {str(e)}")
+        return None
 
 
-def update_companies_consolidated(client, company_id, table_name, max_sync, row_count):
+class FanOutStats:
     """
-    Actualiza last_etl_synced y row_count en companies_consolidated.
+    Latencias por tarea y throughput de una ejecución concurrente.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.started_at = time.perf_counter()
+    
+    def record(self, seconds):
+        with self._lock:
+            self.latencies.append(seconds)
+    
+    def percentile(self, pct):
+        """Percentil por rango más cercano (0-100)."""
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        rank = max(1, math.ceil(pct / 100 * len(ordered)))
+        return ordered[rank - 1]
+    
+    def log_summary(self, label, items_processed):
+        elapsed = time.perf_counter() - self.started_at
+        throughput = items_processed / elapsed if elapsed > 0 else 0.0
+        logger.info(
+            f"⏱️ {label}: {len(self.latencies)} tareas, {items_processed} combinaciones en {elapsed:.1f}s "
+            f"({throughput:.1f} comb/s) | latencia p50={self.percentile(50):.2f}s "
+            f"p90={self.percentile(90):.2f}s p99={self.percentile(99):.2f}s max={self.percentile(100):.2f}s"
+        )
+
+
+def run_fan_out(tasks, worker, max_workers, per_project_limit, stats):
+    """
+    Ejecuta tareas en un ThreadPoolExecutor acotado con un tope de concurrencia por proyecto.
+    
+    Las tareas se intercalan por proyecto (round-robin) para que los hilos no
+    queden bloqueados esperando el semáforo de un mismo proyecto.
+    
+    Args:
+        tasks: Lista de tuplas (project_id, payload)
+        worker: Función worker(payload) -> resultado
+        max_workers: Máximo de tareas en vuelo en total
+        per_project_limit: Máximo de tareas en vuelo por proyecto
+        stats: FanOutStats donde registrar la latencia de cada tarea
+        
+    Retorna:
+        Lista de resultados (en orden de finalización)
+    """
+    tasks_by_project = {}
+    for project_id, payload in tasks:
+        tasks_by_project.setdefault(project_id, []).append(payload)
+    
+    semaphores = {
+        project_id: threading.BoundedSemaphore(per_project_limit)
+        for project_id in tasks_by_project
+    }
+    
+    interleaved = []
+    queues = list(tasks_by_project.items())
+    while queues:
+        remaining = []
+        for project_id, payloads in queues:
+            interleaved.append((project_id, payloads.pop(0)))
+            if payloads:
+                remaining.append((project_id, payloads))
+        queues = remaining
+    
+    def _run(project_id, payload):
+        with semaphores[project_id]:
+            start = time.perf_counter()
+            try:
+                return worker(payload)
+            finally:
+                stats.record(time.perf_counter() - start)
+    
+    results = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_run, project_id, payload) for project_id, payload in interleaved]
+        for future in concurrent.futures.as_completed(futures):
+            results.append(future.result())
+    return results
+
+
+def get_sync_data_by_project(client, combinations, freshness_mode=DEFAULT_SYNC_FRESHNESS_MODE,
+                             max_workers=DEFAULT_MAX_WORKERS,
+                             per_project_limit=DEFAULT_PER_PROJECT_CONCURRENCY,
+                             runner=DEFAULT_SYNC_RUNNER, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+    """
+    Obtiene los datos de sincronización de todas las combinaciones de forma concurrente.
+    
+    En modo "scan" (default) llama a get_sync_data para cada combinación.
+    En modo "metadata" agrupa por company_project_id y usa una sola query de
+    metadata por proyecto; las tablas sospechosas (vacías, sin metadata o sin
+    modificar en las últimas horas) se verifican con get_sync_data. Las demás
+    quedan con scanned=False: su max_sync/row_count no se conocen y solo
+    traen los valores de __TABLES__ (bronze_last_modified, bronze_row_count).
+    
+    Ambas fases corren en un pool acotado (max_workers) con un tope de queries
+    simultáneas por proyecto (per_project_limit). Con runner="async" la fase de
+    escaneo usa jobs asíncronos (hasta max_in_flight en vuelo) en lugar de hilos.
+    
+    Args:
+        client: Cliente BigQuery
+        combinations: Lista de dicts de get_all_combinations
+        freshness_mode: "metadata" o "scan"
+        max_workers: Máximo de queries en vuelo en total
+        per_project_limit: Máximo de queries en vuelo por proyecto
+        runner: "threads" o "async" (fase de escaneo)
+        max_in_flight: Máximo de jobs en vuelo con runner="async"
+        
+    Retorna:
+        dict: {(company_id, table_name): {'max_sync', 'row_count', 'scanned',
+               'bronze_last_modified', 'bronze_row_count'}} (los dos últimos solo en modo metadata)
+    """
+    sync_results = {}
+    metadata_by_key = {}
+    to_scan = combinations
+    
+    def _scan_worker(combo):
+        key = (combo['company_id'], combo['table_name'])
+        return key, get_sync_data(client, combo['company_project_id'], combo['table_name'])
+    
+    if freshness_mode == "metadata":
+        combos_by_project = {}
+        for combo in combinations:
+            combos_by_project.setdefault(combo['company_project_id'], []).append(combo)
+        
+        def _metadata_worker(company_project_id):
+            return company_project_id, get_project_sync_metadata(client, company_project_id)
+        
+        metadata_stats = FanOutStats()
+        metadata_results = run_fan_out(
+            [(project_id, project_id) for project_id in combos_by_project],
+            _metadata_worker, max_workers, per_project_limit, metadata_stats
+        )
+        metadata_stats.log_summary("Metadata", len(combinations))
+        
+        to_scan = []
+        for company_project_id, metadata in metadata_results:
+            for combo in combos_by_project[company_project_id]:
+                key = (combo['company_id'], combo['table_name'])
+                table_metadata = (metadata or {}).get(combo['table_name'])
+                if table_metadata is not None:
+                    metadata_by_key[key] = table_metadata
+                
+                if metadata is not None and table_metadata is None:
+                    # La tabla no existe en bronze (puede ser normal): mismo valor que daría el escaneo
+                    sync_results[key] = {'max_sync': None, 'row_count': 0}
+                elif table_metadata is None or is_suspicious(table_metadata):
+                    to_scan.append(combo)
+                else:
+                    sync_results[key] = {'max_sync': None, 'row_count': None, 'scanned': False}
+        
+        logger.info(f"📋 Metadata: {len(combos_by_project)} proyectos consultados, {len(to_scan)} tablas a verificar con escaneo")
+    
+    if to_scan and runner == "async":
+        sync_results.update(scan_sync_data_async(client, to_scan, max_in_flight, per_project_limit))
+    elif to_scan:
+        scan_stats = FanOutStats()
+        scan_results = run_fan_out(
+            [(combo['company_project_id'], combo) for combo in to_scan],
+            _scan_worker, max_workers, per_project_limit, scan_stats
+        )
+        scan_stats.log_summary("Escaneo", len(to_scan))
+        sync_results.update(scan_results)
+    
+    for key, table_metadata in metadata_by_key.items():
+        sync_results[key] = {
+            **sync_results[key],
+            'bronze_last_modified': table_metadata['last_modified_time'],
+            'bronze_row_count': table_metadata['row_count'],
+        }
+    return sync_results
+
+
+def ensure_metadata_columns(client, table_ref):
+    """Agrega a companies_consolidated las columnas del modo metadata que le falten."""
+    table = client.get_table(table_ref)
+    existing = {field.name for field in table.schema}
+    missing = [field for field in METADATA_COLUMNS if field.name not in existing]
+    if missing:
+        table.schema = list(table.schema) + missing
+        client.update_table(table, ["schema"])
+        logger.info(f"🆕 Columnas agregadas a {table_ref}: {', '.join(field.name for field in missing)}")
+
+
+def update_companies_consolidated(client, sync_rows, freshness_mode=DEFAULT_SYNC_FRESHNESS_MODE):
+    """
+    Actualiza last_etl_synced y row_count en companies_consolidated en un solo paso.
+    
+    1. Carga todas las filas en una tabla staging con un load job (Parquet vía pyarrow)
+    2. Ejecuta un único MERGE de la staging contra companies_consolidated
+    
+    last_etl_synced y row_count solo reciben valores del escaneo (MAX(_etl_synced) y
+    COUNT(*)). En modo metadata las filas no escaneadas los conservan y __TABLES__
+    se escribe en bronze_last_modified / bronze_row_count.
     
     Args:
         client: Cliente BigQuery
-        company_id: ID de la compañía
-        table_name: Nombre de la tabla
-        max_sync: Timestamp de última sincronización
-        row_count: Cantidad de filas
+        sync_rows: Lista de dicts con company_id, table_name, max_sync, row_count
+                   (y scanned, bronze_last_modified, bronze_row_count en modo metadata)
+        freshness_mode: Modo con el que se obtuvieron las filas
+        
+    Retorna:
+        int: Cantidad de filas actualizadas en companies_consolidated
     """
+    if not sync_rows:
+        logger.warning("⚠️ No hay datos de sincronización para actualizar")
+        return 0
+    
     table_ref = f"{CENTRAL_PROJECT}.{CENTRAL_DATASET}.{CONSOLIDATED_TABLE}"
+    staging_ref = f"{CENTRAL_PROJECT}.{CENTRAL_DATASET}.{STAGING_TABLE}"
     
-    # Construir query MERGE
-    if max_sync is None:
-        max_sync_sql = "NULL"
-    else:
-        max_sync_sql = f"TIMESTAMP('{max_sync.isoformat()}')"
+    # 1. Cargar resultados en staging (load job: no consume cuota de DML ni streaming)
+    df = pd.DataFrame(sync_rows, columns=[field.name for field in SCHEMA_STAGING])
+    df['company_id'] = df['company_id'].astype('int64')
+    df['table_name'] = df['table_name'].astype(str)
+    df['max_sync'] = pd.to_datetime(df['max_sync'], utc=True)
+    df['scanned'] = df['scanned'].fillna(True).astype(bool)
+    # Sin escaneo el row_count no se conoce (NULL); el MERGE conserva el valor anterior
+    df['row_count'] = df['row_count'].where(~df['scanned'], df['row_count'].fillna(0)).astype('Int64')
+    df['bronze_last_modified'] = pd.to_datetime(df['bronze_last_modified'], utc=True)
+    df['bronze_row_count'] = df['bronze_row_count'].astype('Int64')
     
+    load_config = bigquery.LoadJobConfig(
+        schema=SCHEMA_STAGING,
+        write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
+        source_format=bigquery.SourceFormat.PARQUET,
+    )
+    client.load_table_from_dataframe(df, staging_ref, job_config=load_config).result()
+    logger.info(f"📦 Cargadas {len(df)} filas en {staging_ref}")
+    
+    # 2. Un solo MERGE set-based
+    if freshness_mode == "metadata":
+        ensure_metadata_columns(client, table_ref)
+        set_clause = """
+                last_etl_synced = CASE WHEN sync_data.scanned THEN sync_data.max_sync ELSE cc.last_etl_synced END,
+                row_count = CASE WHEN sync_data.scanned THEN sync_data.row_count ELSE cc.row_count END,
+                bronze_last_modified = sync_data.bronze_last_modified,
+                bronze_row_count = sync_data.bronze_row_count,"""
+    else:
+        set_clause = """
+                last_etl_synced = sync_data.max_sync,
+                row_count = sync_data.row_count,"""
     query = f"""
         MERGE `{table_ref}` cc
-        USING (
-            SELECT 
-                {company_id} as company_id,
-                '{table_name}' as table_name,
-                {max_sync_sql} as max_sync,
-                {row_count} as row_count
-        ) sync_data
+        USING `{staging_ref}` sync_data
         ON cc.company_id = sync_data.company_id 
             AND cc.table_name = sync_data.table_name
         WHEN MATCHED THEN
-            UPDATE SET
-                last_etl_synced = sync_data.max_sync,
-                row_count = sync_data.row_count,
+            UPDATE SET{set_clause}
                 updated_at = CURRENT_TIMESTAMP()
     """
     
-    try:
-        client.query(query).result()
-        logger.info(f"✅ Actualizado: company_id={company_id}, table={table_name}")
-    except Exception as e:
-        logger.error(f"❌ Error actualizando {company_id}/{table_name}: {str(e)}")
+    query_job = client.query(query)
+    query_job.result()
+    updated = query_job.num_dml_affected_rows or 0
+    logger.info(f"✅ MERGE completado en {table_ref}: {updated} filas actualizadas")
+    return updated
+
+
+def parse_args(argv=None):
+    """
+    Argumentos de línea de comandos (con valores por defecto desde variables de entorno).
+    """
+    parser = argparse.ArgumentParser(
+        description="Actualiza last_etl_synced y row_count en companies_consolidated"
+    )
+    parser.add_argument(
+        "--freshness-mode",
+        choices=FRESHNESS_MODES,
+        default=DEFAULT_SYNC_FRESHNESS_MODE,
+        help="scan: MAX(_etl_synced)/COUNT(*) por tabla en last_etl_synced/row_count; metadata: una query a "
+             "__TABLES__ por proyecto (en bronze_last_modified/bronze_row_count) y escaneo solo de tablas "
+             "sospechosas (default: env FRESHNESS_MODE o scan)"
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=DEFAULT_MAX_WORKERS,
+        help="Máximo de queries concurrentes en total (default: env SYNC_MAX_WORKERS o 16)"
+    )
+    parser.add_argument(
+        "--per-project-concurrency",
+        type=int,
+        default=DEFAULT_PER_PROJECT_CONCURRENCY,
+        help="Máximo de queries concurrentes por company_project_id (default: env SYNC_PER_PROJECT_CONCURRENCY o 4)"
+    )
+    parser.add_argument(
+        "--runner",
+        choices=SYNC_RUNNERS,
+        default=DEFAULT_SYNC_RUNNER,
+        help="Ejecutor de la fase de escaneo: threads o async (default: env SYNC_RUNNER o threads)"
+    )
+    parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=DEFAULT_MAX_IN_FLIGHT,
+        help="Máximo de jobs en vuelo con --runner async (default: env SYNC_MAX_IN_FLIGHT o 200)"
+    )
+    return parser.parse_args(argv)
 
 
-def main():
+def main(argv=None):
     """
     Función principal que ejecuta el proceso completo.
     """
+    args = parse_args(argv)
+    
     logger.info("🚀 Iniciando actualización de companies_consolidated...")
+    logger.info(f"⚙️ Modo de frescura: {args.freshness_mode}")
+    logger.info(f"⚙️ Concurrencia: max_workers={args.max_workers}, por proyecto={args.per_project_concurrency}, "
+                f"escaneo={args.runner} (max_in_flight={args.max_in_flight})")
     
     # Crear cliente BigQuery
     # NOTA: Asegúrate de que la cuenta de servicio tenga permisos
     #       en todos los proyectos (pph-central y los company_project_id)
-    client = bigquery.Client(project=CENTRAL_PROJECT)
+    # Pool HTTP dimensionado al número de workers del fan-out
+    client = get_client_pool(pool_size=args.max_workers).get_client(CENTRAL_PROJECT)
     
     # Obtener las 11 tablas de Bronze desde metadata
     logger.info("📊 Obteniendo tablas de Bronze desde metadata...")
@@ -276,35 +695,43 @@ def main():
     
     logger.info(f"📋 Encontradas {len(combinations)} combinaciones para procesar")
     
-    total_updated = 0
-    total_errors = 0
+    # Obtener datos de sincronización (concurrente, agrupados por proyecto en modo metadata)
+    run_started = time.perf_counter()
+    sync_results = get_sync_data_by_project(
+        client,
+        combinations,
+        freshness_mode=args.freshness_mode,
+        max_workers=args.max_workers,
+        per_project_limit=args.per_project_concurrency,
+        runner=args.runner,
+        max_in_flight=args.max_in_flight
+    )
     
-    # Procesar cada combinación
+    # Reunir todos los resultados y escribirlos en un solo paso (load job + MERGE)
+    sync_rows = []
     for combo in combinations:
-        company_id = combo['company_id']
-        table_name = combo['table_name']
-        company_project_id = combo['company_project_id']
-        
-        logger.info(f"🔄 Procesando: company_id={company_id}, table={table_name}, project={company_project_id}")
-        
-        # Obtener datos de sincronización
-        sync_data = get_sync_data(client, company_project_id, table_name)
-        
-        # Actualizar companies_consolidated
-        try:
-            update_companies_consolidated(
-                client,
-                company_id,
-                table_name,
-                sync_data['max_sync'],
-                sync_data['row_count']
-            )
-            total_updated += 1
-        except Exception as e:
-            logger.error(f"❌ Error procesando {company_id}/{table_name}: {str(e)}")
-            total_errors += 1
-    
-    logger.info(f"✅ Proceso completado: {total_updated} actualizados, {total_errors} errores")
+        sync_data = sync_results[(combo['company_id'], combo['table_name'])]
+        sync_rows.append({
+            'company_id': combo['company_id'],
+            'table_name': combo['table_name'],
+            'max_sync': sync_data['max_sync'],
+            'row_count': sync_data['row_count'],
+            'scanned': sync_data.get('scanned', True),
+            'bronze_last_modified': sync_data.get('bronze_last_modified'),
+            'bronze_row_count': sync_data.get('bronze_row_count'),
+        })
+    
+    # Un error aquí afecta a toda la corrida: se propaga para que el Cloud Run Job falle y reintente
+    total_updated = update_companies_consolidated(client, sync_rows, args.freshness_mode)
+    
+    logger.info(f"✅ Proceso completado: {total_updated} actualizados de {len(sync_rows)} combinaciones")
+    elapsed = time.perf_counter() - run_started
+    logger.info(f"⏱️ Total: {len(sync_rows)} combinaciones en {elapsed:.1f}s ({len(sync_rows) / elapsed if elapsed > 0 else 0:.1f} comb/s)")
+    for fetch in get_fetch_stats().summary().itertuples(index=False):
+        logger.info(
+            f"📦 {fetch.label}: {fetch.calls} llamadas, {fetch.rows} filas, "
+            f"{fetch.bytes / 1024:.1f} KiB en {fetch.seconds:.2f}s (última vía {fetch.last_path})"
+        )
 
 
 if __name__ == "__main__":
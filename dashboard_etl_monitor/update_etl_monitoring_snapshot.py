@@ -0,0 +1,192 @@
+"""
+Script para agregar una corrida al snapshot del ETL (etl_monitoring_snapshot)
+
+Este script:
+1. Lee el estado actual de cada compañía × tabla desde companies_consolidated
+   (last_etl_synced, row_count; lo mantiene update_companies_consolidated_sync.py)
+   y traduce table_name al endpoint.name de metadata
+2. Opcionalmente agrega duración y estatus de la última ejecución desde una
+   tabla de log de corridas (--run-log-table)
+3. Agrega una fila por celda a etl_monitoring_snapshot (particionada por día,
+   clusterizada por company_id, endpoint_name), con last_* = actual_* de la
+   corrida anterior leída solo de la última partición (ver etl_snapshot.py)
+
+Ejecutar después de update_companies_consolidated_sync.py (mismo horario + unos minutos).
+"""
+
+from google.cloud import bigquery
+import argparse
+import logging
+import os
+import time
+
+from bq_client_pool import get_client_pool
+from bq_fetch import fetch_dataframe
+from etl_snapshot import (
+    append_snapshot,
+    ensure_snapshot_table,
+    snapshot_table_ref,
+    DEFAULT_LOOKBACK_DAYS,
+)
+
+# Configuración
+CENTRAL_PROJECT = "pph-central"
+CENTRAL_DATASET = "settings"
+CONSOLIDATED_TABLE = "companies_consolidated"
+METADATA_PROJECT = "pph-central"
+METADATA_DATASET = "management"
+METADATA_TABLE = "metadata_consolidated_tables"
+
+# Tabla opcional con el log de corridas del ETL (company_id, endpoint_name, duration, status, finished_at)
+DEFAULT_RUN_LOG_TABLE = os.environ.get("SNAPSHOT_RUN_LOG_TABLE", "")
+DEFAULT_RUN_LOG_HOURS = int(os.environ.get("SNAPSHOT_RUN_LOG_HOURS", "24"))
+
+# Expiración de particiones al crear la tabla (0 = sin expiración)
+DEFAULT_PARTITION_EXPIRATION_DAYS = int(os.environ.get("SNAPSHOT_PARTITION_EXPIRATION_DAYS", "0"))
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def build_run_results_query(run_log_table=None):
+    """
+    Query de los resultados de la corrida: una fila por compañía × endpoint.
+
+    Args:
+        run_log_table: Tabla project.dataset.table con el log de corridas (None = sin duración/estatus)
+    """
+    run_log_join = ""
+    run_log_columns = "CAST(NULL AS FLOAT64) AS actual_duration, CAST(NULL AS STRING) AS actual_status"
+    if run_log_table:
+        run_log_join = f"""
+        LEFT JOIN (
+            SELECT
+                REGEXP_REPLACE(TRIM(CAST(company_id AS STRING)), r'\\.0$', '') AS company_id,
+                LOWER(TRIM(endpoint_name)) AS endpoint_name,
+                duration,
+                status
+            FROM `{run_log_table}`
+            WHERE finished_at >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL @run_log_hours HOUR)
+            QUALIFY ROW_NUMBER() OVER (
+                PARTITION BY REGEXP_REPLACE(TRIM(CAST(company_id AS STRING)), r'\\.0$', ''), LOWER(TRIM(endpoint_name))
+                ORDER BY finished_at DESC
+            ) = 1
+        ) run_log
+            ON run_log.company_id = cells.company_id
+           AND run_log.endpoint_name = LOWER(TRIM(cells.endpoint_name))"""
+        run_log_columns = "CAST(run_log.duration AS FLOAT64) AS actual_duration, run_log.status AS actual_status"
+
+    return f"""
+        WITH endpoints AS (
+            SELECT table_name, ANY_VALUE(endpoint.name) AS endpoint_name
+            FROM `{METADATA_PROJECT}.{METADATA_DATASET}.{METADATA_TABLE}`
+            WHERE endpoint.name IS NOT NULL
+            GROUP BY table_name
+        ),
+        cells AS (
+            SELECT
+                REGEXP_REPLACE(TRIM(CAST(cc.company_id AS STRING)), r'\\.0$', '') AS company_id,
+                COALESCE(endpoints.endpoint_name, cc.table_name) AS endpoint_name,
+                cc.last_etl_synced AS max_sync,
+                cc.row_count AS actual_rows
+            FROM `{CENTRAL_PROJECT}.{CENTRAL_DATASET}.{CONSOLIDATED_TABLE}` cc
+            LEFT JOIN endpoints USING (table_name)
+            WHERE cc.table_name IS NOT NULL
+        )
+        SELECT
+            cells.company_id,
+            cells.endpoint_name,
+            cells.max_sync,
+            cells.actual_rows,
+            {run_log_columns}
+        FROM cells{run_log_join}
+    """
+
+
+def get_run_results(client, run_log_table=None, run_log_hours=DEFAULT_RUN_LOG_HOURS):
+    """
+    Obtiene los resultados de la corrida actual.
+
+    Retorna:
+        DataFrame con company_id, endpoint_name, max_sync, actual_rows, actual_duration, actual_status
+    """
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ScalarQueryParameter("run_log_hours", "INT64", run_log_hours)]
+    ) if run_log_table else None
+    df = fetch_dataframe(
+        client, build_run_results_query(run_log_table), job_config=job_config, label="get_run_results",
+        categories=['endpoint_name', 'actual_status'],
+        bqstorage_client=get_client_pool().get_bqstorage_client()
+    )
+    logger.info(f"📋 {len(df)} celdas compañía × endpoint en {CONSOLIDATED_TABLE}")
+    return df
+
+
+def parse_args(argv=None):
+    """
+    Argumentos de línea de comandos (con valores por defecto desde variables de entorno).
+    """
+    parser = argparse.ArgumentParser(
+        description="Agrega una corrida al snapshot del ETL (etl_monitoring_snapshot)"
+    )
+    parser.add_argument(
+        "--run-log-table",
+        default=DEFAULT_RUN_LOG_TABLE,
+        help="Tabla project.dataset.table con el log de corridas del ETL para actual_duration/actual_status "
+             "(default: env SNAPSHOT_RUN_LOG_TABLE; vacío = sin duración ni estatus)"
+    )
+    parser.add_argument(
+        "--run-log-hours",
+        type=int,
+        default=DEFAULT_RUN_LOG_HOURS,
+        help="Horas hacia atrás del log de corridas (default: env SNAPSHOT_RUN_LOG_HOURS o 24)"
+    )
+    parser.add_argument(
+        "--lookback-days",
+        type=int,
+        default=DEFAULT_LOOKBACK_DAYS,
+        help="Ventana para buscar la corrida anterior si no se puede leer la última partición (default: 30)"
+    )
+    parser.add_argument(
+        "--partition-expiration-days",
+        type=int,
+        default=DEFAULT_PARTITION_EXPIRATION_DAYS,
+        help="Expiración de particiones al crear la tabla; 0 = sin expiración "
+             "(default: env SNAPSHOT_PARTITION_EXPIRATION_DAYS o 0)"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Función principal que ejecuta el proceso completo.
+    """
+    args = parse_args(argv)
+
+    logger.info("🚀 Iniciando escritura del snapshot del ETL...")
+    run_started = time.perf_counter()
+
+    client = get_client_pool().get_client(CENTRAL_PROJECT)
+
+    # Crear la tabla particionada/clusterizada si aún no existe
+    ensure_snapshot_table(client, snapshot_table_ref(), args.partition_expiration_days or None)
+
+    results_df = get_run_results(client, args.run_log_table or None, args.run_log_hours)
+    if results_df.empty:
+        logger.error("❌ No se encontraron resultados para la corrida")
+        return
+
+    # Un error aquí afecta a toda la corrida: se propaga para que el Cloud Run Job falle y reintente
+    inserted = append_snapshot(client, results_df, lookback_days=args.lookback_days)
+
+    elapsed = time.perf_counter() - run_started
+    logger.info(f"✅ Proceso completado: {inserted} filas agregadas al snapshot en {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        logger.error(f"❌ Error fatal en el proceso: {str(e)}", exc_info=True)
+        raise  # Re-lanzar para que Cloud Run Job marque como fallido